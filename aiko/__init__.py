@@ -3,7 +3,7 @@
     aiko
     ~~~~~~
 
-    export Request, Response, ServerProtocol, Context, App, Application
+    export Request, Response, ServerProtocol, Context, App, Application, Router, HTTPError
 """
 
 __version__ = '0.2.3'
@@ -12,13 +12,16 @@ __all__ = [
     "App",
     "Application",
     "Context",
+    "HTTPError",
     "Request",
     "Response",
+    "Router",
     "ServerProtocol",
 ]
 
 from .application import App, Application
 from .context import Context
-from .request import Request
+from .request import HTTPError, Request
 from .response import Response
+from .router import Router
 from .server import ServerProtocol
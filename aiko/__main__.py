@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+命令行运行 Application
+    python -m aiko module:app --port 8080 --workers 4
+"""
+
+import argparse
+import importlib
+import logging
+import os
+import sys
+from typing import Any, List, Optional
+
+from .application import Application
+
+
+def load_app(target: str) -> Application:
+    """
+    导入 module:attr 指定的 Application，attr 默认为 app，
+    attr 不是 Application 时作为工厂函数调用
+    """
+    module_name, _, attr = target.partition(":")
+    # 和 python -m 一样可以导入当前目录的模块
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    module = importlib.import_module(module_name)
+    app = module
+    for name in (attr or "app").split("."):
+        app = getattr(app, name)
+    if not isinstance(app, Application) and callable(app):
+        app = app()
+    if not isinstance(app, Application):
+        raise TypeError("%s is not an aiko Application" % target)
+    return app
+
+
+def main(argv: Optional[List[str]] = None) -> Any:
+    parser = argparse.ArgumentParser(prog="python -m aiko", description="run an aiko application")
+    parser.add_argument("app", help="module:attr of the Application, attr defaults to app")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes, 0 uses the cpu count",
+    )
+    parser.add_argument(
+        "--reuse-port",
+        dest="reuse_port",
+        action="store_true",
+        default=None,
+        help="bind every worker with SO_REUSEPORT (default when supported)",
+    )
+    parser.add_argument(
+        "--no-reuse-port",
+        dest="reuse_port",
+        action="store_false",
+        help="bind once in the master and share the socket",
+    )
+    parser.add_argument("--cpu-affinity", action="store_true", help="pin each worker to one cpu")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="[%(process)d] %(message)s")
+    app = load_app(args.app)
+    app.run(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        reuse_port=args.reuse_port,
+        cpu_affinity=args.cpu_affinity,
+    )
+
+
+if __name__ == "__main__":
+    main()
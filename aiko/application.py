@@ -1,36 +1,41 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
+import signal
 # from datetime import datetime
 from asyncio.base_events import Server
-from collections import Generator
-from signal import (
-    SIGINT,
-    SIGTERM,
-)
 from ssl import SSLContext
 from typing import (
     Any,
-    AsyncIterable,
-    Callable,
     cast,
     Generator as TypeGenerator,
-    Iterator,
     List,
     Optional,
     Type,
-    Union,
 )
 
 
+from .compose import (
+    compose,
+    DISPATCH_TYPE,
+    MIDDLEWARE_TYPE,
+)
 from .context import Context
-from .request import Request
-from .response import Response
-from .server import ServerProtocol
+from .encoder import JSONEncoder
+from .request import HTTPError, Request
+from .response import Response, STATUS_CODES
+from .server import ServerProtocol, ServerState
+from .timer import TimerWheel
 from .utils import (
+    DEFAULT_BODY_TIMEOUT,
+    DEFAULT_HEADER_TIMEOUT,
+    DEFAULT_JSON_EXECUTOR_THRESHOLD,
+    DEFAULT_KEEP_ALIVE_TIMEOUT,
+    DEFAULT_MAX_BODY_SIZE,
+    DEFAULT_READ_HIGH_WATER,
     DEFAULT_REQUEST_CODING,
     DEFAULT_RESPONSE_CODING,
-    handle_async_gen,
+    DEFAULT_WRITE_HIGH_WATER,
 )
 
 __all__ = [
@@ -38,22 +43,6 @@ __all__ = [
     "App",
 ]
 
-NEXT_CALL_RES_TYPE = TypeGenerator[Any, None, None]
-NEXT_CALL_TYPE = Callable[[], NEXT_CALL_RES_TYPE]
-MIDDLEWARE_RES_TYPE = Union[
-    bytes,
-    str,
-    None,
-]
-MIDDLEWARE_TYPE = Callable[
-    [Context, NEXT_CALL_TYPE],
-    Union[
-        MIDDLEWARE_RES_TYPE,
-        TypeGenerator[Any, None, MIDDLEWARE_RES_TYPE],
-        AsyncIterable[MIDDLEWARE_RES_TYPE],
-    ],
-]
-
 
 class Application(object):
     """Application
@@ -69,6 +58,26 @@ class Application(object):
     :param request: Request class
     :param response: Response class
     :param context: Context class
+    :param read_high_water: 每个连接未读取 request body 的上限，超过暂停读取
+    :param write_high_water: 每个连接写缓冲区的上限，超过后 drain 需要等待
+    :param keep_alive_timeout: 长连接空闲超时(秒)，None 不超时
+    :param header_timeout: 接收 request header 超时(秒)，None 不超时
+    :param body_timeout: 接收 request body 时两块数据之间的超时(秒)，None 不超时
+    :param max_requests: 每个连接最多处理的 request 数，0 不限制
+    :param max_url_size: url 的最大长度，超过返回 414，0 不限制
+    :param max_header_fields: header 的最大数量，超过返回 431，0 不限制
+    :param max_header_field_size: 单个 header 的最大长度，超过返回 431，0 不限制
+    :param max_connections: 每个 worker 最多的连接数，超过返回 503，0 不限制
+    :param max_concurrency: 每个 worker 最多同时处理的 request 数，超过返回 503，0 不限制
+    :param retry_after: 返回 503 时的 Retry-After(秒)
+    :param server_name: 默认的 Server header，None 不发送
+    :param reuse_requests: 长连接上复用 request, response, context 对象，
+        开启后不能在 request 结束后继续使用 ctx
+    :param pool_size: 每个 worker 缓存给新连接复用的 request 数，0 不缓存
+    :param json_encoder: list, dict body 的 json 编码器，None 使用默认的 JSONEncoder
+    :param graceful_timeout: 关闭时等待处理中的 request 完成的秒数，None 一直等待
+    :param max_body_size: request.form(), request.json() 最多读取的 body 长度，超过返回 413，0 不限制
+    :param json_executor_threshold: request.json() 的 body 达到该长度时在线程池中解析，0 不使用线程池
     """
 
     __slots__ = [
@@ -78,8 +87,31 @@ class Application(object):
         "_response",
         "_context",
         "_middleware",
+        "_dispatch",
         "requset_charset",
         "response_charset",
+        "read_high_water",
+        "write_high_water",
+        "keep_alive_timeout",
+        "header_timeout",
+        "body_timeout",
+        "max_requests",
+        "max_url_size",
+        "max_header_fields",
+        "max_header_field_size",
+        "max_connections",
+        "max_concurrency",
+        "retry_after",
+        "server_name",
+        "reuse_requests",
+        "pool_size",
+        "json_encoder",
+        "graceful_timeout",
+        "max_body_size",
+        "json_executor_threshold",
+        "_timer",
+        "_state",
+        "_servers",
         "proxy",
     ]
 
@@ -92,6 +124,25 @@ class Application(object):
             context: Type[Context] = Context,
             requset_charset: str = DEFAULT_REQUEST_CODING,
             response_charset: str = DEFAULT_RESPONSE_CODING,
+            read_high_water: int = DEFAULT_READ_HIGH_WATER,
+            write_high_water: int = DEFAULT_WRITE_HIGH_WATER,
+            keep_alive_timeout: Optional[float] = DEFAULT_KEEP_ALIVE_TIMEOUT,
+            header_timeout: Optional[float] = DEFAULT_HEADER_TIMEOUT,
+            body_timeout: Optional[float] = DEFAULT_BODY_TIMEOUT,
+            max_requests: int = 0,
+            max_url_size: int = 0,
+            max_header_fields: int = 0,
+            max_header_field_size: int = 0,
+            max_connections: int = 0,
+            max_concurrency: int = 0,
+            retry_after: int = 1,
+            server_name: Optional[str] = None,
+            reuse_requests: bool = True,
+            pool_size: int = 0,
+            json_encoder: Optional[JSONEncoder] = None,
+            graceful_timeout: Optional[float] = 30.0,
+            max_body_size: int = DEFAULT_MAX_BODY_SIZE,
+            json_executor_threshold: int = DEFAULT_JSON_EXECUTOR_THRESHOLD,
     ) -> None:
         self._loop = loop
         self._protocol = protocol
@@ -100,7 +151,34 @@ class Application(object):
         self._context = context
         self.requset_charset = requset_charset
         self.response_charset = response_charset
+        self.read_high_water = read_high_water
+        self.write_high_water = write_high_water
+        self.keep_alive_timeout = keep_alive_timeout
+        self.header_timeout = header_timeout
+        self.body_timeout = body_timeout
+        self.max_requests = max_requests
+        self.max_url_size = max_url_size
+        self.max_header_fields = max_header_fields
+        self.max_header_field_size = max_header_field_size
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.retry_after = retry_after
+        self.server_name = server_name
+        self.reuse_requests = reuse_requests
+        self.pool_size = pool_size
+        self.json_encoder = json_encoder or JSONEncoder()
+        self.graceful_timeout = graceful_timeout
+        self.max_body_size = max_body_size
+        self.json_executor_threshold = json_executor_threshold
+        # 所有连接共用的超时定时器
+        self._timer = cast(Optional[TimerWheel], None)
+        # 所有连接共享的状态
+        self._state = cast(Optional[ServerState], None)
+        # listen 创建的 Server，关闭时停止 accept
+        self._servers = cast(List[Server], [])
         self._middleware = cast(List[MIDDLEWARE_TYPE], [])
+        # 编译好的中间件调用链
+        self._dispatch = cast(Optional[DISPATCH_TYPE], None)
         self.proxy = False
 
     @property
@@ -124,41 +202,147 @@ class Application(object):
         """
         return self._response
 
+    @property
+    def state(self) -> Optional[ServerState]:
+        """
+        listen 后所有连接共享的状态
+        """
+        return self._state
+
     @asyncio.coroutine
     def listen(self, **kwargs: Any) -> Server:
         """
         bind host, port or sock
         """
         loop = cast(asyncio.AbstractEventLoop, self._loop)
-        return (yield from loop.create_server(
+        if self._timer is None:
+            self._timer = TimerWheel(loop)
+        if self._state is None:
+            self._state = ServerState(
+                max_connections=self.max_connections,
+                max_concurrency=self.max_concurrency,
+                retry_after=self.retry_after,
+                server_name=self.server_name,
+                pool_size=self.pool_size if self.reuse_requests else 0,
+            )
+            self._state.start(loop)
+        timer = self._timer
+        state = self._state
+        server = yield from loop.create_server(
             lambda: self._protocol(
                 loop=loop,
                 handle=self._handle,
                 requset_charset=self.requset_charset,
                 response_charset=self.response_charset,
+                read_high_water=self.read_high_water,
+                write_high_water=self.write_high_water,
+                timer=timer,
+                keep_alive_timeout=self.keep_alive_timeout,
+                header_timeout=self.header_timeout,
+                body_timeout=self.body_timeout,
+                max_requests=self.max_requests,
+                max_url_size=self.max_url_size,
+                max_header_fields=self.max_header_fields,
+                max_header_field_size=self.max_header_field_size,
+                state=state,
+                request_class=self._request,
+                response_class=self._response,
+                reuse=self.reuse_requests,
             ),
             **kwargs,
-        ))
+        )
+        self._servers.append(server)
+        return server
 
-    def run(self, host: str = "0.0.0.0", port: int = 5000) -> None:
+    @asyncio.coroutine
+    def shutdown(self, timeout: Optional[float] = None) -> TypeGenerator[Any, None, bool]:
+        """
+        优雅关闭: 停止 accept，关闭空闲的连接，
+        处理中的连接在 response 写完后关闭，最多等待 timeout 秒(默认 graceful_timeout)。
+        全部正常关闭返回 True
+        """
+        loop = cast(asyncio.AbstractEventLoop, self._loop)
+        servers = self._servers
+        self._servers = []
+        for server in servers:
+            server.close()
+        drained = True
+        state = self._state
+        if state is not None:
+            if timeout is None:
+                timeout = self.graceful_timeout
+            drained = yield from state.shutdown(loop, timeout)
+            state.close()
+            self._state = None
+        for server in servers:
+            yield from server.wait_closed()
+        if self._timer is not None:
+            self._timer.close()
+            self._timer = None
+        return drained
+
+    def run(
+            self,
+            host: str = "0.0.0.0",
+            port: int = 5000,
+            workers: int = 1,
+            reuse_port: Optional[bool] = None,
+            cpu_affinity: bool = False,
+    ) -> None:
         """
         debug run
         :param host: the hostname to listen on, default is ``'0.0.0.0'``
         :param port: the port of the server, default id ``5000``
+        :param workers: worker 进程数，大于 1 或者为 0(cpu 数) 时使用 prefork 多进程
+        :param reuse_port: 多进程时每个 worker 使用 SO_REUSEPORT 各自 bind，None 在支持时使用
+        :param cpu_affinity: 多进程时每个 worker 绑定到一个 cpu
+        """
+        if workers != 1:
+            # prefork 依赖 fork 和 posix 信号，只在多进程时导入
+            from .prefork import Arbiter
+            Arbiter(
+                self,
+                host=host,
+                port=port,
+                workers=workers,
+                reuse_port=reuse_port,
+                cpu_affinity=cpu_affinity,
+            ).run()
+            return
+        self.serve(host=host, port=port)
+
+    def serve(self, loop: Optional[asyncio.AbstractEventLoop] = None, **kwargs: Any) -> None:
         """
+        在当前进程运行直到收到 SIGTERM, SIGINT, SIGQUIT，kwargs 传给 listen
+        """
+        if loop is not None:
+            self._loop = loop
+        elif self._loop is None:
+            self._loop = asyncio.get_event_loop()
         loop = cast(asyncio.AbstractEventLoop, self._loop)
-        listen = self.listen(host=host, port=port)
-        server = loop.run_until_complete(listen)
+        listen = self.listen(**kwargs)
+        loop.run_until_complete(listen)
+        closing = cast(List[asyncio.Future], [])
 
-        def close() -> None:
+        def close(sig: int) -> None:
             """
-            关闭回调
+            关闭回调，第一次收到信号时等待处理中的 request，
+            再次收到 SIGINT(Ctrl-C) 时直接退出，重复的 SIGTERM 不影响等待
             """
-            server.close()
-            loop.stop()
-        # print(type(server))
-        loop.add_signal_handler(SIGTERM, close)
-        loop.add_signal_handler(SIGINT, close)
+            if closing:
+                if sig != signal.SIGTERM:
+                    loop.stop()
+                return
+            task = asyncio.ensure_future(self.shutdown(), loop=loop)
+            task.add_done_callback(lambda _: loop.stop())
+            closing.append(task)
+        loop.add_signal_handler(signal.SIGTERM, close, signal.SIGTERM)
+        if signal.getsignal(signal.SIGINT) is not signal.SIG_IGN:
+            # prefork 的 worker 忽略 SIGINT，由 master 通知退出
+            loop.add_signal_handler(signal.SIGINT, close, signal.SIGINT)
+        if hasattr(signal, "SIGQUIT"):
+            # 不等待处理中的 request，直接退出
+            loop.add_signal_handler(signal.SIGQUIT, loop.stop)
         loop.run_forever()
 
     @asyncio.coroutine
@@ -178,117 +362,59 @@ class Application(object):
             ssl=ssl,
         ))
 
-    def _next_middleware(
-            self,
-            middlewares: Iterator[MIDDLEWARE_TYPE],
-            ctx: Context,
-    ) -> NEXT_CALL_TYPE:
-        """
-        生成 next_call 的调用
-        使用迭代器，这个方法每调用一次都会指向下一个中间件。
-        """
-        @asyncio.coroutine
-        def next_call() -> NEXT_CALL_RES_TYPE:
-            """
-            调用下一个中间件
-            """
-            yield from self._middleware_call(middlewares, ctx, next_call)
-        return next_call
-
-    @asyncio.coroutine
-    def _middleware_call(
-            self,
-            middlewares: Iterator[MIDDLEWARE_TYPE],
-            ctx: Context,
-            next_call: NEXT_CALL_TYPE,
-    ) -> TypeGenerator[Any, None, None]:
-        """
-        从迭代器中取出一个中间件，执行
-        """
-        middleware = None
-        try:
-            middleware = next(middlewares)
-        except StopIteration:
-            return
-        # next_call = self._next_middleware(middlewares, ctx)
-        if asyncio.iscoroutinefunction(middleware):
-            temp = cast(Any, middleware(ctx, next_call))
-            body = yield from temp
-        else:
-            body = middleware(ctx, next_call)
-        if body is not None:
-            if isinstance(body, Generator):
-                gen_obj = body
-                body = None
-                # 处理同步方法使用 yield 来调用异步
-                while True:
-                    try:
-                        gen = next(gen_obj)
-                        temp = yield from handle_async_gen(gen, gen_obj)
-                    except StopIteration:
-                        break
-                    if temp is not None:
-                        body = temp
-            # elif asyncio.iscoroutine(body):
-            #     # 处理中间件返回了一个 coroutine 对象需要 await
-            #     try:
-            #         body = yield from body
-            #     except Exception:
-            #         pass
-            if isinstance(body, tuple):
-                flag = True
-                for item in body:
-                    if flag:
-                        ctx.response.body = item
-                        flag = False
-                    elif isinstance(item, int):
-                        ctx.response.status = item
-                    elif isinstance(item, dict):
-                        ctx.response.headers.update(item)
-            # 中间件返回的结果如果不为空设置到 body
-            elif body is not None:
-                ctx.response.body = body
-
-    @asyncio.coroutine
-    def _handle(self, request: Request, response: Response) -> TypeGenerator[Any, None, None]:
+    async def _handle(self, request: Request, response: Response) -> None:
         """
         request 解析后的回调，调用中间件，并处理 headers, body 发送。
         """
         # request.start_time = datetime.now().timestamp()
-        # 创建一个新的会话上下文
-        ctx = self._context(
-            cast(asyncio.AbstractEventLoop, self._loop),
-            request,
-            response,
-            self,
-        )
-        request.app = self
-        response.app = self
-        request.ctx = ctx
-        response.ctx = ctx
-        request.response = response
-        response.request = request
+        ctx = request.ctx
+        if ctx is not None and ctx.response is response:
+            # 复用的 request, response 已经关联好了
+            ctx.reset()
+        else:
+            # 创建一个新的会话上下文
+            ctx = self._context(
+                cast(asyncio.AbstractEventLoop, self._loop),
+                request,
+                response,
+                self,
+            )
+            request.app = self
+            response.app = self
+            request.ctx = ctx
+            response.ctx = ctx
+            request.response = response
+            response.request = request
 
-        # 把当前注册的中间件转为迭代器
-        middleware_iter = iter(self._middleware)
-        # 通过迭代器的模式生成一个执行下一个中间的调用方法
-        next_call = self._next_middleware(middleware_iter, ctx)
+        dispatch = self._dispatch
+        if dispatch is None:
+            # 中间件有变化时重新编译调用链
+            dispatch = self._dispatch = compose(self._middleware)
         # 顺序执行中间件
-        yield from self._middleware_call(middleware_iter, ctx, next_call)
+        try:
+            await dispatch(ctx, None)
+        except HTTPError as error:
+            if ctx.response.headers_sent:
+                raise
+            response = ctx.response
+            response.status = error.status
+            response.body = STATUS_CODES.get(error.status, b"")
+            if not request.body_complete:
+                # 剩下的 body 没有读取，不能继续使用这个连接
+                response.set("Connection", "close")
         # 设置 cookies
         cookies_headers = ctx.cookies.headers()
         if cookies_headers is not None:
             ctx.response.set("Set-Cookie", cookies_headers)
-        # 写出 headers
-        ctx.response.flush_headers()
-        # 写出 body
-        ctx.response.flush_body()
+        # 写出 headers, body
+        await ctx.response.flush()
 
     def use(self, middleware: MIDDLEWARE_TYPE) -> None:
         """
         插入一个中间件
         """
         self._middleware.append(middleware)
+        self._dispatch = None
 
     def __call__(self) -> 'Application':
         """
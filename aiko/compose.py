@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+把中间件编译为一条 async 调用链，类似 koa-compose
+"""
+
+import asyncio
+from functools import partial
+from inspect import isawaitable, isgeneratorfunction
+from types import GeneratorType
+from typing import (
+    Any,
+    AsyncIterable,
+    Awaitable,
+    Callable,
+    cast,
+    Generator,
+    List,
+    Optional,
+    Union,
+)
+
+__all__ = [
+    "compose",
+    "rebind",
+    "DISPATCH_TYPE",
+    "MIDDLEWARE_TYPE",
+    "NEXT_CALL_TYPE",
+]
+
+NEXT_CALL_TYPE = Callable[[], Awaitable[None]]
+MIDDLEWARE_RES_TYPE = Union[
+    bytes,
+    str,
+    None,
+]
+MIDDLEWARE_TYPE = Callable[
+    [Any, NEXT_CALL_TYPE],
+    Union[
+        MIDDLEWARE_RES_TYPE,
+        Generator[Any, None, MIDDLEWARE_RES_TYPE],
+        AsyncIterable[MIDDLEWARE_RES_TYPE],
+        Awaitable[MIDDLEWARE_RES_TYPE],
+    ],
+]
+# dispatch(ctx, last)，last 为调用链结束后调用的 next_call
+DISPATCH_TYPE = Callable[[Any, Optional[NEXT_CALL_TYPE]], Awaitable[None]]
+
+
+def set_body(ctx: Any, body: Any) -> None:
+    """
+    中间件返回的结果设置到 response,
+    tuple 为 (body, status, headers)，status, headers 可以省略或调换顺序
+    """
+    response = ctx.response
+    if isinstance(body, tuple):
+        flag = True
+        for item in body:
+            if flag:
+                response.body = item
+                flag = False
+            elif isinstance(item, int):
+                response.status = item
+            elif isinstance(item, dict):
+                response.headers.update(item)
+    else:
+        response.body = body
+
+
+async def drive_generator(gen: Any) -> Any:
+    """
+    执行同步生成器中间件，yield 出的 awaitable 会被等待并把结果 send 回去，
+    其它非空的值作为 body
+    """
+    body = None
+    value = None
+    error = None
+    while True:
+        try:
+            if error is not None:
+                item = gen.throw(error)
+            else:
+                item = gen.send(value)
+        except StopIteration as stop:
+            if stop.value is not None:
+                body = stop.value
+            break
+        value = error = None
+        if item is None:
+            continue
+        if isawaitable(item):
+            try:
+                value = await item
+            except Exception as exc:
+                error = exc
+        else:
+            body = item
+    return body
+
+
+async def end(ctx: Any, last: Optional[NEXT_CALL_TYPE]) -> None:
+    """
+    调用链的末尾
+    """
+    if last is not None:
+        await last()
+
+
+def is_async_middleware(middleware: Any) -> bool:
+    """
+    async def, @asyncio.coroutine 或者 __call__ 为 async 的对象
+    """
+    if asyncio.iscoroutinefunction(middleware):
+        return True
+    call = getattr(middleware, "__call__", None)
+    return call is not None and asyncio.iscoroutinefunction(call)
+
+
+def compile_middleware(middleware: MIDDLEWARE_TYPE, next_step: DISPATCH_TYPE) -> DISPATCH_TYPE:
+    """
+    根据中间件的类型生成一个调用步骤，next_call 绑定到 next_step
+    """
+    if is_async_middleware(middleware):
+        async def async_step(ctx: Any, last: Optional[NEXT_CALL_TYPE]) -> None:
+            """
+            async 中间件
+            """
+            body = await middleware(ctx, partial(next_step, ctx, last))  # type: ignore
+            if body is not None:
+                set_body(ctx, body)
+        return async_step
+    if isgeneratorfunction(middleware):
+        async def generator_step(ctx: Any, last: Optional[NEXT_CALL_TYPE]) -> None:
+            """
+            使用 yield 调用异步的同步生成器中间件
+            """
+            body = await drive_generator(middleware(ctx, partial(next_step, ctx, last)))
+            if body is not None:
+                set_body(ctx, body)
+        return generator_step
+
+    async def sync_step(ctx: Any, last: Optional[NEXT_CALL_TYPE]) -> None:
+        """
+        普通函数中间件，可能返回生成器或者 awaitable
+        """
+        body = middleware(ctx, partial(next_step, ctx, last))
+        if body is None:
+            return
+        if isawaitable(body):
+            body = await body
+        elif isinstance(body, GeneratorType):
+            body = await drive_generator(body)
+        if body is not None:
+            set_body(ctx, body)
+    return sync_step
+
+
+def compose(middlewares: List[MIDDLEWARE_TYPE]) -> DISPATCH_TYPE:
+    """
+    把中间件从后往前编译为一条调用链，返回第一个调用步骤
+    """
+    dispatch = cast(DISPATCH_TYPE, end)
+    for middleware in reversed(middlewares):
+        dispatch = compile_middleware(middleware, dispatch)
+    return dispatch
+
+
+def rebind(next_call: NEXT_CALL_TYPE, ctx: Any) -> NEXT_CALL_TYPE:
+    """
+    把 next_call 绑定到另一个 ctx，用于在后台重新执行后面的中间件
+    """
+    call = cast(partial, next_call)
+    return partial(call.func, ctx, *call.args[1:])
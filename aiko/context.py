@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
-from typing import Any, List, Optional
+from typing import Any, cast, Dict, List, Optional
 # from weakref import proxy
 
 from .request import Request
@@ -15,6 +15,15 @@ __all__ = [
 
 
 class Context(object):
+    __slots__ = [
+        "_loop",
+        "_request",
+        "_response",
+        "_cookies",
+        "_app",
+        "state",
+    ]
+
     def __init__(
             self,
             loop: asyncio.AbstractEventLoop,
@@ -27,6 +36,14 @@ class Context(object):
         self._response = response
         self._cookies = ContextCookie(self)
         self._app = app
+        # 中间件之间传递数据，Context 不能再设置任意属性
+        self.state = cast(Dict[str, Any], {})
+
+    def reset(self) -> None:
+        """
+        复用 request, response 时清空这次请求的状态
+        """
+        self.state = {}
 
     @property
     def app(self) -> Any:
@@ -52,22 +69,18 @@ class Context(object):
     def cookies(self) -> 'ContextCookie':
         return self._cookies
 
-    def __del__(self) -> None:
-        del self._cookies
-        del self._request
-        del self._response
-        del self._loop
-
 
 ProxyAttr(Context, '_response')\
     .method('set')\
     .method('flush_headers')\
+    .method('drain')\
     .access('status')\
     .access('message')\
     .access('body')\
     .access('length')\
     .access('type')\
-    .getter('header_sent')
+    .getter('headers_sent')\
+    .getter('headers_sent', 'header_sent')
 
 ProxyAttr(Context, '_request')\
     .method('get')\
@@ -76,6 +89,7 @@ ProxyAttr(Context, '_request')\
     .access('method')\
     .access('query')\
     .access('path')\
+    .access('params')\
     .access('url')\
     .getter('origin')\
     .getter('href')\
@@ -99,9 +113,16 @@ class ContextCookie(dict):
     """
     def __init__(self, ctx: Context) -> None:
         # self._ctx = proxy(ctx)
-        self._req_cookies = ctx.request.cookies
+        self._request = ctx.request
         self._res_cookies = ctx.response.cookies
 
+    @property
+    def _req_cookies(self) -> Any:
+        """
+        request 的 cookie 在第一次读取时才解析
+        """
+        return self._request.cookies
+
     def __delitem__(self, key: str) -> None:
         """
         设置删除 cookie 到 res
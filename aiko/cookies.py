@@ -1,5 +1,8 @@
-from http.cookies import BaseCookie
-from typing import Any, cast, List, Optional
+from http.cookies import BaseCookie, CookieError, Morsel
+from typing import Any, cast, List, Optional, Union
+
+# request 的 Cookie 中出现这些 key 时交给 BaseCookie.load 处理
+RESERVED_KEYS = frozenset(Morsel._reserved)  # type: ignore
 
 
 class Cookies(BaseCookie):
@@ -55,6 +58,35 @@ class Cookies(BaseCookie):
         """
         return super().__len__()
 
+    def parse(self, raw: Union[str, List[str]]) -> None:
+        """
+        解析 request 的 Cookie header，常见的 `k=v; k2=v2` 不使用正则，
+        带引号或者保留字的 cookie 交给 BaseCookie.load
+        """
+        if isinstance(raw, list):
+            raw = "; ".join(raw)
+        if '"' in raw or "\\" in raw:
+            self.load(raw)
+            return
+        pairs = []
+        for item in raw.split(";"):
+            key, sep, value = item.partition("=")
+            key = key.strip()
+            if not key or key[0] == "$":
+                continue
+            if key.lower() in RESERVED_KEYS:
+                self.load(raw)
+                return
+            pairs.append((key, value.strip()))
+        for key, value in pairs:
+            morsel = Morsel()  # type: Morsel[str]
+            try:
+                morsel.set(key, value, value)
+            except CookieError:
+                continue
+            # 跳过 BaseCookie.__setitem__ 的 value_encode
+            dict.__setitem__(self, key, morsel)
+
     def headers(self) -> Optional[List[str]]:
         """
         生成 headers
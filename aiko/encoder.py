@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+response body 的 json 编码，安装了 orjson 时默认使用 orjson
+"""
+
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
+from functools import partial
+from typing import Any, Callable, cast, Dict, Iterator, List, Optional, Type
+from uuid import UUID
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+from .utils import encode_str
+
+__all__ = [
+    "JSONEncoder",
+    "json_loads",
+]
+
+UTF8_NAMES = frozenset(("utf-8", "utf8"))
+
+DEFAULT_TYPES = cast(Dict[Type[Any], Callable[[Any], Any]], {
+    datetime: lambda obj: obj.isoformat(),
+    date: lambda obj: obj.isoformat(),
+    time: lambda obj: obj.isoformat(),
+    Decimal: str,
+    UUID: str,
+    set: list,
+    frozenset: list,
+})
+# orjson 原生编码，没有 passthrough 选项的类型，注册后改用标准库 json
+ORJSON_NATIVE_TYPES = (UUID, Enum)
+
+
+def json_loads(data: bytes, charset: Optional[str] = None) -> Any:
+    """
+    解析 json body，安装了 orjson 时使用 orjson
+    """
+    if charset and charset.lower().replace("_", "-") not in UTF8_NAMES:
+        data = cast(Any, data.decode(charset))
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class JSONEncoder(object):
+    """
+    可替换的 json 编码器
+    :param dumps: 把对象编码为 bytes 或 str 的函数，接收 default 参数，
+        None 时优先使用 orjson，没有安装使用标准库 json。
+        orjson 不支持的对象(如超过 64 位的整数)使用标准库 json 编码
+    :param stream_threshold: list 长度达到该值时分块编码，0 不分块
+    :param chunk_items: 分块编码时每块的元素数
+    """
+    __slots__ = [
+        "_dumps",
+        "_fallback",
+        "_option",
+        "_types",
+        "_separator",
+        "stream_threshold",
+        "chunk_items",
+    ]
+
+    def __init__(
+            self,
+            dumps: Optional[Callable[..., Any]] = None,
+            stream_threshold: int = 1000,
+            chunk_items: int = 256,
+    ) -> None:
+        self._types = dict(DEFAULT_TYPES)
+        self._separator = b", "
+        # 复用同一个 encoder，不需要每次都像 json.dumps 一样创建
+        encode = cast(Callable[[Any], Any], json.JSONEncoder(
+            ensure_ascii=False,
+            default=self.default,
+        ).encode)
+        self._fallback = cast(Optional[Callable[[Any], Any]], None)
+        # 使用 orjson 时的 option，None 不使用 orjson
+        self._option = cast(Optional[int], None)
+        if dumps is None and orjson is not None:
+            # 与标准库一样支持非 str 的 dict key
+            self._option = getattr(orjson, "OPT_NON_STR_KEYS", 0)
+            dumps = partial(orjson.dumps, option=self._option)
+            self._separator = b","
+            self._fallback = encode
+        if dumps is not None:
+            encode = partial(dumps, default=self.default)
+        self._dumps = cast(Callable[[Any], Any], encode)
+        self.stream_threshold = stream_threshold
+        self.chunk_items = chunk_items
+
+    def register(self, type_: Type[Any], func: Callable[[Any], Any]) -> None:
+        """
+        注册自定义类型的转换函数，返回值需要可以被 json 编码。
+        orjson 原生支持的类型不会调用 default，需要让 orjson 跳过这些类型
+        """
+        self._types[type_] = func
+        option = self._option
+        if option is None:
+            return
+        if issubclass(type_, (date, time)):
+            flag = getattr(orjson, "OPT_PASSTHROUGH_DATETIME", 0)
+        elif hasattr(type_, "__dataclass_fields__"):
+            flag = getattr(orjson, "OPT_PASSTHROUGH_DATACLASS", 0)
+        elif issubclass(type_, ORJSON_NATIVE_TYPES):
+            flag = 0
+        else:
+            return
+        if flag:
+            self._option = option | flag
+            self._dumps = partial(orjson.dumps, option=self._option, default=self.default)
+            return
+        # orjson 无法跳过的类型改用标准库 json
+        self._dumps = cast(Callable[[Any], Any], self._fallback)
+        self._fallback = None
+        self._option = None
+        self._separator = b", "
+
+    def default(self, obj: Any) -> Any:
+        """
+        按 mro 查找注册的转换函数
+        """
+        types = self._types
+        for cls in type(obj).__mro__:
+            func = types.get(cls)
+            if func is not None:
+                return func(obj)
+        raise TypeError("Object of type %s is not JSON serializable" % type(obj).__name__)
+
+    def encode(self, obj: Any, charset: str = "utf-8") -> bytes:
+        """
+        编码为 charset 的 bytes
+        """
+        try:
+            data = self._dumps(obj)
+        except TypeError:
+            # orjson.JSONEncodeError 是 TypeError 的子类
+            if self._fallback is None:
+                raise
+            data = self._fallback(obj)
+        if isinstance(data, str):
+            return encode_str(data, charset)
+        if charset.lower().replace("_", "-") not in UTF8_NAMES:
+            # dumps 返回的 bytes 为 utf-8
+            data = encode_str(data.decode("utf-8"), charset)
+        return data
+
+    def should_stream(self, obj: Any) -> bool:
+        """
+        是否分块编码
+        """
+        return bool(
+            self.stream_threshold and
+            isinstance(obj, list) and
+            len(obj) >= self.stream_threshold
+        )
+
+    def iter_encode(self, items: List[Any], charset: str = "utf-8") -> Iterator[bytes]:
+        """
+        分块编码 list，每次编码 chunk_items 个元素
+        """
+        step = max(1, self.chunk_items)
+        separator = self._separator
+        if not items:
+            yield self.encode(items, charset)
+            return
+        for start in range(0, len(items), step):
+            chunk = self.encode(items[start:start + step], charset)
+            if start:
+                # 去掉每块的 []，用分隔符连接
+                yield separator + chunk[1:-1]
+            else:
+                yield chunk[:-1]
+        yield b"]"
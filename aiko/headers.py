@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+request headers 存储，保存原始 bytes，读取时才解码
+"""
+
+from collections.abc import MutableMapping
+from typing import Any, cast, Dict, Iterator, List, Optional, Tuple, Union
+
+from .utils import decode_bytes, DEFAULT_CODING, encode_str
+
+__all__ = [
+    "Headers",
+    "intern_name",
+]
+
+HEADER_VALUE_TYPE = Union[str, List[str]]
+
+# 常见 header 名，解析时直接复用同一个 str 不需要解码和 casefold
+COMMON_HEADERS = (
+    "accept",
+    "accept-charset",
+    "accept-encoding",
+    "accept-language",
+    "authorization",
+    "cache-control",
+    "connection",
+    "content-encoding",
+    "content-length",
+    "content-type",
+    "cookie",
+    "dnt",
+    "expect",
+    "forwarded",
+    "host",
+    "if-match",
+    "if-modified-since",
+    "if-none-match",
+    "if-range",
+    "if-unmodified-since",
+    "origin",
+    "pragma",
+    "range",
+    "referer",
+    "referrer",
+    "sec-fetch-dest",
+    "sec-fetch-mode",
+    "sec-fetch-site",
+    "te",
+    "transfer-encoding",
+    "upgrade",
+    "upgrade-insecure-requests",
+    "user-agent",
+    "x-forwarded-for",
+    "x-forwarded-host",
+    "x-forwarded-proto",
+    "x-real-ip",
+    "x-requested-with",
+)
+INTERNED_NAMES = cast(Dict[bytes, str], {})
+for _name in COMMON_HEADERS:
+    INTERNED_NAMES[_name.encode()] = _name
+    INTERNED_NAMES["-".join(i.capitalize() for i in _name.split("-")).encode()] = _name
+    INTERNED_NAMES[_name.upper().encode()] = _name
+del _name
+
+
+def intern_name(name: bytes) -> str:
+    """
+    原始 header 名转为小写 str，常见的直接查表
+    """
+    name_ = INTERNED_NAMES.get(name)
+    if name_ is None:
+        name_ = decode_bytes(name).lower()
+    return name_
+
+
+class Headers(MutableMapping):
+    """
+    大小写不敏感的 headers，key 为小写，重复的 header 值为 list。
+    解析时只保存原始 bytes，第一次读取时才建立索引，值在读取时才解码。
+    """
+    __slots__ = [
+        "_raw",
+        "_index",
+        "_values",
+    ]
+
+    def __init__(self) -> None:
+        self._raw = cast(List[Tuple[bytes, bytes]], [])
+        # 小写 header 名 -> 原始值
+        self._index = cast(Optional[Dict[str, Union[bytes, List[bytes]]]], None)
+        # 已解码的值
+        self._values = cast(Dict[str, HEADER_VALUE_TYPE], {})
+
+    @property
+    def raw(self) -> List[Tuple[bytes, bytes]]:
+        """
+        原始的 (name, value) 列表
+        """
+        return self._raw
+
+    def add(self, name: bytes, value: bytes) -> None:
+        """
+        httptools on_header 回调时添加
+        """
+        self._raw.append((name, value))
+        if self._index is not None:
+            self._index_item(intern_name(name), value)
+
+    def _index_item(self, name: str, value: bytes) -> None:
+        """
+        加入索引
+        """
+        index = cast(Dict[str, Union[bytes, List[bytes]]], self._index)
+        old = index.get(name)
+        if old is None:
+            index[name] = value
+        elif isinstance(old, list):
+            old.append(value)
+        else:
+            index[name] = [old, value]
+        self._values.pop(name, None)
+
+    def _get_index(self) -> Dict[str, Union[bytes, List[bytes]]]:
+        """
+        第一次读取时建立索引
+        """
+        index = self._index
+        if index is None:
+            index = self._index = {}
+            for name, value in self._raw:
+                self._index_item(intern_name(name), value)
+        return index
+
+    def get(self, name: str, default: Any = None) -> Any:
+        """
+        获取 header，不存在返回 default
+        """
+        name = name.lower()
+        values = self._values
+        if name in values:
+            return values[name]
+        raw = self._get_index().get(name)
+        if raw is None:
+            return default
+        if isinstance(raw, list):
+            value = cast(HEADER_VALUE_TYPE, [decode_bytes(i, DEFAULT_CODING) for i in raw])
+        else:
+            value = decode_bytes(raw, DEFAULT_CODING)
+        values[name] = value
+        return value
+
+    def getlist(self, name: str) -> List[str]:
+        """
+        以 list 获取 header 的所有值
+        """
+        value = self.get(name)
+        if value is None:
+            return []
+        if isinstance(value, list):
+            return value
+        return [value]
+
+    def __getitem__(self, name: str) -> HEADER_VALUE_TYPE:
+        value = self.get(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name: str, value: HEADER_VALUE_TYPE) -> None:
+        """
+        重写 header
+        """
+        name = name.lower()
+        if isinstance(value, list):
+            self._get_index()[name] = [encode_str(i, DEFAULT_CODING, "replace") for i in value]
+        else:
+            self._get_index()[name] = encode_str(value, DEFAULT_CODING, "replace")
+        self._values[name] = value
+
+    def __delitem__(self, name: str) -> None:
+        name = name.lower()
+        del self._get_index()[name]
+        self._values.pop(name, None)
+
+    def __contains__(self, name: Any) -> bool:
+        return isinstance(name, str) and name.lower() in self._get_index()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._get_index())
+
+    def __len__(self) -> int:
+        return len(self._get_index())
+
+    def __repr__(self) -> str:
+        return "<Headers %r>" % dict(self.items())
@@ -1 +1,19 @@
 # -*- coding: utf-8 -*-
+"""
+    aiko.middleware
+    ~~~~~~
+
+    内置的中间件
+"""
+
+__all__ = [
+    "Cache",
+    "Compress",
+    "ETag",
+    "Static",
+]
+
+from .cache import Cache
+from .compress import Compress
+from .etag import ETag
+from .static import Static
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+内存响应缓存中间件，相同 url 的并发请求只执行一次后面的中间件
+"""
+
+import asyncio
+from collections import OrderedDict
+from typing import Any, cast, Dict, Optional, Sequence, Tuple
+
+from ..compose import NEXT_CALL_TYPE, rebind
+from ..response import is_file, is_stream
+
+__all__ = [
+    "Cache",
+    "parse_cache_control",
+]
+
+# 不缓存的 headers
+SKIP_HEADERS = frozenset((
+    "Age",
+    "Connection",
+    "Date",
+    "Keep-Alive",
+    "Set-Cookie",
+    "Transfer-Encoding",
+))
+CACHE_KEY_TYPE = Tuple[Any, ...]
+
+
+def parse_cache_control(value: Any) -> Dict[str, Optional[str]]:
+    """
+    解析 Cache-Control，没有值的指令为 None
+    """
+    directives = cast(Dict[str, Optional[str]], {})
+    if not value:
+        return directives
+    if isinstance(value, list):
+        value = ",".join(value)
+    for item in value.split(","):
+        name, sep, arg = item.partition("=")
+        name = name.strip().lower()
+        if name:
+            directives[name] = arg.strip().strip('"') if sep else None
+    return directives
+
+
+def parse_seconds(value: Optional[str]) -> Optional[int]:
+    """
+    max-age 等指令的秒数
+    """
+    if value is None:
+        return None
+    try:
+        return max(0, int(value))
+    except ValueError:
+        return None
+
+
+class CacheEntry(object):
+    """
+    缓存的响应，body 为编码后的 bytes
+    """
+    __slots__ = [
+        "status",
+        "headers",
+        "body",
+        "stored",
+        "max_age",
+        "stale",
+        "vary",
+        "size",
+    ]
+
+    def __init__(
+            self,
+            status: int,
+            headers: Dict[str, Any],
+            body: bytes,
+            stored: float,
+            max_age: int,
+            stale: int,
+            vary: Tuple[str, ...],
+    ) -> None:
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.stored = stored
+        self.max_age = max_age
+        # stale-while-revalidate 的秒数
+        self.stale = stale
+        self.vary = vary
+        self.size = len(body) + sum(len(k) + len(str(v)) for k, v in headers.items())
+
+
+class Cache(object):
+    """
+    响应缓存中间件，只缓存 GET, HEAD 并且 Cache-Control 有 max-age 的响应。
+    需要在 Compress 之前 use，缓存压缩后的 body
+        app.use(Cache())
+        app.use(Compress())
+    :param max_size: 缓存 body 和 headers 的总字节数上限
+    :param max_entry_size: 单个响应超过该字节数不缓存
+    :param default_max_age: 响应没有 max-age 时的缓存秒数，0 不缓存
+    :param statuses: 缓存的状态码
+    """
+    __slots__ = [
+        "max_size",
+        "max_entry_size",
+        "default_max_age",
+        "statuses",
+        "_entries",
+        "_vary",
+        "_pending",
+        "_revalidating",
+        "_size",
+    ]
+
+    def __init__(
+            self,
+            max_size: int = 64 * 1024 * 1024,
+            max_entry_size: int = 1024 * 1024,
+            default_max_age: int = 0,
+            statuses: Sequence[int] = (200, 203, 301, 404, 410),
+    ) -> None:
+        self.max_size = max_size
+        self.max_entry_size = max_entry_size
+        self.default_max_age = default_max_age
+        self.statuses = frozenset(statuses)
+        self._entries = cast('OrderedDict[CACHE_KEY_TYPE, CacheEntry]', OrderedDict())
+        # url 对应的 Vary header 名
+        self._vary = cast(Dict[CACHE_KEY_TYPE, Tuple[str, ...]], {})
+        # 正在执行的请求，相同 key 的请求等待它完成
+        self._pending = cast(Dict[CACHE_KEY_TYPE, asyncio.Future], {})
+        self._revalidating = cast(Dict[CACHE_KEY_TYPE, asyncio.Future], {})
+        self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """
+        清空缓存
+        """
+        self._entries.clear()
+        self._vary.clear()
+        self._size = 0
+
+    def cache_key(self, request: Any, base: CACHE_KEY_TYPE) -> CACHE_KEY_TYPE:
+        """
+        url 加上 Vary 指定的 request headers
+        """
+        vary = self._vary.get(base)
+        if not vary:
+            return base
+        return base + tuple(request.get(name) for name in vary)
+
+    def get(self, key: CACHE_KEY_TYPE) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def remove(self, key: CACHE_KEY_TYPE) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+
+    def store(self, ctx: Any, base: CACHE_KEY_TYPE) -> None:
+        """
+        响应可以缓存时保存
+        """
+        response = ctx.response
+        if response.headers_sent or response.status not in self.statuses:
+            return
+        headers = response.headers
+        if "Set-Cookie" in headers or response.cookies.headers() is not None:
+            return
+        control = parse_cache_control(headers.get("Cache-Control"))
+        if "no-store" in control or "private" in control or "no-cache" in control:
+            return
+        max_age = parse_seconds(control.get("s-maxage"))
+        if max_age is None:
+            max_age = parse_seconds(control.get("max-age"))
+        if max_age is None:
+            max_age = self.default_max_age
+        stale = parse_seconds(control.get("stale-while-revalidate")) or 0
+        if max_age <= 0 and stale <= 0:
+            return
+        vary = tuple(
+            name.strip().lower()
+            for name in (cast(str, headers.get("Vary") or "")).split(",")
+            if name.strip()
+        )
+        if "*" in vary:
+            return
+        body = response.body
+        if body is None or is_file(body) or is_stream(body):
+            # 文件和流式 body 不缓存，也不能提前处理 Range
+            return
+        # 转换为 bytes 并设置 Content-Type, Content-Length
+        response.handel_default()
+        body = response.body
+        if not isinstance(body, bytes) or len(body) > self.max_entry_size:
+            return
+        entry = CacheEntry(
+            response.status,
+            {k: v for k, v in headers.items() if k not in SKIP_HEADERS},
+            body,
+            ctx.loop.time(),
+            max_age,
+            stale,
+            vary,
+        )
+        if entry.size > self.max_entry_size:
+            return
+        self._vary[base] = vary
+        key = self.cache_key(ctx.request, base)
+        self.remove(key)
+        self._entries[key] = entry
+        self._size += entry.size
+        while self._size > self.max_size and self._entries:
+            _, old = self._entries.popitem(last=False)
+            self._size -= old.size
+
+    def serve(self, ctx: Any, entry: CacheEntry, age: float) -> None:
+        """
+        使用缓存的响应
+        """
+        response = ctx.response
+        response.status = entry.status
+        response.headers.update(entry.headers)
+        response.set("Age", str(int(age)))
+        response.body = entry.body
+
+    async def __call__(self, ctx: Any, next_call: NEXT_CALL_TYPE) -> None:
+        request = ctx.request
+        method = request.method
+        if method != "GET" and method != "HEAD":
+            await next_call()
+            return
+        control = parse_cache_control(request.get("cache-control"))
+        if "no-store" in control or request.get("authorization") is not None:
+            await next_call()
+            return
+        # HEAD 和 GET 共用缓存
+        base = ("GET", request.href)
+        key = self.cache_key(request, base)
+        if "no-cache" not in control:
+            pending = self._pending.get(key)
+            if pending is not None:
+                # 相同的请求正在执行，等待结果
+                await asyncio.shield(pending)
+                key = self.cache_key(request, base)
+            entry = self.get(key)
+            if entry is not None:
+                age = ctx.loop.time() - entry.stored
+                if age < entry.max_age:
+                    self.serve(ctx, entry, age)
+                    return
+                if age < entry.max_age + entry.stale:
+                    # 先返回过期的响应，在后台重新执行
+                    self.serve(ctx, entry, age)
+                    if key not in self._revalidating:
+                        self._revalidate(ctx, next_call, base, key)
+                    return
+                self.remove(key)
+        if key in self._pending:
+            await next_call()
+            return
+        waiter = self._pending[key] = ctx.loop.create_future()
+        try:
+            await next_call()
+            self.store(ctx, base)
+        finally:
+            del self._pending[key]
+            waiter.set_result(None)
+
+    def _revalidate(
+            self,
+            ctx: Any,
+            next_call: NEXT_CALL_TYPE,
+            base: CACHE_KEY_TYPE,
+            key: CACHE_KEY_TYPE,
+    ) -> None:
+        """
+        使用复制的 request 在后台执行后面的中间件并更新缓存
+        """
+        app = ctx.app
+        request = ctx.request.clone()
+        response = app.response(
+            ctx.loop,
+            None,
+            cast(str, request.version),
+            ctx.response.charset,
+        )
+        shadow = app.context(ctx.loop, request, response, app)
+        request.ctx = response.ctx = shadow
+        request.response = response
+        response.request = request
+        response.app = app
+
+        async def revalidate() -> None:
+            """
+            后台更新缓存
+            """
+            try:
+                await rebind(next_call, shadow)()
+                self.store(shadow, base)
+            except Exception:
+                pass
+            finally:
+                del self._revalidating[key]
+
+        self._revalidating[key] = ctx.loop.create_task(revalidate())
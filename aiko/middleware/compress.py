@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+响应压缩中间件，支持 gzip, deflate, 安装了 brotli 时支持 br
+"""
+
+import os
+import zlib
+from concurrent.futures import Executor
+from mimetypes import guess_type
+from typing import Any, cast, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+from ..compose import NEXT_CALL_TYPE
+from ..response import is_file, is_stream, Response
+from ..utils import encode_str
+
+__all__ = [
+    "Compress",
+    "negotiate",
+]
+
+# 默认压缩的 Content-Type 前缀
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/xhtml+xml",
+    "application/rss+xml",
+    "application/atom+xml",
+    "application/manifest+json",
+    "image/svg+xml",
+)
+# q 值相同时的优先顺序
+ENCODINGS = ("br", "gzip", "deflate")
+# 部署时预压缩的文件后缀
+SIBLING_SUFFIXES = (
+    ("br", ".br"),
+    ("gzip", ".gz"),
+)
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def negotiate(accept: Optional[str], encodings: Sequence[str]) -> Optional[str]:
+    """
+    根据 Accept-Encoding 从 encodings 中选择 q 值最大的编码，都不接受返回 None
+    """
+    if not accept or not encodings:
+        return None
+    weights = cast(Dict[str, float], {})
+    for item in accept.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if name == "x-gzip":
+            name = "gzip"
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+    default = weights.get("*", 0.0)
+    best = cast(Optional[str], None)
+    best_weight = 0.0
+    for encoding in encodings:
+        weight = weights.get(encoding, default)
+        if weight > best_weight:
+            best = encoding
+            best_weight = weight
+    return best
+
+
+class StreamCompressor(object):
+    """
+    流式压缩，每块都 flush 保证客户端能及时收到
+    """
+    __slots__ = [
+        "_encoding",
+        "_compressor",
+    ]
+
+    def __init__(self, encoding: str, level: int, quality: int) -> None:
+        self._encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=quality)
+        else:
+            wbits = GZIP_WBITS if encoding == "gzip" else zlib.MAX_WBITS
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def compress(self, data: bytes) -> bytes:
+        """
+        压缩一块数据
+        """
+        compressor = self._compressor
+        if self._encoding == "br":
+            # brotli 为 process，brotlipy 为 compress
+            process = getattr(compressor, "process", None) or compressor.compress
+            return process(data) + compressor.flush()
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        """
+        结束压缩
+        """
+        if self._encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+class CompressStream(object):
+    """
+    把同步迭代器或异步迭代器包装为压缩后的异步迭代器
+    """
+    __slots__ = [
+        "_iter",
+        "_async",
+        "_compressor",
+        "_charset",
+        "_done",
+    ]
+
+    def __init__(self, stream: Any, compressor: StreamCompressor, charset: str) -> None:
+        self._async = hasattr(stream, "__aiter__")
+        self._iter = stream.__aiter__() if self._async else iter(stream)
+        self._compressor = compressor
+        self._charset = charset
+        self._done = False
+
+    def __aiter__(self) -> 'CompressStream':
+        return self
+
+    async def __anext__(self) -> bytes:
+        while not self._done:
+            try:
+                if self._async:
+                    chunk = await self._iter.__anext__()
+                else:
+                    chunk = next(self._iter)
+            except (StopIteration, StopAsyncIteration):
+                self._done = True
+                data = self._compressor.finish()
+                if data:
+                    return data
+                break
+            if isinstance(chunk, str):
+                chunk = encode_str(chunk, self._charset)
+            if not chunk:
+                continue
+            data = self._compressor.compress(chunk)
+            if data:
+                return data
+        raise StopAsyncIteration
+
+
+class Compress(object):
+    """
+    压缩中间件，需要在生成 body 的中间件之前 use
+        app.use(Compress())
+    :param threshold: 小于该长度的 body 不压缩
+    :param types: 压缩的 Content-Type 前缀
+    :param level: gzip, deflate 的压缩等级
+    :param quality: brotli 的压缩等级
+    :param executor: 压缩大 body 使用的线程池，None 使用 loop 默认的线程池
+    :param executor_threshold: 大于等于该长度的 body 在线程池中压缩，0 不使用线程池
+    :param precompressed: 文件 body 存在更新的 .br, .gz 文件时直接发送
+    """
+    __slots__ = [
+        "threshold",
+        "types",
+        "level",
+        "quality",
+        "executor",
+        "executor_threshold",
+        "precompressed",
+        "encodings",
+    ]
+
+    def __init__(
+            self,
+            threshold: int = 1024,
+            types: Sequence[str] = COMPRESSIBLE_TYPES,
+            level: int = 6,
+            quality: int = 4,
+            executor: Optional[Executor] = None,
+            executor_threshold: int = 64 * 1024,
+            precompressed: bool = True,
+    ) -> None:
+        self.threshold = threshold
+        self.types = tuple(types)
+        self.level = level
+        self.quality = quality
+        self.executor = executor
+        self.executor_threshold = executor_threshold
+        self.precompressed = precompressed
+        self.encodings = ENCODINGS if brotli is not None else ENCODINGS[1:]
+
+    def compressible(self, type_str: Optional[str]) -> bool:
+        """
+        Content-Type 是否需要压缩
+        """
+        if not type_str:
+            return False
+        return type_str.split(";")[0].strip().lower().startswith(self.types)
+
+    def compress(self, encoding: str, data: bytes) -> bytes:
+        """
+        一次压缩整个 body
+        """
+        if encoding == "br":
+            return brotli.compress(data, quality=self.quality)
+        wbits = GZIP_WBITS if encoding == "gzip" else zlib.MAX_WBITS
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, wbits)
+        return compressor.compress(data) + compressor.flush()
+
+    async def __call__(self, ctx: Any, next_call: NEXT_CALL_TYPE) -> None:
+        await next_call()
+        response = ctx.response
+        status = response.status
+        if response.headers_sent or status < 200 or status in (204, 206, 304):
+            return
+        if "Content-Encoding" in response.headers or response.body is None:
+            return
+        accept = ctx.request.get("accept-encoding")
+        if isinstance(accept, list):
+            accept = ", ".join(accept)
+        body = response.body
+        if is_file(body):
+            if self.precompressed:
+                self.use_sibling(response, body, accept)
+            return
+        if not is_stream(body):
+            # 转换为 bytes 并设置默认的 Content-Type, Content-Length
+            response.handel_default()
+            body = response.body
+        if not self.compressible(response.get("Content-Type") or response.type):
+            return
+        add_vary(response)
+        encoding = negotiate(accept, self.encodings)
+        if encoding is None:
+            return
+        if isinstance(body, bytes):
+            if len(body) < self.threshold:
+                return
+            if self.executor_threshold and len(body) >= self.executor_threshold:
+                data = await ctx.loop.run_in_executor(
+                    self.executor,
+                    self.compress,
+                    encoding,
+                    body,
+                )
+            else:
+                data = self.compress(encoding, body)
+            response.body = data
+            response.length = len(data)
+            response.set("Content-Length", str(len(data)))
+        elif is_stream(body):
+            # 压缩后的长度未知
+            response.headers.pop("Content-Length", None)
+            response.length = None
+            response.body = CompressStream(
+                body,
+                StreamCompressor(encoding, self.level, self.quality),
+                response.charset,
+            )
+            response.handle_stream()
+        else:
+            return
+        response.set("Content-Encoding", encoding)
+
+    def use_sibling(self, response: Response, file: Any, accept: Optional[str]) -> None:
+        """
+        发送预压缩的 .br, .gz 文件，比原文件旧的不使用
+        """
+        name = getattr(file, "name", None)
+        if not isinstance(name, str):
+            return
+        type_str = cast(Optional[str], response.get("Content-Type"))
+        type_str = type_str or response.type or guess_type(name)[0]
+        if not self.compressible(type_str):
+            return
+        add_vary(response)
+        try:
+            mtime = os.fstat(file.fileno()).st_mtime
+        except (OSError, ValueError):
+            return
+        siblings = cast(List[Tuple[str, str]], [])
+        for coding, suffix in SIBLING_SUFFIXES:
+            try:
+                if os.stat(name + suffix).st_mtime >= mtime:
+                    siblings.append((coding, name + suffix))
+            except OSError:
+                continue
+        encoding = negotiate(accept, [item[0] for item in siblings])
+        if encoding is None:
+            return
+        path = dict(siblings)[encoding]
+        try:
+            sibling = open(path, "rb", buffering=0)
+        except OSError:
+            return
+        file.close()
+        response.body = sibling
+        response.set("Content-Type", cast(str, type_str))
+        response.set("Content-Encoding", encoding)
+        etag = cast(Optional[str], response.get("ETag"))
+        if etag:
+            # 压缩后的内容不同，强 ETag 不能和原文件相同
+            response.set("ETag", encoding_etag(etag, encoding))
+
+
+def encoding_etag(etag: str, encoding: str) -> str:
+    """
+    在 ETag 的引号内加上编码后缀
+        encoding_etag('"1a-2b"', "gzip") == '"1a-2b-gzip"'
+    """
+    if etag.endswith('"'):
+        return '%s-%s"' % (etag[:-1], encoding)
+    return "%s-%s" % (etag, encoding)
+
+
+def add_vary(response: Response) -> None:
+    """
+    响应内容根据 Accept-Encoding 变化
+    """
+    vary = cast(Optional[str], response.get("Vary"))
+    if not vary:
+        response.set("Vary", "Accept-Encoding")
+    elif vary != "*" and "accept-encoding" not in vary.lower():
+        response.set("Vary", "%s, Accept-Encoding" % vary)
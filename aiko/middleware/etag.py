@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+条件请求中间件，根据 body 生成 ETag，缓存有效时返回 304
+"""
+
+from typing import Any, cast, List, Optional
+from zlib import crc32
+
+from ..compose import NEXT_CALL_TYPE
+from ..response import is_file, is_stream, Response
+from ..utils import encode_str
+
+__all__ = [
+    "ETag",
+    "make_etag",
+]
+
+
+def make_etag(size: int, checksum: int, weak: bool = True) -> str:
+    """
+    使用长度和 crc32 生成 ETag
+    """
+    tag = '"%x-%08x"' % (size, checksum)
+    return "W/" + tag if weak else tag
+
+
+class ReplayStream(object):
+    """
+    先返回已经读取的块，再继续读取原来的迭代器
+    """
+    __slots__ = [
+        "_chunks",
+        "_iter",
+        "_async",
+    ]
+
+    def __init__(self, chunks: List[bytes], stream: Any, is_async: bool) -> None:
+        self._chunks = chunks
+        self._iter = stream
+        self._async = is_async
+
+    def __aiter__(self) -> 'ReplayStream':
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._chunks:
+            return self._chunks.pop(0)
+        try:
+            if self._async:
+                return await self._iter.__anext__()
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class ETag(object):
+    """
+    条件请求中间件，响应没有 ETag 时根据 body 的 crc32 生成，
+    请求的 If-None-Match, If-Modified-Since 匹配时返回没有 body 的 304。
+    流式 body 在 stream_limit 内读完时缓冲为 bytes 并生成 ETag，否则直接发送。
+    需要在 Cache, Compress 之前 use
+        app.use(ETag())
+        app.use(Compress())
+    :param weak: 生成弱 ETag
+    :param stream_limit: 流式 body 最多缓冲的字节数，0 不处理流式 body
+    """
+    __slots__ = [
+        "weak",
+        "stream_limit",
+    ]
+
+    def __init__(self, weak: bool = True, stream_limit: int = 64 * 1024) -> None:
+        self.weak = weak
+        self.stream_limit = stream_limit
+
+    async def __call__(self, ctx: Any, next_call: NEXT_CALL_TYPE) -> None:
+        await next_call()
+        request = ctx.request
+        response = ctx.response
+        method = request.method
+        if response.headers_sent or (method != "GET" and method != "HEAD"):
+            return
+        if response.status == 200 and "ETag" not in response.headers:
+            body = response.body
+            if is_stream(body):
+                if self.stream_limit > 0:
+                    await self.buffer_stream(response, body)
+            elif body is not None and not is_file(body):
+                # 转换为 bytes 并设置默认的 Content-Type, Content-Length
+                response.handel_default()
+                body = response.body
+                if isinstance(body, bytes):
+                    response.set("ETag", make_etag(len(body), crc32(body), self.weak))
+        if request.fresh:
+            response.status = 304
+            body = response.body
+            if is_file(body):
+                body.close()
+            response.body = None
+
+    async def buffer_stream(self, response: Response, stream: Any) -> None:
+        """
+        读取流式 body 并累计 crc32，超过 stream_limit 时保留已读取的块继续流式发送
+        """
+        if response.get("Trailer"):
+            return
+        is_async = hasattr(stream, "__aiter__")
+        it = stream.__aiter__() if is_async else iter(stream)
+        charset = response.charset
+        chunks = cast(List[bytes], [])
+        checksum = 0
+        size = 0
+        while True:
+            try:
+                if is_async:
+                    chunk = await it.__anext__()
+                else:
+                    chunk = next(it)
+            except (StopIteration, StopAsyncIteration):
+                break
+            if isinstance(chunk, str):
+                chunk = encode_str(chunk, charset)
+            if not chunk:
+                continue
+            chunks.append(chunk)
+            checksum = crc32(chunk, checksum)
+            size += len(chunk)
+            if size > self.stream_limit:
+                response.body = ReplayStream(chunks, it, is_async)
+                return
+        # 已经读完，作为 bytes 发送
+        headers = response.headers
+        if headers.get("Transfer-Encoding") == "chunked":
+            del headers["Transfer-Encoding"]
+        length = cast(Optional[int], response.length)
+        if length is None or length != size:
+            headers.pop("Content-Length", None)
+            response.length = None
+        response.body = b"".join(chunks)
+        response.handel_default()
+        response.set("ETag", make_etag(size, checksum, self.weak))
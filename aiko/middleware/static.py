@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+静态文件中间件，缓存 stat 结果和打开的文件，使用 sendfile 发送
+"""
+
+import os
+import stat
+from collections import OrderedDict
+from io import FileIO
+from mimetypes import guess_type
+from typing import Any, cast, Optional
+
+from ..compose import NEXT_CALL_TYPE
+from ..utils import format_http_date
+
+__all__ = [
+    "Static",
+]
+
+# 这些类型的 Content-Type 加上 charset
+TEXT_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+class FileEntry(object):
+    """
+    缓存的文件信息，fd 由缓存持有，每个 response 使用 dup 出的 fd
+    """
+    __slots__ = [
+        "path",
+        "fd",
+        "size",
+        "mtime",
+        "inode",
+        "etag",
+        "last_modified",
+        "content_type",
+        "checked",
+    ]
+
+    def __init__(
+            self,
+            path: str,
+            fd: int,
+            st: os.stat_result,
+            content_type: str,
+            weak: bool,
+            now: float,
+    ) -> None:
+        self.path = path
+        self.fd = fd
+        self.size = st.st_size
+        self.mtime = st.st_mtime_ns
+        self.inode = st.st_ino
+        tag = '"%x-%x"' % (st.st_size, st.st_mtime_ns)
+        self.etag = "W/" + tag if weak else tag
+        self.last_modified = format_http_date(st.st_mtime)
+        self.content_type = content_type
+        # 上次检查文件是否变化的时间
+        self.checked = now
+
+    def changed(self, st: os.stat_result) -> bool:
+        """
+        文件是否被修改或者替换
+        """
+        return st.st_mtime_ns != self.mtime or st.st_size != self.size or st.st_ino != self.inode
+
+    def open(self) -> FileIO:
+        """
+        打开一个给 response 使用的文件对象，response 发送完后关闭
+        """
+        file = FileIO(os.dup(self.fd), "rb")
+        # 给 Compress 查找预压缩的文件
+        file.name = self.path  # type: ignore
+        return file
+
+    def close(self) -> None:
+        """
+        从缓存移除时关闭 fd
+        """
+        os.close(self.fd)
+
+
+class Static(object):
+    """
+    静态文件中间件，找不到文件时调用下一个中间件
+        app.use(Static("./public", prefix="/static/"))
+    :param root: 静态文件目录
+    :param prefix: url 前缀
+    :param index: 目录的默认文件，None 不处理目录
+    :param max_age: Cache-Control 的 max-age(秒)，None 不设置
+    :param cache_size: 缓存的文件数，0 不缓存
+    :param ttl: 缓存的 stat 结果多少秒后重新检查
+    :param weak_etag: 使用弱 ETag
+    :param hidden: 是否允许访问 . 开头的文件
+    :param charset: 文本类型的 charset
+    """
+    __slots__ = [
+        "root",
+        "prefix",
+        "index",
+        "max_age",
+        "cache_size",
+        "ttl",
+        "weak_etag",
+        "hidden",
+        "charset",
+        "_cache",
+    ]
+
+    def __init__(
+            self,
+            root: str,
+            prefix: str = "/",
+            index: Optional[str] = "index.html",
+            max_age: Optional[int] = None,
+            cache_size: int = 256,
+            ttl: float = 1.0,
+            weak_etag: bool = True,
+            hidden: bool = False,
+            charset: str = "utf-8",
+    ) -> None:
+        self.root = os.path.realpath(root)
+        self.prefix = prefix if prefix.endswith("/") else prefix + "/"
+        self.index = index
+        self.max_age = max_age
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.weak_etag = weak_etag
+        self.hidden = hidden
+        self.charset = charset
+        self._cache = cast('OrderedDict[str, FileEntry]', OrderedDict())
+
+    def resolve(self, path: str) -> Optional[str]:
+        """
+        把 url path 转为 root 下的文件路径，包含 .., 隐藏文件或者非法字符时返回 None
+        """
+        if not path.startswith(self.prefix) and path + "/" != self.prefix:
+            return None
+        parts = []
+        for part in path[len(self.prefix):].split("/"):
+            if not part or part == ".":
+                continue
+            if part == ".." or "\x00" in part or "\\" in part:
+                return None
+            if not self.hidden and part.startswith("."):
+                return None
+            parts.append(part)
+        return os.path.join(self.root, *parts)
+
+    def lookup(self, path: str, now: float) -> Optional[FileEntry]:
+        """
+        从缓存获取文件，超过 ttl 重新 stat，文件变化时重新打开
+        """
+        cache = self._cache
+        entry = cache.get(path)
+        if entry is not None:
+            if now - entry.checked < self.ttl:
+                cache.move_to_end(path)
+                return entry
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            if st is not None and not entry.changed(st):
+                entry.checked = now
+                cache.move_to_end(path)
+                return entry
+            del cache[path]
+            entry.close()
+        entry = self.open(path, now)
+        if entry is not None and self.cache_size > 0:
+            cache[path] = entry
+            while len(cache) > self.cache_size:
+                _, old = cache.popitem(last=False)
+                old.close()
+        return entry
+
+    def open(self, path: str, now: float) -> Optional[FileEntry]:
+        """
+        打开文件，目录使用 index，链接到 root 之外的文件返回 None
+        """
+        try:
+            st = os.stat(path)
+            if stat.S_ISDIR(st.st_mode):
+                if not self.index:
+                    return None
+                path = os.path.join(path, self.index)
+                st = os.stat(path)
+            if not stat.S_ISREG(st.st_mode):
+                return None
+            real = os.path.realpath(path)
+            if real != self.root and not real.startswith(self.root + os.sep):
+                return None
+            fd = os.open(path, os.O_RDONLY | getattr(os, "O_CLOEXEC", 0))
+        except OSError:
+            return None
+        try:
+            # 打开后再 stat 一次，避免 stat 与 open 之间文件被替换
+            st = os.fstat(fd)
+        except OSError:
+            os.close(fd)
+            return None
+        content_type = guess_type(path)[0] or "application/octet-stream"
+        if self.charset and content_type.startswith(TEXT_TYPES):
+            content_type = "%s; charset=%s" % (content_type, self.charset)
+        return FileEntry(path, fd, st, content_type, self.weak_etag, now)
+
+    def close(self) -> None:
+        """
+        关闭所有缓存的文件
+        """
+        for entry in self._cache.values():
+            entry.close()
+        self._cache.clear()
+
+    async def __call__(self, ctx: Any, next_call: NEXT_CALL_TYPE) -> None:
+        request = ctx.request
+        method = request.method
+        if method != "GET" and method != "HEAD":
+            await next_call()
+            return
+        path = self.resolve(request.path or "/")
+        entry = None
+        if path is not None:
+            entry = self.lookup(path, ctx.loop.time())
+        if entry is None:
+            await next_call()
+            return
+        try:
+            response = ctx.response
+            response.status = 200
+            response.set("Content-Type", entry.content_type)
+            response.set("Last-Modified", entry.last_modified)
+            response.set("ETag", entry.etag)
+            if self.max_age is not None:
+                response.set("Cache-Control", "public, max-age=%d" % self.max_age)
+            if request.fresh:
+                response.status = 304
+                response.body = None
+                return
+            try:
+                response.body = entry.open()
+            except OSError:
+                await next_call()
+        finally:
+            if self.cache_size <= 0:
+                # 没有缓存时 entry 只在这次请求使用
+                entry.close()
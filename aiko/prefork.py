@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+prefork 多进程运行 Application，不需要 gunicorn
+"""
+
+import asyncio
+import errno
+import logging
+import os
+import select
+import signal
+import socket
+import sys
+import time
+import traceback
+from typing import Any, cast, Dict, List, Optional
+
+__all__ = [
+    "Arbiter",
+    "create_socket",
+    "reuse_port_supported",
+]
+
+logger = logging.getLogger(__name__)
+
+# master 处理的信号，windows 没有 SIGQUIT, SIGHUP, SIGCHLD
+STOP_SIGNALS = tuple(
+    getattr(signal, name)
+    for name in ("SIGTERM", "SIGINT", "SIGQUIT")
+    if hasattr(signal, name)
+)
+HANDLED_SIGNALS = STOP_SIGNALS + tuple(
+    getattr(signal, name)
+    for name in ("SIGHUP", "SIGCHLD")
+    if hasattr(signal, name)
+)
+
+
+def reuse_port_supported() -> bool:
+    """
+    系统是否支持多个 socket bind 同一个端口并由内核分配连接
+    """
+    return hasattr(socket, "SO_REUSEPORT") and sys.platform.startswith(("linux", "freebsd"))
+
+
+def create_socket(
+        host: str,
+        port: int,
+        reuse_port: bool = False,
+        backlog: int = 1024,
+) -> socket.socket:
+    """
+    创建监听的 socket
+    """
+    infos = socket.getaddrinfo(
+        host,
+        port,
+        type=socket.SOCK_STREAM,
+        flags=socket.AI_PASSIVE,
+    )
+    family, type_, proto, _, address = infos[0]
+    sock = socket.socket(family, type_, proto)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(address)
+        sock.listen(backlog)
+        sock.setblocking(False)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+class Arbiter(object):
+    """
+    master 进程只负责启动、重启 worker 和转发信号，每个 worker 运行一个 loop。
+    SIGTERM, SIGINT, SIGQUIT 等待所有 worker 处理完后退出，SIGHUP 重启所有 worker。
+    worker 忽略发给进程组的 SIGINT，收到 SIGQUIT 时直接退出
+        Arbiter(app, port=8080, workers=4).run()
+    :param app: Application
+    :param host: 监听的地址
+    :param port: 监听的端口
+    :param workers: worker 进程数，0 使用 cpu 数
+    :param reuse_port: 每个 worker 使用 SO_REUSEPORT 各自 bind 由内核分配连接，
+        False 时 master bind 后 worker 继承 socket，None 在支持时使用
+    :param cpu_affinity: 每个 worker 绑定到一个 cpu
+    :param backlog: listen 的 backlog
+    :param graceful_timeout: 停止时等待 worker 退出的秒数，超时发送 SIGKILL
+    :param respawn_delay: 同一个 worker 两次启动的最小间隔(秒)，避免不停重启
+    """
+    __slots__ = [
+        "app",
+        "host",
+        "port",
+        "workers",
+        "reuse_port",
+        "cpu_affinity",
+        "backlog",
+        "graceful_timeout",
+        "respawn_delay",
+        "_sock",
+        "_children",
+        "_started",
+        "_signals",
+        "_pipe",
+        "_stop_deadline",
+    ]
+
+    def __init__(
+            self,
+            app: Any,
+            host: str = "0.0.0.0",
+            port: int = 5000,
+            workers: int = 0,
+            reuse_port: Optional[bool] = None,
+            cpu_affinity: bool = False,
+            backlog: int = 1024,
+            graceful_timeout: float = 30.0,
+            respawn_delay: float = 1.0,
+    ) -> None:
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        if reuse_port is None:
+            reuse_port = reuse_port_supported()
+        self.reuse_port = reuse_port
+        self.cpu_affinity = cpu_affinity
+        self.backlog = backlog
+        self.graceful_timeout = graceful_timeout
+        self.respawn_delay = respawn_delay
+        self._sock = cast(Optional[socket.socket], None)
+        # pid -> worker 序号
+        self._children = cast(Dict[int, int], {})
+        # worker 序号 -> 上次启动时间
+        self._started = cast(Dict[int, float], {})
+        self._signals = cast(List[int], [])
+        self._pipe = cast(Optional[List[int]], None)
+        self._stop_deadline = cast(Optional[float], None)
+
+    def run(self) -> None:
+        """
+        启动 worker 并等待信号，所有 worker 退出后返回
+        """
+        if not hasattr(os, "fork"):
+            raise RuntimeError("prefork workers require os.fork")
+        if self.reuse_port:
+            # 先在 master bind 一次，端口不可用时直接报错而不是不停重启 worker
+            create_socket(self.host, self.port, True, self.backlog).close()
+        else:
+            self._sock = create_socket(self.host, self.port, False, self.backlog)
+        self._pipe = list(os.pipe())
+        for fd in self._pipe:
+            os.set_blocking(fd, False)
+        signal.set_wakeup_fd(self._pipe[1])
+        for sig in HANDLED_SIGNALS:
+            signal.signal(sig, self._on_signal)
+        logger.info("master %d starting %d workers", os.getpid(), self.workers)
+        try:
+            while True:
+                self.reap()
+                self.handle_signals()
+                if self._stop_deadline is not None:
+                    if not self._children:
+                        break
+                    if time.monotonic() >= self._stop_deadline:
+                        self.kill_all(signal.SIGKILL)
+                else:
+                    self.spawn_missing()
+                self.sleep(1.0)
+        finally:
+            signal.set_wakeup_fd(-1)
+            for sig in HANDLED_SIGNALS:
+                signal.signal(sig, signal.SIG_DFL)
+            for fd in self._pipe:
+                os.close(fd)
+            self._pipe = None
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+
+    def _on_signal(self, sig: int, frame: Any) -> None:
+        """
+        信号回调只记录，由主循环处理
+        """
+        self._signals.append(sig)
+
+    def handle_signals(self) -> None:
+        """
+        处理收到的信号
+        """
+        while self._signals:
+            sig = self._signals.pop(0)
+            if sig in STOP_SIGNALS:
+                self.stop()
+            elif sig == getattr(signal, "SIGHUP", None):
+                logger.info("reloading workers")
+                self.kill_all(signal.SIGTERM)
+
+    def stop(self) -> None:
+        """
+        通知所有 worker 退出，超过 graceful_timeout 后强制结束
+        """
+        if self._stop_deadline is None:
+            logger.info("stopping workers")
+            self._stop_deadline = time.monotonic() + self.graceful_timeout
+        self.kill_all(signal.SIGTERM)
+
+    def kill_all(self, sig: int) -> None:
+        """
+        把信号转发给所有 worker
+        """
+        for pid in list(self._children):
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                self._children.pop(pid, None)
+
+    def reap(self) -> None:
+        """
+        回收退出的 worker
+        """
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            index = self._children.pop(pid, None)
+            if index is None:
+                continue
+            if self._stop_deadline is None and status != 0:
+                logger.warning("worker %d (pid %d) exited with status %d", index, pid, status)
+
+    def spawn_missing(self) -> None:
+        """
+        启动缺少的 worker
+        """
+        running = set(self._children.values())
+        now = time.monotonic()
+        for index in range(self.workers):
+            if index in running:
+                continue
+            if now - self._started.get(index, -self.respawn_delay) < self.respawn_delay:
+                continue
+            self.spawn(index)
+
+    def spawn(self, index: int) -> None:
+        """
+        fork 一个 worker
+        """
+        self._started[index] = time.monotonic()
+        pid = os.fork()
+        if pid != 0:
+            self._children[pid] = index
+            return
+        code = 1
+        try:
+            self.run_worker(index)
+            code = 0
+        except SystemExit as error:
+            code = error.code if isinstance(error.code, int) else 1
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def run_worker(self, index: int) -> None:
+        """
+        worker 进程: 恢复信号处理，绑定 cpu，在新的 loop 上运行 app
+        """
+        signal.set_wakeup_fd(-1)
+        for sig in HANDLED_SIGNALS:
+            signal.signal(sig, signal.SIG_DFL)
+        # Ctrl-C 会发给整个进程组，worker 只响应 master 转发的 SIGTERM
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for fd in cast(List[int], self._pipe):
+            os.close(fd)
+        if self.cpu_affinity and hasattr(os, "sched_setaffinity"):
+            cpus = sorted(os.sched_getaffinity(0))
+            os.sched_setaffinity(0, {cpus[index % len(cpus)]})
+        sock = self._sock
+        if sock is None:
+            sock = create_socket(self.host, self.port, True, self.backlog)
+        # fork 前的 loop 不能在子进程中使用
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.app.serve(loop=loop, sock=sock)
+
+    def sleep(self, timeout: float) -> None:
+        """
+        等待信号或者超时
+        """
+        pipe = cast(List[int], self._pipe)
+        try:
+            ready = select.select([pipe[0]], [], [], timeout)[0]
+        except OSError as error:
+            if error.errno != errno.EINTR:
+                raise
+            return
+        if ready:
+            try:
+                while os.read(pipe[0], 64):
+                    pass
+            except (BlockingIOError, InterruptedError):
+                pass
@@ -1,40 +1,130 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
+from collections import deque
 from socket import socket as sys_socket
 from typing import Any, Callable, cast, Dict, Generator, List, Optional, Union
-from urllib.parse import parse_qs, unquote, urlencode
+from urllib.parse import unquote, urlencode
 # from datetime import datetime
 
 from httptools import HttpRequestParser, parse_url
 
 from .cookies import Cookies
+from .encoder import json_loads
+from .headers import Headers
 from .utils import (
     decode_bytes,
+    DEFAULT_JSON_EXECUTOR_THRESHOLD,
+    DEFAULT_MAX_BODY_SIZE,
+    DEFAULT_READ_HIGH_WATER,
     DEFAULT_REQUEST_CODING,
     encode_str,
     fresh,
     HEADER_TYPE,
+    parse_query,
     STATIC_METHODS,
 )
 
 __all__ = [
+    "HTTPError",
     "Request",
+    "RequestBodyTooLarge",
 ]
 
 
+TRUE_VALUES = frozenset(("1", "true", "yes", "on"))
+FALSE_VALUES = frozenset(("0", "false", "no", "off"))
+
+
+class HTTPError(Exception):
+    """
+    请求错误，Application 返回对应的 status，
+    不继承 ValueError 避免被解析错误的处理捕获
+    """
+
+    def __init__(self, status: int = 400, message: Optional[str] = None) -> None:
+        super().__init__(message or "HTTP %d" % status)
+        self.status = status
+
+
+class RequestBodyTooLarge(HTTPError):
+    """
+    form(), json() 读取的 body 超过上限，Application 返回 413
+    """
+
+    def __init__(self, message: Optional[str] = None) -> None:
+        super().__init__(413, message)
+
+
 class RequestParameters(dict):
     """Hosts a dict with lists as values where get returns the first
-    value of the list and getlist returns the whole shebang
+    value of the list and getlist returns the whole shebang.
+    单个值的 key 内部直接保存 str，只在按 list 读取时才生成 list
     """
 
+    def __getitem__(self, name: str) -> List[Any]:
+        value = super().__getitem__(name)
+        if isinstance(value, list):
+            return value
+        return [value]
+
+    def _first(self, name: str) -> Any:
+        """
+        第一个值，不存在返回 None
+        """
+        value = super().get(name)
+        if isinstance(value, list):
+            return value[0]
+        return value
+
     def get(self, name: str, default: Any = None) -> Any:
         """Return the first value, either the default or actual"""
-        return super().get(name, [default])[0]
+        value = self._first(name)
+        return default if value is None else value
 
     def getlist(self, name: str, default: Any = None) -> List[Any]:
         """Return the entire list"""
-        return super().get(name, default)
+        if name in self:
+            return self[name]
+        return default
+
+    def get_list(self, name: str) -> List[Any]:
+        """
+        以 list 获取，不存在返回空 list
+        """
+        return self.getlist(name, [])
+
+    def get_int(self, name: str, default: Optional[int] = None) -> Optional[int]:
+        """
+        获取 int，不存在或者无法转换返回 default
+        """
+        value = self._first(name)
+        if value is None:
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            return default
+
+    def get_bool(self, name: str, default: Optional[bool] = None) -> Optional[bool]:
+        """
+        获取 bool，支持 1/0, true/false, yes/no, on/off
+        """
+        value = self._first(name)
+        if value is None:
+            return default
+        value = value.lower()
+        if value in TRUE_VALUES:
+            return True
+        if value in FALSE_VALUES:
+            return False
+        return default
+
+    def values(self) -> Any:
+        return [self[name] for name in self]
+
+    def items(self) -> Any:
+        return [(name, self[name]) for name in self]
 
 
 class RequestUrl(object):
@@ -45,7 +135,9 @@ class RequestUrl(object):
         self.host = decode_bytes(url.host, coding)
         self.port = cast(Optional[int], url.port)
         self.path = cast(Optional[str], self.decode_bytes(url.path))
-        self.querystring = cast(Optional[str], self.decode_bytes(url.query))
+        self._querystring = cast(Optional[str], self.decode_bytes(url.query))
+        # 解析后的 query 缓存，修改 querystring 时清空
+        self._query = cast(Optional[RequestParameters], None)
         self.fragment = cast(Optional[str], self.decode_bytes(url.fragment))
         self.userinfo = cast(Optional[str], self.decode_bytes(url.userinfo))
 
@@ -54,11 +146,20 @@ class RequestUrl(object):
             return decode_bytes(data, self.coding)
         return None
 
+    @property
+    def querystring(self) -> Optional[str]:
+        return self._querystring
+
+    @querystring.setter
+    def querystring(self, query_str: Optional[str]) -> None:
+        self._querystring = query_str
+        self._query = None
+
     @property
     def query(self) -> Optional[RequestParameters]:
-        if self.querystring is not None:
-            return RequestParameters(parse_qs(self.querystring))
-        return None
+        if self._query is None and self._querystring is not None:
+            self._query = RequestParameters(parse_query(self._querystring, self.coding))
+        return self._query
 
     @query.setter
     def query(self, query_obj: Dict[str, str]) -> None:
@@ -68,9 +169,7 @@ class RequestUrl(object):
     def raw_query(self) -> Optional[Dict[str, str]]:
         query_obj = self.query
         if query_obj is not None:
-            return {
-                k: v[0] for k, v in query_obj.items() if v is not None and len(v) > 1
-            }
+            return {k: query_obj.get(k) for k in query_obj}
         return None
 
     @property
@@ -114,12 +213,24 @@ class Request(object):
         "_length",
         "_URL",
         "_cookies",
-        "_host",
+        "_memo",
         "_ssl",
         "_app",
         "_transport",
         "_socket",
         "_default_charset",
+        "_protocol",
+        "_high_water",
+        "_body_chunks",
+        "_body_size",
+        "_body_complete",
+        "_body_discard",
+        "_body_waiter",
+        "_body_exception",
+        "_body_cache",
+        "_parsed",
+        "_keep_alive",
+        "params",
         "response",
         "ctx",
         # "start_time"
@@ -130,13 +241,36 @@ class Request(object):
             loop: asyncio.AbstractEventLoop,
             handle: Callable[
                 [],
-                Generator[Any, None, None],
+                Optional[Generator[Any, None, None]],
             ],
             transport: Optional[asyncio.Transport] = None,
             charset: str = DEFAULT_REQUEST_CODING,
+            protocol: Any = None,
+            high_water: int = DEFAULT_READ_HIGH_WATER,
     ) -> None:
         self._loop = loop
-        self._headers = cast(HEADER_TYPE, {})
+        self._app = cast(Any, None)
+        self._default_charset = charset
+        self._high_water = high_water
+        self._body_chunks = cast(deque, deque())
+        # 复用时 response, ctx 保持关联
+        self.response = cast(Any, None)
+        self.ctx = cast(Any, None)
+        self.reset(handle, transport, protocol)
+
+    def reset(
+            self,
+            handle: Callable[
+                [],
+                Optional[Generator[Any, None, None]],
+            ],
+            transport: Optional[asyncio.Transport] = None,
+            protocol: Any = None,
+    ) -> None:
+        """
+        清空这次请求的状态，长连接的下一个 request 复用这个对象
+        """
+        self._headers = Headers()
         self._current_url = b""
         self._handle = handle
         self._parser = cast(HttpRequestParser, None)
@@ -144,18 +278,49 @@ class Request(object):
         self._version = cast(Optional[str], None)
         self._length = cast(Optional[int], None)
         self._URL = cast(Optional[RequestUrl], None)
-        self._cookies = Cookies()
-        self._host = ""
+        self._cookies = cast(Optional[Cookies], None)
+        # host, charset, type, length, schema 的缓存，set 时清空
+        self._memo = cast(Dict[str, Any], {})
         self._ssl = bool(transport is not None and transport.get_extra_info('sslcontext'))
         self._socket = cast(
             Optional[sys_socket],
             transport and transport.get_extra_info('socket'),
         )
         self._transport = transport
-        self._app = cast(Any, None)
-        self._default_charset = charset
-        self.response = cast(Any, None)
-        self.ctx = cast(Any, None)
+        # 提供 pause_reading, resume_reading 的 ServerProtocol
+        self._protocol = protocol
+        self._body_chunks.clear()
+        self._body_size = 0
+        self._body_complete = False
+        self._body_discard = False
+        self._body_waiter = cast(Optional[asyncio.Future], None)
+        self._body_exception = cast(Optional[Exception], None)
+        # form(), json() 读取的完整 body 和解析结果
+        self._body_cache = cast(Optional[bytes], None)
+        self._parsed = cast(Dict[str, Any], {})
+        self._keep_alive = cast(Optional[bool], None)
+        # 路由匹配到的 path 参数
+        self.params = cast(Dict[str, Any], {})
+
+    def clone(self) -> 'Request':
+        """
+        复制 url, headers 生成一个没有连接和 body 的 request，
+        用于在后台重新执行中间件
+        """
+        request = type(self)(
+            self._loop,
+            self._handle,
+            charset=self._default_charset,
+        )
+        request._headers = self._headers
+        request._current_url = self._current_url
+        request._method = self.method
+        request._version = self.version
+        request._ssl = self._ssl
+        request._keep_alive = self._keep_alive
+        request._body_complete = True
+        request.app = self._app
+        return request
 
     @property
     def default_charset(self) -> str:
@@ -200,40 +365,227 @@ class Request(object):
         """
         判断是否为 keep_alive 是开启长连接
         """
+        if self._keep_alive is not None:
+            return self._keep_alive
         if self._parser is not None:
             return self._parser.should_keep_alive()
         return None
 
     def on_url(self, url: bytes) -> None:
         """
-        httptools url callback
+        httptools url callback，url 跨多个数据包时会分多次回调
         """
-        self._current_url = url
+        self._current_url += url
 
     def on_header(self, name: bytes, value: bytes) -> None:
         """
         header 回调
         """
-        name_ = decode_bytes(name).casefold()
-        val = decode_bytes(value)
-        if name_ == "cookie":
-            # 加载上次的 cookie
-            self._cookies.load(val)
-        if name_ in self._headers:
-            # 多个相同的 header
-            old = self._headers[name_]
-            if isinstance(old, list):
-                old.append(val)
-            else:
-                self._headers[name_] = [old, val]
-        else:
-            self._headers[name_] = val
+        self._headers.add(name, value)
 
     def on_headers_complete(self) -> None:
         """
         header 回调完成
         """
-        self._loop.create_task(self._handle())
+        if self._parser is not None:
+            # body 接收完后 parser 的状态会被重置，这里先保存下来
+            self._keep_alive = self._parser.should_keep_alive()
+            self._method = decode_bytes(self._parser.get_method())
+            self._version = self._parser.get_http_version()
+        coro = self._handle()
+        if coro is not None:
+            self._loop.create_task(coro)
+
+    def on_body(self, body: bytes) -> None:
+        """
+        body 回调，放入缓冲区，超过 high_water 暂停读取 socket
+        """
+        if self._body_discard:
+            return
+        self._body_chunks.append(body)
+        self._body_size += len(body)
+        if self._protocol is not None and self._body_size > self._high_water:
+            self._protocol.pause_reading()
+        self._wakeup_body()
+
+    def on_message_complete(self) -> None:
+        """
+        body 接收完成
+        """
+        self._body_complete = True
+        self._wakeup_body()
+
+    def set_exception(self, exc: Exception) -> None:
+        """
+        连接断开等异常，唤醒等待 body 的读取
+        """
+        if self._body_complete:
+            return
+        self._body_exception = exc
+        self._wakeup_body()
+
+    def _wakeup_body(self) -> None:
+        """
+        唤醒等待 body 的读取
+        """
+        waiter = self._body_waiter
+        if waiter is not None:
+            self._body_waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _consume_body(self, size: int) -> None:
+        """
+        body 被读取，缓冲区低于 high_water 的一半恢复读取 socket
+        """
+        self._body_size -= size
+        if self._protocol is not None and self._body_size <= self._high_water >> 1:
+            self._protocol.resume_reading()
+
+    @property
+    def body_complete(self) -> bool:
+        """
+        body 是否已经全部接收
+        """
+        return self._body_complete
+
+    def discard_body(self) -> None:
+        """
+        丢弃未读取的 body，并恢复读取 socket
+        """
+        self._body_discard = True
+        size = self._body_size
+        self._body_chunks.clear()
+        self._consume_body(size)
+
+    @asyncio.coroutine
+    def read(self) -> Generator[Any, None, bytes]:
+        """
+        读取一块 body，读完后返回 b""
+        """
+        while not self._body_chunks:
+            if self._body_complete:
+                return b""
+            if self._body_exception is not None:
+                raise self._body_exception
+            if self._body_waiter is None:
+                self._body_waiter = self._loop.create_future()
+            yield from self._body_waiter
+        chunk = cast(bytes, self._body_chunks.popleft())
+        self._consume_body(len(chunk))
+        return chunk
+
+    @asyncio.coroutine
+    def read_all(self) -> Generator[Any, None, bytes]:
+        """
+        读取全部 body
+        """
+        chunks = cast(List[bytes], [])
+        while True:
+            chunk = yield from self.read()
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    @asyncio.coroutine
+    def body(self, max_size: Optional[int] = None) -> Generator[Any, None, bytes]:
+        """
+        读取并缓存全部 body，超过 max_size(默认 app.max_body_size) 抛出 RequestBodyTooLarge。
+        Content-Length 超过时不读取 body
+        """
+        if self._body_cache is not None:
+            return self._body_cache
+        if max_size is None:
+            max_size = self._app.max_body_size if self._app is not None else DEFAULT_MAX_BODY_SIZE
+        length = self.length
+        if max_size and length is not None and length > max_size:
+            self.discard_body()
+            raise RequestBodyTooLarge("request body is larger than %d bytes" % max_size)
+        chunks = cast(List[bytes], [])
+        size = 0
+        while True:
+            chunk = yield from self.read()
+            if not chunk:
+                break
+            size += len(chunk)
+            if max_size and size > max_size:
+                self.discard_body()
+                raise RequestBodyTooLarge("request body is larger than %d bytes" % max_size)
+            chunks.append(chunk)
+        self._body_cache = b"".join(chunks)
+        return self._body_cache
+
+    @asyncio.coroutine
+    def form(self, max_size: Optional[int] = None) -> Generator[Any, None, RequestParameters]:
+        """
+        解析 application/x-www-form-urlencoded 的 body，只解析一次，
+        其他类型返回空的 RequestParameters
+        """
+        parsed = self._parsed
+        if "form" in parsed:
+            return parsed["form"]
+        form = RequestParameters()
+        if (self.type or "").strip().lower() == "application/x-www-form-urlencoded":
+            body = yield from self.body(max_size)
+            if body:
+                charset = self.charset or "utf-8"
+                try:
+                    form.update(parse_query(decode_bytes(body, charset), charset))
+                except (LookupError, UnicodeDecodeError) as error:
+                    raise HTTPError(400, "invalid form body: %s" % error)
+        parsed["form"] = form
+        return form
+
+    @asyncio.coroutine
+    def json(self, max_size: Optional[int] = None) -> Generator[Any, None, Any]:
+        """
+        解析 application/json, application/*+json 的 body，只解析一次，
+        大的 body 在线程池中解析，其他类型或者空 body 返回 None
+        """
+        parsed = self._parsed
+        if "json" in parsed:
+            return parsed["json"]
+        data = None
+        type_str = (self.type or "").strip().lower()
+        if type_str == "application/json" or \
+                (type_str.startswith("application/") and type_str.endswith("+json")):
+            body = yield from self.body(max_size)
+            if body:
+                threshold = DEFAULT_JSON_EXECUTOR_THRESHOLD
+                if self._app is not None:
+                    threshold = self._app.json_executor_threshold
+                try:
+                    if threshold and len(body) >= threshold:
+                        data = yield from self._loop.run_in_executor(
+                            None,
+                            json_loads,
+                            body,
+                            self.charset,
+                        )
+                    else:
+                        data = json_loads(body, self.charset)
+                except (LookupError, ValueError) as error:
+                    # JSONDecodeError, UnicodeDecodeError 都是 ValueError
+                    raise HTTPError(400, "invalid json body: %s" % error)
+        parsed["json"] = data
+        return data
+
+    def __aiter__(self) -> 'Request':
+        """
+        async for chunk in request
+        """
+        return self
+
+    @asyncio.coroutine
+    def __anext__(self) -> Generator[Any, None, bytes]:
+        """
+        异步迭代 body
+        """
+        chunk = yield from self.read()
+        if not chunk:
+            raise StopAsyncIteration
+        return chunk
 
     @property
     def method(self) -> str:
@@ -274,6 +626,8 @@ class Request(object):
         设置app到
         """
         self._app = app
+        # schema, host 依赖 app.proxy
+        self._memo.clear()
 
     @property
     def proxy(self) -> bool:
@@ -296,34 +650,29 @@ class Request(object):
         """
         获取 body 长度
         """
-        len_ = self.get("content-length")
-        if len_ is not None:
-            return int(cast(str, len_))
-        return None
+        memo = self._memo
+        if "length" in memo:
+            return memo["length"]
+        len_ = self._headers.get("content-length")
+        length = None if len_ is None else int(cast(str, len_))
+        memo["length"] = length
+        return length
 
     def get(self, name: str) -> Union[None, str, List[str]]:
         """
         获取 header
         """
-        name = name.casefold()
+        name = name.lower()
         if name == "referer" or name == "referrer":
-            if "referrer" in self._headers:
-                return self._headers["referrer"]
-            elif "referer" in self._headers:
-                return self._headers["referer"]
-            else:
-                return None
-        elif name in self._headers:
-            return self._headers[name]
-        else:
-            return None
+            return self._headers.get("referrer") or self._headers.get("referer")
+        return self._headers.get(name)
 
     def set(self, name: str, value: str) -> None:
         """
         重写请求中的 header, 不推荐使用
         """
-        name = name.casefold()
         self._headers[name] = value
+        self._memo.clear()
 
     @property
     def url(self) -> str:
@@ -448,13 +797,18 @@ class Request(object):
         返回请求协议，“https” 或 “http”。
         当 app.proxy 是 true 时支持 X-Forwarded-Proto。
         """
+        memo = self._memo
+        if "schema" in memo:
+            return memo["schema"]
         if self._ssl:
-            return "https"
-        proxy = bool(self.app and self.app.proxy)
-        if not proxy:
-            return "http"
-        proto = cast(str, self.get("X-Forwarded-Proto") or "http")
-        return proto.split(",")[0].strip()
+            schema = "https"
+        elif not self.proxy:
+            schema = "http"
+        else:
+            proto = cast(str, self._headers.get("x-forwarded-proto") or "http")
+            schema = proto.split(",")[0].strip()
+        memo["schema"] = schema
+        return schema
 
     @property
     def protocol(self) -> str:
@@ -476,37 +830,49 @@ class Request(object):
         """
         获取 charset
         """
-        type_str = cast(str, self.get("Content-Type"))
-        if type_str is None or "charset" not in type_str:
-            return None
-        for i in type_str.split(";"):
-            item = i.strip()
-            if item.startswith("charset"):
-                return item.split("=")[1].strip()
-        return None
+        memo = self._memo
+        if "charset" in memo:
+            return memo["charset"]
+        charset = None
+        type_str = cast(Optional[str], self._headers.get("content-type"))
+        if type_str is not None and "charset" in type_str:
+            for i in type_str.split(";"):
+                item = i.strip()
+                if item.startswith("charset"):
+                    charset = item.split("=")[1].strip()
+                    break
+        memo["charset"] = charset
+        return charset
 
     @property
     def type(self) -> Optional[str]:
         """
         获取 type
         """
-        type_str = cast(Optional[str], self.get("Content-Type"))
+        memo = self._memo
+        if "type" in memo:
+            return memo["type"]
+        type_str = cast(Optional[str], self._headers.get("content-type"))
         if type_str is not None:
-            return type_str.split(";")[0]
-        else:
-            return None
+            type_str = type_str.split(";")[0]
+        memo["type"] = type_str
+        return type_str
 
     @property
     def host(self) -> str:
         """
         获取 host + port, 如果开启 proxy 开关。使用 X-Forwarded-Host 头
         """
+        memo = self._memo
+        if "host" in memo:
+            return memo["host"]
         host = cast(Optional[str], None)
-        if self.proxy and 'X-Forwarded-Host' in self._headers:
-            xhost = cast(Optional[str], self.get('X-Forwarded-Host'))
+        if self.proxy:
+            xhost = cast(Optional[str], self._headers.get("x-forwarded-host"))
             if xhost is not None:
                 host = xhost.split(",")[0].strip()
-        host = host or cast(str, self.get('Host'))
+        host = host or cast(str, self._headers.get("host"))
+        memo["host"] = host
         return host
 
     @property
@@ -521,8 +887,8 @@ class Request(object):
         """
         获取远端代理ip
         """
-        if self.proxy and "X-Forwarded-For" in self._headers:
-            val = cast(str, self.get('X-Forwarded-For'))
+        if self.proxy and "x-forwarded-for" in self._headers:
+            val = cast(str, self._headers.get("x-forwarded-for"))
             ips = [i.strip() for i in val.split(",")]
             return ips if len(ips) > 0 else None
         return None
@@ -545,19 +911,25 @@ class Request(object):
     @property
     def cookies(self) -> Cookies:
         """
-        在 on_headers_complete 回调后可以获得这次请求的 cookie
+        在 on_headers_complete 回调后可以获得这次请求的 cookie，第一次读取时才解析
         """
-        return self._cookies
+        cookies = self._cookies
+        if cookies is None:
+            cookies = self._cookies = Cookies()
+            raw = self._headers.get("cookie")
+            if raw is not None:
+                cookies.parse(raw)
+        return cookies
 
     @property
-    def headers(self) -> HEADER_TYPE:
+    def headers(self) -> Headers:
         """
         在 on_headers_complete 回调后可以获得这次请求的 headers
         """
         return self._headers
 
     @property
-    def header(self) -> HEADER_TYPE:
+    def header(self) -> Headers:
         """
         headers 的别名
         """
@@ -576,7 +948,7 @@ class Request(object):
         s = self.ctx.status
         if (s >= 200 and s < 300) or s == 304:
             return fresh(
-                self.headers,
+                cast(HEADER_TYPE, self._headers),
                 (self.response and self.response.headers) or {},
             )
         return False
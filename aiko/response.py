@@ -4,18 +4,32 @@
 """
 
 import asyncio
-import json
 import os
-from io import RawIOBase
+from collections.abc import Iterator as IteratorABC
+from io import RawIOBase, TextIOBase
 from socket import socket
-from typing import Any, cast, Dict, List, Optional, Union
+from typing import (
+    Any,
+    AsyncIterable,
+    cast,
+    Dict,
+    Generator,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 from .cookies import Cookies
+from .encoder import JSONEncoder
 from .utils import (
     DEFAULT_HTTP_VERSION,
     DEFAULT_RESPONSE_CODING,
+    DEFAULT_WRITE_HIGH_WATER,
     encode_str,
     HEADER_TYPE,
+    parse_range,
 )
 
 __all__ = [
@@ -85,6 +99,57 @@ STATUS_CODES = {
     511: b'Network Authentication Required',
 }
 
+# 不超过该长度的 body 和 headers 合并为一次写入
+MERGE_BODY_SIZE = 16 * 1024
+# 没有 app 时使用的 json 编码器
+DEFAULT_ENCODER = JSONEncoder()
+# 无法使用 sendfile 时每次读取文件的大小
+FILE_CHUNK_SIZE = 64 * 1024
+
+# 编码好的状态行 (version, status) -> bytes
+STATUS_LINES = cast(
+    Dict[Tuple[str, int], bytes],
+    {
+        (version, status): b"HTTP/%s %d %s\r\n" % (
+            encode_str(version),
+            status,
+            message,
+        )
+        for version in ("1.0", "1.1")
+        for status, message in STATUS_CODES.items()
+    },
+)
+
+# 编码好的常用 header 名
+HEADER_NAMES = cast(
+    Dict[str, bytes],
+    {
+        name: encode_str(name) + b": "
+        for name in (
+            "Accept-Ranges",
+            "Age",
+            "Allow",
+            "Cache-Control",
+            "Connection",
+            "Content-Encoding",
+            "Content-Length",
+            "Content-Range",
+            "Content-Type",
+            "Date",
+            "ETag",
+            "Expires",
+            "Last-Modified",
+            "Location",
+            "Retry-After",
+            "Server",
+            "Set-Cookie",
+            "Trailer",
+            "Transfer-Encoding",
+            "Vary",
+        )
+    },
+)
+
 DEFAULT_TYPE = cast(
     Dict[int, str],
     {
@@ -96,6 +161,33 @@ DEFAULT_TYPE = cast(
 )
 
 
+def read_file(file: Any, offset: int, size: int) -> bytes:
+    """
+    从 offset 读取文件，pread 不会修改文件的读取位置
+    """
+    pread = getattr(os, "pread", None)
+    if pread is not None:
+        return pread(file.fileno(), size, offset)
+    file.seek(offset)
+    return file.read(size) or b""
+
+
+def is_file(body: Any) -> bool:
+    """
+    body 是否为二进制文件: open(path, "rb") 和 open(path, "rb", buffering=0) 都可以 sendfile
+    """
+    return hasattr(body, "fileno") and hasattr(body, "seek") and not isinstance(body, TextIOBase)
+
+
+def is_stream(body: Any) -> bool:
+    """
+    body 是否需要流式发送: 同步迭代器, 异步迭代器
+    """
+    if isinstance(body, (bytes, str, list, dict)) or body is None or is_file(body):
+        return False
+    return isinstance(body, IteratorABC) or hasattr(body, "__aiter__")
+
+
 class Response(object):
     """
     响应类
@@ -114,6 +206,12 @@ class Response(object):
         "_charset",
         "_cookies",
         "_headers_sent",
+        "_corked",
+        "_corked_size",
+        "_uncork_waiter",
+        "_protocol",
+        "_file_range",
+        "_trailers",
         "type",
         "_app",
         "_default_charset",
@@ -124,18 +222,37 @@ class Response(object):
     def __init__(
             self,
             loop: asyncio.AbstractEventLoop,
-            transport: asyncio.Transport,
+            transport: Optional[asyncio.Transport],
             version: str = DEFAULT_HTTP_VERSION,
             charset: str = DEFAULT_RESPONSE_CODING,
+            protocol: Any = None,
     ) -> None:
         self._loop = loop
+        self._default_charset = charset
+        self._cookies = Cookies()
+        self._app = cast(Any, None)
+        # 复用时 request, ctx 保持关联
+        self.request = cast(Any, None)
+        self.ctx = cast(Any, None)
+        self.reset(transport, version, protocol)
+
+    def reset(
+            self,
+            transport: Optional[asyncio.Transport],
+            version: str = DEFAULT_HTTP_VERSION,
+            protocol: Any = None,
+    ) -> None:
+        """
+        清空这次响应的状态，长连接的下一个 request 复用这个对象。
+        transport 为 None 时写入的数据会被丢弃，用于在后台执行中间件
+        """
         self._transport = transport
         self._version = version
         self._socket = cast(
-            socket,
-            transport.get_extra_info("socket"),
+            Optional[socket],
+            transport and transport.get_extra_info("socket"),
         )
-        self._fileno = self._socket.fileno()
+        self._fileno = self._socket.fileno() if self._socket is not None else -1
         self._headers = cast(HEADER_TYPE, {})
         self._status = 200
         self._message = b"OK"
@@ -148,18 +265,27 @@ class Response(object):
                 List[Any],
                 Dict[Any, Any],
                 RawIOBase,
+                Iterator[Any],
+                AsyncIterable[Any],
                 None,
             ],
             None,
         )
         # self._body_type: int = BodyType.undefined
         self._charset = cast(Optional[str], None)
-        self._default_charset = charset
         self._headers_sent = False
-        self._cookies = Cookies()
-        self._app = cast(Any, None)
-        self.request = cast(Any, None)
-        self.ctx = cast(Any, None)
+        # pipelining 时前面的 response 未写完，写入的数据先缓冲
+        self._corked = cast(Optional[List[bytes]], None)
+        self._corked_size = 0
+        self._uncork_waiter = cast(Optional[asyncio.Future], None)
+        # 提供 drain 的 ServerProtocol
+        self._protocol = protocol
+        # 文件 body 需要发送的 (offset, count)
+        self._file_range = cast(Optional[Tuple[int, int]], None)
+        # chunked 结尾发送的 trailer headers
+        self._trailers = cast(Optional[Dict[str, str]], None)
+        # ContextCookie 引用了这个对象，只能清空
+        self._cookies.clear()
 
     @property
     def app(self) -> Any:
@@ -199,13 +325,19 @@ class Response(object):
         设置响应状态
         """
         self._status = status
-        self._message = STATUS_CODES[status]
+        # 未知的状态码在写出时动态生成状态行
+        self._message = STATUS_CODES.get(status, b"Unknown")
 
     def sync_write(self, data: bytes) -> None:
         """
         同步写入socket
         """
-        os.write(self._fileno, data)
+        if self._corked is not None:
+            self._corked.append(data)
+            self._corked_size += len(data)
+            return
+        if self._fileno >= 0:
+            os.write(self._fileno, data)
 
     def write(self, data: bytes, sync: bool = False) -> None:
         """
@@ -213,9 +345,60 @@ class Response(object):
         """
         if sync:
             self.sync_write(data)
-        else:
+        elif self._corked is not None:
+            self._corked.append(data)
+            self._corked_size += len(data)
+        elif self._transport is not None and not self._transport.is_closing():
             self._transport.write(data)
 
+    def cork(self) -> None:
+        """
+        暂停写入 socket，之后的写入先缓冲
+        """
+        if self._corked is None:
+            self._corked = []
+
+    def uncork(self) -> None:
+        """
+        写出缓冲的数据，恢复直接写入 socket
+        """
+        corked = self._corked
+        if corked is None:
+            return
+        self._corked = None
+        self._corked_size = 0
+        if corked:
+            self.write(b"".join(corked))
+        waiter = self._uncork_waiter
+        if waiter is not None:
+            self._uncork_waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+
+    @asyncio.coroutine
+    def drain(self) -> Generator[Any, None, None]:
+        """
+        等待写缓冲区低于 high water，写出大量数据时应该调用
+        """
+        protocol = self._protocol
+        high_water = DEFAULT_WRITE_HIGH_WATER
+        if protocol is not None:
+            high_water = protocol.write_high_water
+        if self._corked is not None and self._corked_size > high_water:
+            yield from self.wait_uncork()
+        if protocol is not None:
+            yield from protocol.drain()
+
+    @asyncio.coroutine
+    def wait_uncork(self) -> Generator[Any, None, None]:
+        """
+        pipelining 时等待前面的 response 写完
+        """
+        while self._corked is not None:
+            if self._uncork_waiter is None:
+                self._uncork_waiter = self._loop.create_future()
+            yield from self._uncork_waiter
+
     def get(self, name: str) -> Union[None, str, List[str]]:
         """
         获取 header
@@ -245,19 +428,44 @@ class Response(object):
         return self._headers
 
     @property
-    def body(self) -> Union[bytes, str, List[Any], Dict[Any, Any], RawIOBase, None]:
+    def body(self) -> Any:
         """
         获取body
         """
         return self._body
 
     @body.setter
-    def body(self, body: Union[bytes, str, list, dict, RawIOBase, None]) -> None:
+    def body(self, body: Any) -> None:
         """
-        设置body
+        设置body，支持 bytes, str, list, dict, 文件,
+        同步生成器, 异步生成器和异步迭代器 (使用 chunked 流式发送)
         """
         self._body = body
 
+    @property
+    def charset(self) -> str:
+        """
+        str body 使用的编码
+        """
+        return self._charset or self._default_charset
+
+    @charset.setter
+    def charset(self, charset: str) -> None:
+        """
+        设置 str body 使用的编码
+        """
+        self._charset = charset
+
+    @property
+    def trailers(self) -> Dict[str, str]:
+        """
+        chunked 流式发送结束时的 trailer headers，
+        在 headers 发送前设置的名字会写入 Trailer header
+        """
+        if self._trailers is None:
+            self._trailers = {}
+        return self._trailers
+
     def handel_default(self) -> None:
         """
         处理设置到body上的数据默认 headers
@@ -279,15 +487,28 @@ class Response(object):
         elif isinstance(raw_body, (list, dict)):
             # body 为json
             default_type = 3
-            body = encode_str(json.dumps(raw_body, ensure_ascii=False), charset)
-        elif isinstance(raw_body, RawIOBase):
+            encoder = self._app.json_encoder if self._app is not None else DEFAULT_ENCODER
+            if encoder.should_stream(raw_body):
+                # 大的 list 分块编码写出
+                raw_body = self._body = encoder.iter_encode(cast(List[Any], raw_body), charset)
+                self.handle_stream()
+            else:
+                body = encoder.encode(raw_body, charset)
+        elif is_file(raw_body):
             # body 为文件
             default_type = 1
-            body = raw_body.read()
-            raw_body.close()
+            file = cast(Any, raw_body)
+            if not self.handle_file(file):
+                body = file.read()
+                file.close()
+        elif is_stream(raw_body):
+            # body 为生成器或异步迭代器
+            default_type = 1
+            self.handle_stream()
         if "Content-Length" not in self._headers and \
-                "Transfer-Encoding" not in self._headers \
-                or self._headers["Transfer-Encoding"] != "chunked":
+                self._headers.get("Transfer-Encoding") != "chunked" and \
+                (self.length is not None or not is_stream(raw_body)):
+            # 没有长度的流式 body 不设置 Content-Length
             if self.length is None:
                 if body is not None:
                     self.length = len(body)
@@ -309,45 +530,247 @@ class Response(object):
             if type_str is not None:
                 # 设置默认 Content-Type
                 self.set("Content-Type", type_str)
-        self._body = body
+        if self._file_range is None and not is_stream(raw_body):
+            self._body = body
 
-    def flush_headers(self, sync: bool = False) -> None:
+    def handle_stream(self) -> None:
         """
-        通过异步写入 header
+        流式 body 没有设置 Content-Length 时，http/1.1 使用 chunked，
+        http/1.0 发送完后关闭连接
         """
-        if self._headers_sent:
+        if "Content-Length" in self._headers or self.length is not None:
             return
-        self._headers_sent = True
+        if self._version == "1.0":
+            self.set("Connection", "close")
+            return
+        self.set("Transfer-Encoding", "chunked")
+        if self._trailers:
+            self.set("Trailer", ", ".join(self._trailers.keys()))
+
+    def handle_file(self, file: Any) -> bool:
+        """
+        设置文件 body 的长度，处理 Range, If-Range 请求。
+        文件不支持 fileno 时返回 False，已经处理过时不再修改范围
+        """
+        if self._file_range is not None:
+            return True
+        try:
+            size = os.fstat(file.fileno()).st_size
+        except (OSError, ValueError):
+            return False
+        offset, count = 0, size
+        if self._status == 200:
+            self.set("Accept-Ranges", "bytes")
+            request = self.request
+            range_str = request and request.method == "GET" and request.get("range")
+            if range_str and self._if_range(request.get("if-range")):
+                byte_range = parse_range(range_str, size)
+                if byte_range is not None:
+                    start, end = byte_range
+                    if start >= size:
+                        self.status = 416
+                        self.set("Content-Range", "bytes */%d" % size)
+                        count = 0
+                    else:
+                        self.status = 206
+                        self.set("Content-Range", "bytes %d-%d/%d" % (start, end, size))
+                        offset, count = start, end - start + 1
+                    self._headers.pop("Content-Length", None)
+        self.length = count
+        self._file_range = (offset, count)
+        return True
+
+    def _if_range(self, if_range: Any) -> bool:
+        """
+        If-Range 为空或者与 ETag, Last-Modified 相同时返回 Range 的内容
+        """
+        if not if_range:
+            return True
+        if if_range.startswith('"') or if_range.startswith("W/"):
+            etag = self.get("ETag")
+            # 弱 ETag 不能用于 Range
+            return etag is not None and etag == if_range and not if_range.startswith("W/")
+        return self.get("Last-Modified") == if_range
+
+    @property
+    def body_allowed(self) -> bool:
+        """
+        HEAD 请求和 1xx, 204, 304 的响应不发送 body
+        """
+        status = self._status
+        if status < 200 or status == 204 or status == 304:
+            return False
+        request = self.request
+        return request is None or request.method != "HEAD"
+
+    def serialize_headers(self) -> bytes:
+        """
+        设置默认 headers，把状态行和 headers 序列化到一个 bytes
+        """
         self.handel_default()
-        self.write(
-            b"HTTP/%s %d %s\r\n" % (
+        status_line = STATUS_LINES.get((self._version, self._status))
+        if status_line is None:
+            status_line = STATUS_LINES[(self._version, self._status)] = b"HTTP/%s %d %s\r\n" % (
                 encode_str(self._version),
                 self._status,
                 self._message,
-            ),
-            sync,
-        )
+            )
+        buffer = [status_line]
+        append = buffer.append
+        state = self._protocol and self._protocol.state
+        if state is not None:
+            # 每秒刷新一次的 Date 和 Server
+            if "Date" not in self._headers:
+                append(state.date_header)
+            if state.server_header and "Server" not in self._headers:
+                append(state.server_header)
         for name, value in self._headers.items():
-            name_byte = encode_str(name)
+            name_byte = HEADER_NAMES.get(name)
+            if name_byte is None:
+                name_byte = encode_str(name) + b": "
             if isinstance(value, list):
                 for val in value:
-                    self.write(
-                        b"%s: %s\r\n" % (
-                            name_byte,
-                            encode_str(val),
-                        ),
-                        sync,
-                    )
+                    append(name_byte)
+                    append(encode_str(val))
+                    append(b"\r\n")
             else:
-                val = value
-                self.write(
-                    b"%s: %s\r\n" % (
-                        name_byte,
-                        encode_str(value),
-                    ),
-                    sync,
+                append(name_byte)
+                append(encode_str(value))
+                append(b"\r\n")
+        append(b"\r\n")
+        return b"".join(buffer)
+
+    def flush_headers(self, sync: bool = False) -> None:
+        """
+        通过异步写入 header
+        """
+        if self._headers_sent:
+            return
+        self._headers_sent = True
+        self.write(self.serialize_headers(), sync)
+
+    @asyncio.coroutine
+    def flush(self) -> Generator[Any, None, None]:
+        """
+        写出 headers, body 并等待写缓冲区 drain
+        小的 body 和 headers 合并为一次写入
+        """
+        if self._headers_sent:
+            if is_file(self._body):
+                yield from self.send_file(self._body)
+            elif is_stream(self._body):
+                yield from self.send_stream(self._body)
+            elif self.flush_body():
+                yield from self.drain()
+            return
+        self._headers_sent = True
+        head = self.serialize_headers()
+        body = self._body
+        if not self.body_allowed:
+            self.write(head)
+            if is_file(body):
+                cast(Any, body).close()
+            return
+        if is_file(body):
+            self.write(head)
+            yield from self.send_file(body)
+            return
+        if is_stream(body):
+            self.write(head)
+            yield from self.send_stream(body)
+            return
+        if not isinstance(body, bytes) or not body:
+            self.write(head)
+            return
+        if len(body) <= MERGE_BODY_SIZE:
+            self.write(head + body)
+        else:
+            self.write(head)
+            self.write(body)
+        yield from self.drain()
+
+    @asyncio.coroutine
+    def send_file(self, file: Any) -> Generator[Any, None, None]:
+        """
+        发送文件 body，优先使用 loop.sendfile (零拷贝)，
+        TLS 或者不支持时在线程池中分块读取文件
+        """
+        offset, count = self._file_range or (0, 0)
+        try:
+            if count <= 0 or self._transport is None:
+                return
+            sendfile = getattr(self._loop, "sendfile", None)
+            if sendfile is not None and not self._transport.get_extra_info("sslcontext"):
+                # sendfile 直接写入 socket，需要前面的 response 已经写完
+                yield from self.wait_uncork()
+                try:
+                    yield from sendfile(self._transport, file, offset, count, fallback=False)
+                    return
+                except (NotImplementedError, RuntimeError):
+                    # SendfileNotAvailableError
+                    pass
+            while count > 0:
+                chunk = yield from self._loop.run_in_executor(
+                    None,
+                    read_file,
+                    file,
+                    offset,
+                    min(count, FILE_CHUNK_SIZE),
                 )
-        self.write(b"\r\n", sync)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                count -= len(chunk)
+                self.write(chunk)
+                yield from self.drain()
+        finally:
+            file.close()
+
+    async def send_stream(self, stream: Any) -> None:
+        """
+        流式发送生成器或者异步迭代器，每块之间等待 drain
+        """
+        chunked = self._headers.get("Transfer-Encoding") == "chunked"
+        charset = self._charset or self._default_charset
+        try:
+            if hasattr(stream, "__aiter__"):
+                async for chunk in stream:
+                    await self.write_chunk(chunk, chunked, charset)
+            else:
+                for chunk in stream:
+                    await self.write_chunk(chunk, chunked, charset)
+        except Exception:
+            # 已经发送了 headers 无法再返回错误，只能关闭连接
+            if self._transport is not None:
+                self._transport.close()
+            raise
+        if chunked:
+            self.write(self.serialize_trailers())
+
+    async def write_chunk(self, chunk: Any, chunked: bool, charset: str) -> None:
+        """
+        写出一块流式 body
+        """
+        if isinstance(chunk, str):
+            chunk = encode_str(chunk, charset)
+        if not chunk:
+            return
+        if chunked:
+            chunk = b"%x\r\n%s\r\n" % (len(chunk), chunk)
+        self.write(chunk)
+        await self.drain()
+
+    def serialize_trailers(self) -> bytes:
+        """
+        chunked 的结束块和 trailer headers
+        """
+        if not self._trailers:
+            return b"0\r\n\r\n"
+        buffer = [b"0\r\n"]
+        for name, value in self._trailers.items():
+            buffer.append(b"%s: %s\r\n" % (encode_str(name), encode_str(value)))
+        buffer.append(b"\r\n")
+        return b"".join(buffer)
 
     def flush_body(self) -> bool:
         """
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+压缩前缀树(radix tree)路由，查找耗时与 path 长度相关，与路由数量无关
+"""
+
+import re
+from typing import (
+    Any,
+    Callable,
+    cast,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from .compose import compose, DISPATCH_TYPE, MIDDLEWARE_TYPE, NEXT_CALL_TYPE
+
+__all__ = [
+    "CONVERTERS",
+    "Router",
+]
+
+INT_PATTERN = re.compile(r"-?[0-9]+")
+FLOAT_PATTERN = re.compile(r"-?[0-9]+(?:\.[0-9]+)?")
+
+
+def to_int(segment: str) -> int:
+    """
+    只接受十进制数字，int() 还会接受 1_000, 空格和全角数字
+    """
+    if INT_PATTERN.fullmatch(segment) is None:
+        raise ValueError("invalid int: %s" % segment)
+    return int(segment)
+
+
+def to_float(segment: str) -> float:
+    """
+    只接受十进制小数，float() 还会接受 nan, inf, 1e3
+    """
+    if FLOAT_PATTERN.fullmatch(segment) is None:
+        raise ValueError("invalid float: %s" % segment)
+    return float(segment)
+
+
+# 参数类型转换，转换失败(ValueError)视为不匹配
+CONVERTERS = cast(Dict[str, Callable[[str], Any]], {
+    "str": str,
+    "int": to_int,
+    "float": to_float,
+})
+# 匹配剩余的全部 path，只能在最后
+PATH_CONVERTER = "path"
+# 同一位置有多个参数节点时的匹配顺序
+CONVERTER_ORDER = ("int", "float", "str")
+PARAM_PATTERN = re.compile(r"\{(\w+)(?::(\w+))?\}")
+ROUTER_METHODS = ("GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS")
+
+
+class Node(object):
+    """
+    路由树节点，静态子节点以首字符为 key，参数节点按类型优先级排序
+    """
+    __slots__ = [
+        "prefix",
+        "children",
+        "params",
+        "name",
+        "converter",
+        "catch_all",
+        "handlers",
+    ]
+
+    def __init__(
+            self,
+            prefix: str = "",
+            name: Optional[str] = None,
+            converter: Optional[str] = None,
+    ) -> None:
+        self.prefix = prefix
+        self.children = cast(Dict[str, 'Node'], {})
+        self.params = cast(List['Node'], [])
+        # 参数节点的参数名和类型
+        self.name = name
+        self.converter = converter
+        self.catch_all = cast(Optional['Node'], None)
+        self.handlers = cast(Dict[str, DISPATCH_TYPE], {})
+
+    def insert_static(self, path: str) -> 'Node':
+        """
+        插入静态的 path，必要时拆分已有节点，返回 path 结尾的节点
+        """
+        node = self
+        while path:
+            child = node.children.get(path[0])
+            if child is None:
+                child = node.children[path[0]] = Node(path)
+                return child
+            prefix = child.prefix
+            max_len = min(len(prefix), len(path))
+            index = 1
+            while index < max_len and prefix[index] == path[index]:
+                index += 1
+            if index < len(prefix):
+                # 拆分为公共前缀节点
+                split = Node(prefix[:index])
+                child.prefix = prefix[index:]
+                split.children[child.prefix[0]] = child
+                node.children[path[0]] = split
+                child = split
+            path = path[index:]
+            node = child
+        return node
+
+    def insert_param(self, name: str, converter: str) -> 'Node':
+        """
+        插入参数节点
+        """
+        if converter == PATH_CONVERTER:
+            if self.catch_all is None:
+                self.catch_all = Node(name=name, converter=converter)
+            elif self.catch_all.name != name:
+                raise ValueError(
+                    "conflicting parameter name: %s, %s" % (self.catch_all.name, name),
+                )
+            return self.catch_all
+        for child in self.params:
+            if child.converter == converter:
+                if child.name != name:
+                    raise ValueError(
+                        "conflicting parameter name: %s, %s" % (child.name, name),
+                    )
+                return child
+        child = Node(name=name, converter=converter)
+        self.params.append(child)
+        self.params.sort(key=lambda item: CONVERTER_ORDER.index(cast(str, item.converter)))
+        return child
+
+    def accept(self, method: Optional[str], allow: Optional[Set[str]]) -> bool:
+        """
+        节点是否有 method 的 handler，method 为 None 时只要有 handler，
+        不支持时把节点已有的方法加入 allow
+        """
+        handlers = self.handlers
+        if not handlers:
+            return False
+        if method is None or method in handlers or (method == "HEAD" and "GET" in handlers):
+            return True
+        if allow is not None:
+            allow.update(handlers)
+        return False
+
+    def lookup(
+            self,
+            path: str,
+            pos: int,
+            params: Dict[str, Any],
+            method: Optional[str] = None,
+            allow: Optional[Set[str]] = None,
+    ) -> Optional['Node']:
+        """
+        从 pos 开始匹配 path，优先级为 静态 > 参数 > path 参数，
+        匹配的节点不支持 method 时继续尝试优先级更低的分支
+        """
+        if pos == len(path):
+            return self if self.accept(method, allow) else None
+        child = self.children.get(path[pos])
+        if child is not None and path.startswith(child.prefix, pos):
+            node = child.lookup(path, pos + len(child.prefix), params, method, allow)
+            if node is not None:
+                return node
+        if self.params:
+            end = path.find("/", pos)
+            if end == -1:
+                end = len(path)
+            if end > pos:
+                segment = path[pos:end]
+                for child in self.params:
+                    try:
+                        value = CONVERTERS[cast(str, child.converter)](segment)
+                    except ValueError:
+                        continue
+                    node = child.lookup(path, end, params, method, allow)
+                    if node is not None:
+                        params[cast(str, child.name)] = value
+                        return node
+        catch_all = self.catch_all
+        if catch_all is not None and catch_all.accept(method, allow):
+            params[cast(str, catch_all.name)] = path[pos:]
+            return catch_all
+        return None
+
+
+def split_path(path: str) -> List[Union[str, Tuple[str, str]]]:
+    """
+    把路由拆分为静态字符串和 (参数名, 类型)
+    """
+    tokens = cast(List[Union[str, Tuple[str, str]]], [])
+    pos = 0
+    for match in PARAM_PATTERN.finditer(path):
+        start, end = match.span()
+        name, converter = match.group(1), match.group(2) or "str"
+        if converter != PATH_CONVERTER and converter not in CONVERTERS:
+            raise ValueError("unknown converter: %s" % converter)
+        if end != len(path) and (converter == PATH_CONVERTER or path[end] != "/"):
+            raise ValueError("parameter must end the path segment: %s" % path)
+        if start > pos:
+            tokens.append(path[pos:start])
+        tokens.append((name, converter))
+        pos = end
+    if pos < len(path):
+        tokens.append(path[pos:])
+    return tokens
+
+
+class Router(object):
+    """
+    路由中间件
+        router = Router()
+
+        @router.get("/users/{id:int}")
+        def user(ctx, next_call):
+            return "user %d" % ctx.params["id"]
+
+        app.use(router)
+    :param prefix: 所有路由的前缀
+    """
+
+    __slots__ = [
+        "prefix",
+        "_root",
+        "_static",
+    ]
+
+    def __init__(self, prefix: str = "") -> None:
+        self.prefix = prefix
+        self._root = Node()
+        # 没有参数的路由直接查表
+        self._static = cast(Dict[str, Node], {})
+
+    def add(
+            self,
+            methods: Union[str, List[str], Tuple[str, ...]],
+            path: str,
+            *handlers: MIDDLEWARE_TYPE,
+    ) -> None:
+        """
+        添加路由，多个 handler 会像中间件一样组合起来
+        """
+        if isinstance(methods, str):
+            methods = [methods]
+        path = self.prefix + path
+        tokens = split_path(path)
+        node = self._root
+        for token in tokens:
+            if isinstance(token, str):
+                node = node.insert_static(token)
+            else:
+                node = node.insert_param(*token)
+        dispatch = compose(list(handlers))
+        for method in methods:
+            method = method.upper()
+            if method in node.handlers:
+                raise ValueError("duplicate route: %s %s" % (method, path))
+            node.handlers[method] = dispatch
+        if all(isinstance(token, str) for token in tokens):
+            self._static[path] = node
+
+    def route(
+            self,
+            methods: Union[str, List[str], Tuple[str, ...]],
+            path: str,
+            *handlers: MIDDLEWARE_TYPE,
+    ) -> Any:
+        """
+        没有 handler 时作为装饰器使用
+        """
+        if handlers:
+            self.add(methods, path, *handlers)
+            return None
+
+        def decorator(handler: MIDDLEWARE_TYPE) -> MIDDLEWARE_TYPE:
+            """
+            装饰器
+            """
+            self.add(methods, path, handler)
+            return handler
+        return decorator
+
+    def get(self, path: str, *handlers: MIDDLEWARE_TYPE) -> Any:
+        return self.route("GET", path, *handlers)
+
+    def post(self, path: str, *handlers: MIDDLEWARE_TYPE) -> Any:
+        return self.route("POST", path, *handlers)
+
+    def put(self, path: str, *handlers: MIDDLEWARE_TYPE) -> Any:
+        return self.route("PUT", path, *handlers)
+
+    def patch(self, path: str, *handlers: MIDDLEWARE_TYPE) -> Any:
+        return self.route("PATCH", path, *handlers)
+
+    def delete(self, path: str, *handlers: MIDDLEWARE_TYPE) -> Any:
+        return self.route("DELETE", path, *handlers)
+
+    def head(self, path: str, *handlers: MIDDLEWARE_TYPE) -> Any:
+        return self.route("HEAD", path, *handlers)
+
+    def options(self, path: str, *handlers: MIDDLEWARE_TYPE) -> Any:
+        return self.route("OPTIONS", path, *handlers)
+
+    def all(self, path: str, *handlers: MIDDLEWARE_TYPE) -> Any:
+        return self.route(ROUTER_METHODS, path, *handlers)
+
+    def match(
+            self,
+            path: str,
+            method: Optional[str] = None,
+            allow: Optional[Set[str]] = None,
+    ) -> Tuple[Optional[Node], Dict[str, Any]]:
+        """
+        查找 path 对应的节点和参数，method 不为 None 时只匹配支持 method 的路由，
+        path 匹配但不支持 method 的路由的方法加入 allow
+        """
+        params = cast(Dict[str, Any], {})
+        node = self._static.get(path)
+        if node is None or not node.accept(method, allow):
+            node = self._root.lookup(path, 0, params, method, allow)
+        return node, params
+
+    async def __call__(self, ctx: Any, next_call: NEXT_CALL_TYPE) -> None:
+        """
+        作为中间件使用，没有匹配的路由时调用下一个中间件
+        """
+        request = ctx.request
+        method = request.method
+        allow = cast(Set[str], set())
+        node, params = self.match(request.path or "/", method, allow)
+        if node is None:
+            if not allow:
+                await next_call()
+                return
+            # path 匹配的路由都不支持 method
+            if "GET" in allow:
+                allow.add("HEAD")
+            response = ctx.response
+            response.status = 405
+            response.set("Allow", ", ".join(sorted(allow)))
+            response.body = b"Method Not Allowed"
+            return
+        handlers = node.handlers
+        dispatch = handlers.get(method)
+        if dispatch is None:
+            dispatch = handlers["GET"]
+        request.params = params
+        await dispatch(ctx, next_call)
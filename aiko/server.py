@@ -4,24 +4,220 @@
 """
 
 import asyncio
-from typing import Any, Callable, cast, Generator, Optional
+from collections import deque
+from time import time
+from typing import Any, Awaitable, Callable, cast, Generator, List, Optional, Set, Type
 
-from httptools import HttpRequestParser
+from httptools import HttpParserError, HttpRequestParser
 
 from .request import Request
 from .response import Response
+from .timer import TimerHandle, TimerWheel
 from .utils import (
+    DEFAULT_BODY_TIMEOUT,
+    DEFAULT_HEADER_TIMEOUT,
     DEFAULT_HTTP_VERSION,
+    DEFAULT_KEEP_ALIVE_TIMEOUT,
+    DEFAULT_READ_HIGH_WATER,
     DEFAULT_REQUEST_CODING,
     DEFAULT_RESPONSE_CODING,
+    DEFAULT_WRITE_HIGH_WATER,
+    encode_str,
+    format_http_date,
 )
 
-__all__ = ["ServerProtocol"]
+__all__ = [
+    "ServerProtocol",
+    "ServerState",
+]
+
+BAD_REQUEST = (
+    b"HTTP/1.1 400 Bad Request\r\n"
+    b"Content-Length: 0\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+)
+URI_TOO_LONG = (
+    b"HTTP/1.1 414 URI Too Long\r\n"
+    b"Content-Length: 0\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+)
+HEADER_TOO_LARGE = (
+    b"HTTP/1.1 431 Request Header Fields Too Large\r\n"
+    b"Content-Length: 0\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+)
+REQUEST_TIMEOUT = (
+    b"HTTP/1.1 408 Request Timeout\r\n"
+    b"Content-Length: 0\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+)
+
+
+def service_unavailable(retry_after: int) -> bytes:
+    """
+    生成过载时返回的 503
+    """
+    return (
+        b"HTTP/1.1 503 Service Unavailable\r\n"
+        b"Retry-After: %d\r\n"
+        b"Content-Length: 0\r\n"
+        b"Connection: close\r\n"
+        b"\r\n"
+    ) % retry_after
+
+
+def internal_server_error(keep_alive: bool) -> bytes:
+    """
+    生成 handle 抛出异常时返回的 500
+    """
+    return (
+        b"HTTP/1.1 500 Internal Server Error\r\n"
+        b"Content-Length: 0\r\n"
+        b"%s"
+        b"\r\n"
+    ) % (b"" if keep_alive else b"Connection: close\r\n")
+
+
+class ServerState(object):
+    """
+    同一个 worker 所有连接共享的状态，用于限制连接数和并发处理的 request 数
+    """
+    __slots__ = [
+        "connections",
+        "in_flight",
+        "requests",
+        "max_connections",
+        "max_concurrency",
+        "service_unavailable",
+        "date_header",
+        "server_header",
+        "pool",
+        "pool_size",
+        "draining",
+        "_date_handle",
+        "_drain_waiter",
+    ]
+
+    def __init__(
+            self,
+            max_connections: int = 0,
+            max_concurrency: int = 0,
+            retry_after: int = 1,
+            server_name: Optional[str] = None,
+            pool_size: int = 0,
+    ) -> None:
+        self.connections = cast(Set['ServerProtocol'], set())
+        # 正在执行 handle 的 request 数
+        self.in_flight = 0
+        # 处理过的 request 总数
+        self.requests = 0
+        # 0 为不限制
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.service_unavailable = service_unavailable(retry_after)
+        # 编码好的 Date, Server header，Date 每秒刷新一次
+        self.date_header = b""
+        self.server_header = b""
+        if server_name:
+            self.server_header = b"Server: %s\r\n" % encode_str(server_name)
+        # 连接关闭后留下的 request(带着关联的 response, ctx)，给新连接复用
+        self.pool = cast(List[Request], [])
+        self.pool_size = pool_size
+        # 正在关闭，不再接受新的 request
+        self.draining = False
+        self._date_handle = cast(Optional[asyncio.TimerHandle], None)
+        self._drain_waiter = cast(Optional[asyncio.Future], None)
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        开始每秒刷新 Date header
+        """
+        if self._date_handle is None:
+            self._refresh_date(loop)
+
+    def close(self) -> None:
+        """
+        停止刷新 Date header
+        """
+        if self._date_handle is not None:
+            self._date_handle.cancel()
+            self._date_handle = None
+
+    @asyncio.coroutine
+    def shutdown(
+            self,
+            loop: asyncio.AbstractEventLoop,
+            timeout: Optional[float] = None,
+    ) -> Generator[Any, None, bool]:
+        """
+        关闭所有连接: 空闲的连接立即关闭，处理中的连接在下一个 response 带上
+        Connection: close 并在写完后关闭。最多等待 timeout 秒，超时强制断开。
+        全部正常关闭返回 True
+        """
+        self.draining = True
+        for connection in list(self.connections):
+            connection.shutdown()
+        drained = True
+        if not self.drained:
+            self._drain_waiter = loop.create_future()
+            try:
+                yield from asyncio.wait_for(
+                    asyncio.shield(self._drain_waiter),
+                    timeout,
+                )
+            except asyncio.TimeoutError:
+                drained = False
+            finally:
+                self._drain_waiter = None
+        for connection in list(self.connections):
+            connection.abort()
+        self.pool.clear()
+        return drained
+
+    @property
+    def drained(self) -> bool:
+        """
+        没有连接和处理中的 request
+        """
+        return not self.connections and self.in_flight <= 0
+
+    def check_drained(self) -> None:
+        """
+        连接关闭或 request 处理完成时检查是否可以结束 shutdown
+        """
+        waiter = self._drain_waiter
+        if waiter is not None and not waiter.done() and self.drained:
+            waiter.set_result(None)
+
+    def _refresh_date(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        刷新 Date header，在下一秒开始时再次刷新
+        """
+        now = time()
+        self.date_header = b"Date: %s\r\n" % encode_str(format_http_date(now))
+        self._date_handle = loop.call_later(
+            1 - now % 1,
+            self._refresh_date,
+            loop,
+        )
+
+    @property
+    def overloaded(self) -> bool:
+        """
+        并发处理的 request 是否达到上限
+        """
+        return bool(self.max_concurrency and self.in_flight >= self.max_concurrency)
 
 
 class ServerProtocol(asyncio.Protocol):
     """
     http Protocol
+    每个连接一个 parser，支持 pipelining:
+    解析出的 request 并发执行，response 按 request 的顺序写出。
     """
 
     def __init__(
@@ -32,68 +228,442 @@ class ServerProtocol(asyncio.Protocol):
                     Request,
                     Response,
                 ],
-                Generator[Any, None, None],
+                Awaitable[None],
             ],
             requset_charset: str = DEFAULT_REQUEST_CODING,
             response_charset: str = DEFAULT_RESPONSE_CODING,
+            read_high_water: int = DEFAULT_READ_HIGH_WATER,
+            write_high_water: int = DEFAULT_WRITE_HIGH_WATER,
+            timer: Optional[TimerWheel] = None,
+            keep_alive_timeout: Optional[float] = DEFAULT_KEEP_ALIVE_TIMEOUT,
+            header_timeout: Optional[float] = DEFAULT_HEADER_TIMEOUT,
+            body_timeout: Optional[float] = DEFAULT_BODY_TIMEOUT,
+            max_requests: int = 0,
+            max_url_size: int = 0,
+            max_header_fields: int = 0,
+            max_header_field_size: int = 0,
+            state: Optional[ServerState] = None,
+            request_class: Type[Request] = Request,
+            response_class: Type[Response] = Response,
+            reuse: bool = True,
     ) -> None:
         self._loop = loop
         self._transport = cast(Optional[asyncio.Transport], None)
+        self._parser = cast(Optional[HttpRequestParser], None)
+        # 正在解析的 request
         self._request = cast(Optional[Request], None)
-        self._response = cast(Optional[Response], None)
+        # 已解析完 header 的 [request, response, 是否完成, keep_alive]，按顺序写出
+        self._pipeline = cast(deque, deque())
         self._handle = handle
         self._requset_charset = requset_charset
         self._response_charset = response_charset
+        self._read_high_water = read_high_water
+        self._reading_paused = False
+        self.write_high_water = write_high_water
+        self._writing_paused = False
+        self._drain_waiter = cast(Optional[asyncio.Future], None)
+        # 超时由 Application 共享的 TimerWheel 驱动，同时只有一个超时
+        self._timer = timer
+        self._timeout = cast(Optional[TimerHandle], None)
+        self._keep_alive_timeout = keep_alive_timeout
+        self._header_timeout = header_timeout
+        self._body_timeout = body_timeout
+        # 每个连接最多处理多少个 request，0 为不限制
+        self._max_requests = max_requests
+        self._requests_count = 0
+        # url 长度, header 数量, 单个 header 长度的上限，0 为不限制
+        self._max_url_size = max_url_size
+        self._max_header_fields = max_header_fields
+        self._max_header_field_size = max_header_field_size
+        self._url_size = 0
+        self._header_fields = 0
+        # parser 回调中拒绝 request 时返回的响应
+        self._error_response = BAD_REQUEST
+        self._state = state
+        # 收到不保持连接的 request 后，不再处理后续的 request
+        self._closing = False
+        self._request_class = request_class
+        self._response_class = response_class
+        # 长连接的下一个 request 复用处理完的 request, response, ctx
+        self._reuse = reuse
+        self._spare = cast(Optional[Request], None)
+
+    @property
+    def state(self) -> Optional[ServerState]:
+        """
+        所有连接共享的状态
+        """
+        return self._state
 
     def connection_made(self, transport: Any) -> None:
         """
         Called when a connection is made.
         """
         self._transport = transport
+        state = self._state
+        if state is not None:
+            if state.draining:
+                # 关闭中 accept 到的连接
+                self._closing = True
+                transport.close()
+                return
+            if state.max_connections and len(state.connections) >= state.max_connections:
+                # 连接数超过上限，不再读取直接返回 503
+                self._closing = True
+                transport.pause_reading()
+                transport.write(state.service_unavailable)
+                transport.close()
+                return
+            state.connections.add(self)
+        self._parser = HttpRequestParser(self)
+        transport.set_write_buffer_limits(high=self.write_high_water)
+        self._set_timeout(self._header_timeout)
 
     def connection_lost(self, exc: Exception) -> None:
         """
         socket 断开连接
         """
+        error = exc or ConnectionResetError("Connection lost")
+        if self._request is not None:
+            self._request.set_exception(error)
+        for request, response, _, _ in self._pipeline:
+            request.set_exception(error)
+            # 唤醒等待 uncork 的 drain
+            response.uncork()
+        self._pipeline.clear()
         self._transport = None
+        self._parser = None
         self._request = None
-        # self._request_parser = None
+        self._set_timeout(None)
+        self._wakeup_drain()
+        state = self._state
+        if state is not None:
+            state.connections.discard(self)
+            spare = self._spare
+            if spare is not None and len(state.pool) < state.pool_size and not state.draining:
+                state.pool.append(spare)
+            state.check_drained()
+        self._spare = None
+
+    def shutdown(self) -> None:
+        """
+        不再处理新的 request，空闲时立即关闭，
+        否则最后一个 response 带上 Connection: close，写完后关闭
+        """
+        self._closing = True
+        if self._transport is None:
+            return
+        if not self._pipeline:
+            if self._request is None:
+                # 空闲的长连接，正在接收的 request 处理完后关闭
+                self._transport.close()
+            return
+        _, response, _, _ = self._pipeline[-1]
+        if not response.headers_sent:
+            response.set("Connection", "close")
+
+    def abort(self) -> None:
+        """
+        强制断开连接
+        """
+        if self._transport is not None:
+            self._transport.abort()
+
+    def pause_reading(self) -> None:
+        """
+        request body 未读取的数据过多，暂停读取 socket
+        """
+        if self._reading_paused or self._transport is None:
+            return
+        self._reading_paused = True
+        self._transport.pause_reading()
+        # 暂停期间不是客户端慢，不计算 body 超时
+        self._set_timeout(None)
+
+    def resume_reading(self) -> None:
+        """
+        request body 被读取，恢复读取 socket
+        """
+        if not self._reading_paused or self._transport is None:
+            return
+        self._reading_paused = False
+        self._transport.resume_reading()
+        if self._request is not None:
+            self._set_timeout(self._body_timeout)
+
+    def _set_timeout(self, timeout: Optional[float]) -> None:
+        """
+        取消当前的超时，timeout 不为空时重新设置
+        """
+        if self._timeout is not None:
+            self._timeout.cancel()
+            self._timeout = None
+        if timeout and self._timer is not None:
+            self._timeout = self._timer.call_later(timeout, self._on_timeout)
+
+    def _on_timeout(self) -> None:
+        """
+        超时关闭连接，正在接收 request 时返回 408
+        """
+        self._timeout = None
+        self._closing = True
+        if self._transport is None:
+            return
+        if self._request is not None and not self._pipeline:
+            self._transport.write(REQUEST_TIMEOUT)
+        self._transport.close()
+
+    def pause_writing(self) -> None:
+        """
+        transport 写缓冲区超过 high water
+        """
+        self._writing_paused = True
+
+    def resume_writing(self) -> None:
+        """
+        transport 写缓冲区低于 low water
+        """
+        self._writing_paused = False
+        self._wakeup_drain()
+
+    def _wakeup_drain(self) -> None:
+        """
+        唤醒等待 drain 的 response
+        """
+        waiter = self._drain_waiter
+        if waiter is not None:
+            self._drain_waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+
+    @asyncio.coroutine
+    def drain(self) -> Generator[Any, None, None]:
+        """
+        等待 transport 可写，连接断开抛出 ConnectionResetError
+        """
+        while self._writing_paused and self._transport is not None:
+            if self._drain_waiter is None:
+                self._drain_waiter = self._loop.create_future()
+            yield from self._drain_waiter
+        if self._transport is None or self._transport.is_closing():
+            raise ConnectionResetError("Connection lost")
 
     def data_received(self, data: bytes) -> None:
         """
         socket 收到数据
         """
-        # print(data)
-        if self._request is None:
-            # future = self._loop.create_future()
-            self._request = Request(
-                cast(asyncio.AbstractEventLoop, self._loop),
+        if self._parser is None:
+            return
+        try:
+            self._parser.feed_data(data)
+        except HttpParserError:
+            self._closing = True
+            self._parser = None
+            if self._request is not None:
+                self._request.set_exception(ConnectionAbortedError("Bad request"))
+                self._request = None
+            if self._transport is not None:
+                if not self._pipeline:
+                    self._transport.write(self._error_response)
+                    self._transport.close()
+
+    # ----HttpRequestParser callback------
+    def on_message_begin(self) -> None:
+        """
+        开始解析一个新的 request
+        """
+        if self._closing:
+            return
+        self._set_timeout(self._header_timeout)
+        transport = cast(asyncio.Transport, self._transport)
+        request = self._spare
+        if request is not None:
+            self._spare = None
+        elif self._state is not None and self._state.pool:
+            request = self._state.pool.pop()
+        if request is not None:
+            request.reset(self.complete_handle, transport, self)
+        else:
+            request = self._request_class(
+                self._loop,
                 self.complete_handle,
-                cast(asyncio.Transport, self._transport),
+                transport,
                 charset=self._requset_charset,
+                protocol=self,
+                high_water=self._read_high_water,
             )
-            self._request.parser = HttpRequestParser(self._request)
-        self._request.feed_data(data)
+        request.parser = self._parser
+        self._request = request
+        self._url_size = 0
+        self._header_fields = 0
+
+    def on_url(self, url: bytes) -> None:
+        """
+        httptools url callback
+        """
+        if self._request is not None:
+            self._url_size += len(url)
+            if self._max_url_size and self._url_size > self._max_url_size:
+                self._reject(URI_TOO_LONG)
+            self._request.on_url(url)
+
+    def on_header(self, name: bytes, value: bytes) -> None:
+        """
+        header 回调
+        """
+        if self._request is not None:
+            self._header_fields += 1
+            if self._max_header_fields and self._header_fields > self._max_header_fields:
+                self._reject(HEADER_TOO_LARGE)
+            if self._max_header_field_size and \
+                    len(name) + len(value) > self._max_header_field_size:
+                self._reject(HEADER_TOO_LARGE)
+            self._request.on_header(name, value)
+
+    def _reject(self, response: bytes) -> None:
+        """
+        在 parser 回调中拒绝 request，由 data_received 返回 response 并关闭连接
+        """
+        self._error_response = response
+        raise HttpParserError("request exceeds limits")
+
+    def on_headers_complete(self) -> None:
+        """
+        header 回调完成
+        """
+        if self._request is not None:
+            self._set_timeout(self._body_timeout)
+            self._request.on_headers_complete()
+
+    def on_body(self, body: bytes) -> None:
+        """
+        body 回调，每收到一块数据重新计算 body 超时，
+        request 内部暂停读取时会取消超时
+        """
+        if self._request is not None:
+            self._set_timeout(self._body_timeout)
+            self._request.on_body(body)
+
+    def on_message_complete(self) -> None:
+        """
+        request 解析完成
+        """
+        if self._request is not None:
+            self._set_timeout(None)
+            self._request.on_message_complete()
+            self._request = None
+
+    def complete_handle(self) -> Optional[Generator[Any, None, None]]:
+        """
+        header 解析完成，由 request 同步调用，生成处理这个 request 的协程，
+        过载时直接写出 503 返回 None
+        """
+        request = cast(Request, self._request)
+        state = self._state
+        overloaded = state is not None and state.overloaded
+        transport = cast(asyncio.Transport, self._transport)
+        version = request.version or DEFAULT_HTTP_VERSION
+        response = request.response
+        if response is not None:
+            response.reset(transport, version, self)
+        else:
+            response = self._response_class(
+                self._loop,
+                transport,
+                version,
+                self._response_charset,
+                protocol=self,
+            )
+        self._requests_count += 1
+        if state is not None:
+            state.requests += 1
+        keep_alive = bool(request.should_keep_alive) and not self._closing
+        if overloaded or self._max_requests and self._requests_count >= self._max_requests:
+            keep_alive = False
+        if not keep_alive:
+            self._closing = True
+            response.set("Connection", "close")
+        if self._pipeline:
+            # 前面还有未写完的 response，先缓冲
+            response.cork()
+        item = [request, response, False, keep_alive]
+        self._pipeline.append(item)
+        if overloaded:
+            # 处理中的 request 超过上限，不再读取直接返回 503
+            self.pause_reading()
+            # 等 parser 回调结束后再写出，不需要创建 task
+            self._loop.call_soon(self._shed_request, item)
+            return None
+        if state is not None:
+            state.in_flight += 1
+        return self._handle_request(item)
+
+    def _shed_request(self, item: List[Any]) -> None:
+        """
+        过载时不执行 handle，按顺序写出 503
+        """
+        response = item[1]
+        response.write(cast(ServerState, self._state).service_unavailable)
+        item[2] = True
+        self._flush_pipeline()
 
     @asyncio.coroutine
-    def complete_handle(self) -> Generator[Any, None, None]:
+    def _handle_request(self, item: List[Any]) -> Generator[Any, None, None]:
+        """
+        执行 handle，完成后按顺序写出
+        """
+        request, response, _, _ = item
+        try:
+            # handle 是 async def，可以在 asyncio.coroutine 中 yield from
+            yield from cast(Any, self._handle(request, response))
+        except ConnectionError:
+            # 客户端已经断开
+            pass
+        except Exception as error:
+            self._loop.call_exception_handler({
+                "message": "Unhandled exception in request handler",
+                "exception": error,
+                "protocol": self,
+            })
+            if response.headers_sent:
+                # 已经写出了部分响应，前面的 response 写完后关闭连接
+                self._closing = True
+                item[3] = False
+            else:
+                # 这个位置必须有响应，否则后面的 response 会错位
+                response.write(internal_server_error(item[3]))
+        finally:
+            if self._state is not None:
+                self._state.in_flight -= 1
+                self._state.check_drained()
+            if not request.body_complete:
+                # 丢弃 handle 没有读取的 body
+                request.discard_body()
+            item[2] = True
+            self._flush_pipeline()
+
+    def _flush_pipeline(self) -> None:
         """
-        完成回调
+        移除已完成的 response，把下一个 response 的缓冲写出
         """
-        if self._request is None:
+        pipeline = self._pipeline
+        while pipeline and pipeline[0][2]:
+            request, response, _, keep_alive = pipeline.popleft()
+            if not keep_alive or response.get("Connection") == "close":
+                pipeline.clear()
+                if self._transport is not None:
+                    self._transport.close()
+                return
+            if self._reuse and self._spare is None and request is not self._request:
+                # body 已经接收完，留给下一个 request 使用
+                self._spare = request
+            if pipeline:
+                pipeline[0][1].uncork()
+        if pipeline:
             return
-        self._response = Response(
-            self._loop,
-            cast(asyncio.Transport, self._transport),
-            self._request.version or DEFAULT_HTTP_VERSION,
-            self._response_charset,
-        )
-        keep_alive = self._request.should_keep_alive
-        if not keep_alive:
-            self._response.set("Connection", "close")
-        yield from self._handle(self._request, self._response)
-        if not keep_alive and self._transport is not None:
-            self._transport.close()
-        # self._request_parser = None
-        self._request = None
-        self._response = None
+        if self._closing:
+            if self._transport is not None:
+                self._transport.close()
+        elif self._request is None:
+            # 空闲的长连接
+            self._set_timeout(self._keep_alive_timeout)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+粗粒度的定时器轮，大量连接的超时共用一个 loop.call_later
+"""
+
+import asyncio
+from math import ceil
+from typing import Any, Callable, cast, Dict, Optional, Set, Tuple
+
+__all__ = [
+    "TimerHandle",
+    "TimerWheel",
+]
+
+
+class TimerHandle(object):
+    """
+    TimerWheel.call_later 返回的句柄
+    """
+    __slots__ = [
+        "_wheel",
+        "_tick",
+        "_callback",
+        "_args",
+        "_cancelled",
+    ]
+
+    def __init__(
+            self,
+            wheel: 'TimerWheel',
+            tick: int,
+            callback: Callable[..., Any],
+            args: Tuple[Any, ...],
+    ) -> None:
+        self._wheel = wheel
+        self._tick = tick
+        self._callback = callback
+        self._args = args
+        self._cancelled = False
+
+    @property
+    def cancelled(self) -> bool:
+        """
+        是否已取消
+        """
+        return self._cancelled
+
+    def cancel(self) -> None:
+        """
+        取消定时器
+        """
+        if self._cancelled:
+            return
+        self._cancelled = True
+        self._wheel.remove(self)
+
+    def run(self) -> None:
+        """
+        执行回调
+        """
+        self._cancelled = True
+        self._callback(*self._args)
+
+
+class TimerWheel(object):
+    """
+    以 resolution 秒为一格的定时器轮，只有存在定时器时才会调度 loop。
+    超时精度为 resolution，适用于连接的 keep-alive, header, body 超时。
+    """
+    __slots__ = [
+        "_loop",
+        "_resolution",
+        "_slots",
+        "_tick",
+        "_count",
+        "_handle",
+    ]
+
+    def __init__(
+            self,
+            loop: asyncio.AbstractEventLoop,
+            resolution: float = 1.0,
+    ) -> None:
+        self._loop = loop
+        self._resolution = resolution
+        self._slots = cast(Dict[int, Set[TimerHandle]], {})
+        self._tick = 0
+        self._count = 0
+        self._handle = cast(Optional[asyncio.TimerHandle], None)
+
+    def __len__(self) -> int:
+        """
+        未执行的定时器数量
+        """
+        return self._count
+
+    def call_later(
+            self,
+            delay: float,
+            callback: Callable[..., Any],
+            *args: Any,
+    ) -> TimerHandle:
+        """
+        delay 秒后执行 callback
+        """
+        # 当前格已经走过了一部分，多加一格保证不会提前执行
+        tick = self._tick + max(1, int(ceil(delay / self._resolution))) + 1
+        handle = TimerHandle(self, tick, callback, args)
+        slot = self._slots.get(tick)
+        if slot is None:
+            slot = self._slots[tick] = set()
+        slot.add(handle)
+        self._count += 1
+        if self._handle is None:
+            self._handle = self._loop.call_later(self._resolution, self._run)
+        return handle
+
+    def remove(self, handle: TimerHandle) -> None:
+        """
+        移除定时器，由 TimerHandle.cancel 调用
+        """
+        slot = self._slots.get(handle._tick)
+        if slot is not None and handle in slot:
+            slot.remove(handle)
+            self._count -= 1
+            if not slot:
+                del self._slots[handle._tick]
+
+    def _run(self) -> None:
+        """
+        走一格，执行到期的定时器
+        """
+        self._tick += 1
+        slot = self._slots.pop(self._tick, None)
+        if slot is not None:
+            self._count -= len(slot)
+            for handle in slot:
+                # 可能被同一格中先执行的回调取消
+                if not handle._cancelled:
+                    handle.run()
+        if self._count > 0:
+            self._handle = self._loop.call_later(self._resolution, self._run)
+        else:
+            self._handle = None
+
+    def close(self) -> None:
+        """
+        取消所有定时器
+        """
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        for slot in self._slots.values():
+            for handle in slot:
+                handle._cancelled = True
+        self._slots.clear()
+        self._count = 0
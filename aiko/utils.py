@@ -2,9 +2,11 @@
 """
 各种工具
 """
-import asyncio
-from datetime import datetime
-from typing import Any, cast, Dict, List, Optional, Set, Union
+from calendar import timegm
+from email.utils import formatdate, parsedate
+from functools import lru_cache
+from typing import Any, cast, Dict, List, Optional, Set, Tuple, Union
+from urllib.parse import unquote
 
 __all__ = [
     "decode_bytes",
@@ -13,8 +15,14 @@ __all__ = [
     "DEFAULT_REQUEST_CODING",
     "DEFAULT_RESPONSE_CODING",
     "DEFAULT_HTTP_VERSION",
+    "DEFAULT_BODY_TIMEOUT",
+    "DEFAULT_HEADER_TIMEOUT",
+    "DEFAULT_KEEP_ALIVE_TIMEOUT",
+    "DEFAULT_MAX_BODY_SIZE",
+    "DEFAULT_JSON_EXECUTOR_THRESHOLD",
+    "DEFAULT_READ_HIGH_WATER",
+    "DEFAULT_WRITE_HIGH_WATER",
     "HEADER_TYPE",
-    "ISO_DATE_FORMAT",
     "STATIC_METHODS",
 ]
 
@@ -23,8 +31,19 @@ DEFAULT_CODING = 'latin-1'
 DEFAULT_HTTP_VERSION = "1.1"
 DEFAULT_REQUEST_CODING = DEFAULT_CODING
 DEFAULT_RESPONSE_CODING = "utf-8"
+# 未读取的 body 超过该值时暂停读取 socket
+DEFAULT_READ_HIGH_WATER = 64 * 1024
+# 写缓冲区超过该值时 Response.drain 需要等待
+DEFAULT_WRITE_HIGH_WATER = 64 * 1024
+# 长连接空闲超时, 接收 header 超时, 接收 body 时两块数据之间的超时(秒)
+DEFAULT_KEEP_ALIVE_TIMEOUT = 5.0
+DEFAULT_HEADER_TIMEOUT = 10.0
+DEFAULT_BODY_TIMEOUT = 60.0
+# form(), json() 最多读取的 body 长度
+DEFAULT_MAX_BODY_SIZE = 1024 * 1024
+# json body 达到该长度时在线程池中解析
+DEFAULT_JSON_EXECUTOR_THRESHOLD = 256 * 1024
 HEADER_TYPE = Dict[str, Union[str, List[str]]]
-ISO_DATE_FORMAT = r"%a, %d %b %Y %H:%M:%S %Z"
 STATIC_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS', 'TRACE')
 
 
@@ -42,41 +61,94 @@ def encode_str(data: str, encoding: str = DEFAULT_CODING, errors: str = 'strict'
     return data.encode(encoding, errors)
 
 
-@asyncio.coroutine
-def handle_async_gen(gen: Any, gen_obj: Any) -> Any:
+@lru_cache(maxsize=256)
+def parse_http_date(date: str) -> int:
     """
-    处理异步生成器
+    解析http时间到 timestamp，解析失败返回 0。
+    客户端会反复发送相同的时间，缓存解析结果
     """
-    if gen is None:
-        return None
-    if asyncio.iscoroutine(gen):
-        try:
-            temp = yield from gen
-            gen_obj.send(temp)
-            return
-        except Exception as error:
-            try:
-                gen = gen_obj.throw(error)
-                return (yield from handle_async_gen(gen, gen_obj))
-            except StopIteration:
-                return None
-    else:
-        return gen
+    try:
+        parsed = parsedate(date)
+    except (TypeError, ValueError, IndexError):
+        return 0
+    if parsed is None:
+        return 0
+    return timegm(parsed[:6])
 
 
-def parse_http_date(date: str) -> int:
+def format_http_date(timestamp: float) -> str:
+    """
+    把 timestamp 格式化为http时间，精确到秒
+    """
+    return _format_http_date(int(timestamp))
+
+
+@lru_cache(maxsize=256)
+def _format_http_date(seconds: int) -> str:
+    return formatdate(seconds, usegmt=True)
+
+
+def parse_range(range_str: str, size: int) -> Optional[Tuple[int, int]]:
     """
-    解析http时间到 timestamp
+    解析 Range header，返回 (start, end)，end 包含在内。
+    不支持或者多个范围返回 None，start >= size 表示范围无法满足
     """
+    if not range_str.startswith("bytes="):
+        return None
+    ranges = range_str[6:].split(",")
+    if len(ranges) != 1:
+        # 多个范围直接返回全部内容
+        return None
+    start_str, sep, end_str = ranges[0].strip().partition("-")
+    if not sep:
+        return None
     try:
-        return int(
-            datetime.strptime(
-                date,
-                ISO_DATE_FORMAT,
-            ).timestamp(),
-        )
+        if not start_str:
+            # bytes=-500 最后 500 个字节
+            suffix = int(end_str)
+            if suffix <= 0:
+                return size, size
+            return max(0, size - suffix), size - 1
+        start = int(start_str)
+        end = int(end_str) if end_str else size - 1
     except ValueError:
-        return 0
+        return None
+    if start >= size:
+        return size, size
+    if start < 0 or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def parse_query(
+        query_str: str,
+        encoding: str = "utf-8",
+) -> Dict[str, Union[str, List[str]]]:
+    """
+    单次遍历解析 query string，与 parse_qs 一样忽略空值，
+    只出现一次的 key 直接保存 str，重复的才使用 list
+    """
+    query = cast(Dict[str, Union[str, List[str]]], {})
+    for item in query_str.split("&"):
+        name, sep, value = item.partition("=")
+        if not value:
+            continue
+        if "+" in name:
+            name = name.replace("+", " ")
+        if "%" in name:
+            name = unquote(name, encoding)
+        if "+" in value:
+            value = value.replace("+", " ")
+        if "%" in value:
+            value = unquote(value, encoding)
+        old = query.get(name)
+        if old is None:
+            query[name] = value
+        elif isinstance(old, list):
+            old.append(value)
+        else:
+            query[name] = [old, value]
+    return query
 
 
 def fresh(req_headers: HEADER_TYPE, res_headers: HEADER_TYPE) -> bool:
@@ -110,12 +182,13 @@ def fresh(req_headers: HEADER_TYPE, res_headers: HEADER_TYPE) -> bool:
             return False
         if etag.startswith("W/"):
             etag = etag[2:]
-        if none_match.startswith("W/"):
-            none_match = none_match[2:]
         etag_stale = True
         matches = none_match.split(",")
         for match in matches:
             match = match.strip()
+            # If-None-Match 使用弱比较
+            if match.startswith("W/"):
+                match = match[2:]
             if match == etag:
                 etag_stale = False
                 break
@@ -137,9 +210,38 @@ def fresh(req_headers: HEADER_TYPE, res_headers: HEADER_TYPE) -> bool:
     return True
 
 
+PROXY_TEMPLATES = {
+    "method": (
+        "def proxy(this, *args, **kwargs):\n"
+        "    return this.{target}.{name}(*args, **kwargs)\n"
+    ),
+    "getter": (
+        "def proxy(this):\n"
+        "    return this.{target}.{name}\n"
+    ),
+    "setter": (
+        "def proxy(this, val):\n"
+        "    this.{target}.{name} = val\n"
+    ),
+}
+
+
+def compile_proxy(kind: str, target: str, name: str) -> Any:
+    """
+    生成直接访问属性的代理函数，避免运行时两次 getattr
+    """
+    if not target.isidentifier() or not name.isidentifier():
+        raise ValueError("invalid proxy name: %s.%s" % (target, name))
+    namespace = cast(Dict[str, Any], {})
+    exec(PROXY_TEMPLATES[kind].format(target=target, name=name), namespace)
+    func = namespace["proxy"]
+    func.__qualname__ = func.__name__ = name
+    return func
+
+
 class ProxyAttr(object):
     """
-    代理属性工具
+    代理属性工具，代理函数在定义时生成
     """
     def __init__(self, proto: Any, target: str) -> None:
         self._proto = proto
@@ -197,13 +299,9 @@ class ProxyAttr(object):
         if self.reuse_handle(name, rename, self._method):
             return self
 
-        def proxy_method(self2: Any, *args: Any, **kwargs: Any) -> Any:
-            """
-            代理 method
-            """
-            return getattr(getattr(self2, self._target), name)(*args, **kwargs)
+        proxy_method = compile_proxy("method", self._target, name)
         self._func_map[name] = proxy_method
-        setattr(self._proto, name, proxy_method)
+        setattr(self._proto, rename, proxy_method)
         self._method[name] = {rename}
         return self
 
@@ -216,13 +314,7 @@ class ProxyAttr(object):
         if self.reuse_handle(name, rename, self._getter):
             return self
 
-        def proxy_get(this: Any) -> None:
-            """
-            代理 getattr
-            """
-            proxy_target = getattr(this, self._target)
-            return getattr(proxy_target, name)
-
+        proxy_get = compile_proxy("getter", self._target, name)
         if name in self._setter:
             func = self._func_map[name]
             func = func.getter(proxy_get)
@@ -242,12 +334,7 @@ class ProxyAttr(object):
         if self.reuse_handle(name, rename, self._setter):
             return self
 
-        def proxy_set(this: Any, val: Any) -> None:
-            """
-            代理 setattr
-            """
-            proxy_target_ = getattr(this, self._target)
-            setattr(proxy_target_, name, val)
+        proxy_set = compile_proxy("setter", self._target, name)
         if name in self._getter:
             func = self._func_map[name]
             func = func.setter(proxy_set)
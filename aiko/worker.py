@@ -61,9 +61,14 @@ class GunicornWorker(Worker):
             while self.alive:  # type: ignore
                 self.notify()
 
+                state = self.wsgi.state
                 if pid == os.getpid() and self.ppid != os.getppid():
                     self.alive = False
                     self.log.info("Parent changed, shutting down: %s", self)
+                elif state is not None and state.requests >= self.max_requests:
+                    # max_requests 已经加上了 max_requests_jitter
+                    self.alive = False
+                    self.log.info("Max requests, shutting down: %s", self)
                 else:
                     yield from asyncio.sleep(1.0, loop=self.loop)
         except (Exception, BaseException, GeneratorExit, KeyboardInterrupt):
@@ -77,12 +82,27 @@ class GunicornWorker(Worker):
         """
         ssl_context = self._create_ssl_context()
         # access_logger = self.log.access_log if self.cfg.accesslog else None
+        self._configure_app()
         for sock in self.sockets:
-            # max_fields_size = self.cfg.limit_request_fields * self.cfg.limit_request_field_size
-            # h11_max_incomplete_size = self.cfg.limit_request_line + max_fields_size
             server = yield from self.wsgi.create_server(self.loop, sock=sock.sock, ssl=ssl_context)
             self.servers.append(server)
 
+    def _configure_app(self) -> None:
+        """
+        把 gunicorn 的 request 限制, keepalive, worker_connections 设置到 app
+        """
+        app = self.wsgi
+        cfg = self.cfg
+        app.max_url_size = cfg.limit_request_line
+        app.max_header_fields = cfg.limit_request_fields
+        app.max_header_field_size = cfg.limit_request_field_size
+        if cfg.keepalive > 0:
+            app.keep_alive_timeout = cfg.keepalive
+        else:
+            # 不保持连接，每个连接只处理一个 request
+            app.max_requests = 1
+        app.max_connections = cfg.worker_connections
+
     def _create_ssl_context(self) -> Optional[SSLContext]:
         """
         创建 ssl
@@ -98,12 +118,31 @@ class GunicornWorker(Worker):
             ssl_context.set_alpn_protocols(['http/1.1'])
         return ssl_context
 
+    @asyncio.coroutine
+    def _heartbeat(self) -> Generator[Any, None, None]:
+        """
+        定时通知 arbiter worker 还在运行
+        """
+        while True:
+            self.notify()
+            yield from asyncio.sleep(1.0, loop=self.loop)
+
     @asyncio.coroutine
     def close(self) -> Generator[Any, None, None]:
         """
-        关闭回调
+        关闭回调，停止 accept 后等待处理中的 request 完成，最多等待 graceful_timeout 秒
         """
-        for server in self.servers:
+        servers = self.servers
+        self.servers = []
+        shutdown = getattr(self.wsgi, "shutdown", None)
+        if shutdown is not None:
+            # 等待期间继续心跳，避免 arbiter 认为 worker 超时而 kill
+            heartbeat = asyncio.ensure_future(self._heartbeat(), loop=self.loop)  # type: ignore
+            try:
+                yield from shutdown(self.cfg.graceful_timeout)
+            finally:
+                heartbeat.cancel()
+        for server in servers:
             server.close()
             yield from server.wait_closed()
 
@@ -27,12 +27,16 @@ setup(
     maintainer='zeromake',
     maintainer_email='a390720046@gmail.com',
     long_description=readme,
-    packages=['aiko'],
+    packages=['aiko', 'aiko.middleware'],
     platforms='any',
     python_requires='>=3.5',
     install_requires=[
         'httptools>=0.0.11',
     ],
+    extras_require={
+        'orjson': ['orjson'],
+        'brotli': ['brotli'],
+    },
     classifiers=[
         'Environment :: Web Environment',
         'License :: OSI Approved :: MIT License',
@@ -0,0 +1,599 @@
+import asyncio
+import json
+import os
+import tempfile
+from datetime import date, datetime
+from typing import Any, cast, List
+from uuid import UUID
+
+from aiko import App, Context, Request, Response
+from aiko.encoder import JSONEncoder
+from aiko.timer import TimerWheel
+from .utils import AppTest, run_until_complete
+
+
+class TestApp(AppTest):
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_request_body(self) -> Any:
+        app = cast(App, self.app)
+
+        @asyncio.coroutine
+        def echo(ctx: Context, next_call: Any) -> Any:
+            chunks = []
+            while True:
+                chunk = yield from ctx.request.read()
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            return b"".join(chunks)
+        app.use(echo)
+        yield from self.listen()
+        body = b"a" * 100000
+        res = yield from self.send(
+            b"POST / HTTP/1.1\r\n"
+            b"Host: 127.0.0.1\r\n"
+            b"Connection: close\r\n"
+            b"Content-Length: %d\r\n"
+            b"\r\n%s" % (len(body), body),
+        )
+        assert res.startswith(b"HTTP/1.1 200 OK\r\n")
+        assert b"\r\nDate: " in res
+        assert res.endswith(b"\r\n\r\n" + body)
+        yield from self.unlisten()
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_pipelining(self) -> Any:
+        app = cast(App, self.app)
+
+        @asyncio.coroutine
+        def handle(ctx: Context, next_call: Any) -> Any:
+            # 第一个请求最后完成，response 依然要按顺序写出
+            if ctx.request.path == "/1":
+                yield from asyncio.sleep(0.1, loop=self.loop)
+            return ctx.request.path
+        app.use(handle)
+        yield from self.listen()
+        res = yield from self.send(
+            b"GET /1 HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n"
+            b"GET /2 HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n"
+            b"GET /3 HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n",
+        )
+        assert res.count(b"HTTP/1.1 200 OK\r\n") == 3
+        assert res.index(b"\r\n\r\n/1") < res.index(b"\r\n\r\n/2") < res.index(b"\r\n\r\n/3")
+        yield from self.unlisten()
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_pipelining_error(self) -> Any:
+        app = cast(App, self.app)
+        errors = cast(List[Any], [])
+        self.loop.set_exception_handler(lambda loop, context: errors.append(context))
+
+        def handle(ctx: Context, next_call: Any) -> Any:
+            if ctx.request.path == "/boom":
+                raise RuntimeError("boom")
+            return "ok %s" % ctx.request.path
+        app.use(handle)
+        yield from self.listen()
+        res = yield from self.send(
+            b"GET /boom HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n"
+            b"GET /b HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n",
+        )
+        first, second = res.split(b"\r\n\r\n", 1)
+        assert first.startswith(b"HTTP/1.1 500 Internal Server Error\r\n")
+        assert second.startswith(b"HTTP/1.1 200 OK\r\n")
+        assert second.endswith(b"\r\n\r\nok /b")
+        assert isinstance(errors[0]["exception"], RuntimeError)
+        yield from self.unlisten()
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_timeouts(self) -> Any:
+        app = cast(App, self.app)
+        # 使用精度更高的定时器
+        cast(Any, app)._timer = TimerWheel(self.loop, 0.02)
+        app.keep_alive_timeout = 0.1
+        app.header_timeout = 0.1
+        app.body_timeout = 0.15
+
+        @asyncio.coroutine
+        def echo(ctx: Context, next_call: Any) -> Any:
+            body = yield from ctx.request.read_all()
+            return body
+        app.use(echo)
+        yield from self.listen()
+
+        @asyncio.coroutine
+        def connect() -> Any:
+            return (yield from asyncio.open_connection(
+                "127.0.0.1",
+                self.PORT,
+                loop=self.loop,
+            ))
+        # 空闲的长连接超时关闭
+        reader, writer = yield from connect()
+        writer.write(b"GET / HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n")
+        head = yield from reader.readuntil(b"\r\n\r\n")
+        assert head.startswith(b"HTTP/1.1 200 OK\r\n")
+        res = yield from asyncio.wait_for(reader.read(), 1, loop=self.loop)
+        assert res == b""
+        writer.close()
+
+        # header 没有接收完返回 408
+        reader, writer = yield from connect()
+        writer.write(b"GET / HTTP/1.1\r\nHost: 127.0.0.1\r\n")
+        res = yield from asyncio.wait_for(reader.read(), 1, loop=self.loop)
+        assert res.startswith(b"HTTP/1.1 408 Request Timeout\r\n")
+        writer.close()
+
+        # 持续发送 body 的时间超过 body_timeout 也不会超时
+        reader, writer = yield from connect()
+        writer.write(
+            b"POST / HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+            b"Connection: close\r\nContent-Length: 10\r\n\r\n",
+        )
+        for _ in range(10):
+            yield from asyncio.sleep(0.05, loop=self.loop)
+            writer.write(b"a")
+        res = yield from asyncio.wait_for(reader.read(), 1, loop=self.loop)
+        assert res.startswith(b"HTTP/1.1 200 OK\r\n")
+        assert res.endswith(b"\r\n\r\n" + b"a" * 10)
+        writer.close()
+
+        # body 停止发送后关闭连接
+        reader, writer = yield from connect()
+        writer.write(
+            b"POST / HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+            b"Content-Length: 10\r\n\r\naaa",
+        )
+        res = yield from asyncio.wait_for(reader.read(), 1, loop=self.loop)
+        assert res == b""
+        writer.close()
+        yield from self.unlisten()
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_drain(self) -> Any:
+        app = cast(App, self.app)
+        chunk = b"a" * 65536
+
+        @asyncio.coroutine
+        def handle(ctx: Context, next_call: Any) -> Any:
+            ctx.response.set("Content-Length", str(len(chunk) * 10))
+            ctx.response.flush_headers()
+            for _ in range(10):
+                ctx.response.write(chunk)
+                yield from ctx.response.drain()
+        app.use(handle)
+        yield from self.listen()
+        res = yield from self.send(
+            b"GET / HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n",
+        )
+        assert res.endswith(b"\r\n\r\n" + chunk * 10)
+        yield from self.unlisten()
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_max_concurrency(self) -> Any:
+        app = cast(App, self.app)
+        app.max_concurrency = 1
+
+        @asyncio.coroutine
+        def handle(ctx: Context, next_call: Any) -> Any:
+            yield from asyncio.sleep(0.05, loop=self.loop)
+            return ctx.request.path
+        app.use(handle)
+        yield from self.listen()
+        res = yield from self.send(
+            b"GET /1 HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n"
+            b"GET /2 HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n",
+        )
+        assert res.startswith(b"HTTP/1.1 200 OK\r\n")
+        assert res.index(b"\r\n\r\n/1") < res.index(b"HTTP/1.1 503 Service Unavailable\r\n")
+        assert b"Retry-After: 1\r\n" in res
+        yield from self.unlisten()
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_max_connections(self) -> Any:
+        app = cast(App, self.app)
+        app.max_connections = 2
+        app.use(lambda ctx, next_call: "ok")
+        yield from self.listen()
+        conns = []
+        for _ in range(2):
+            reader, writer = yield from asyncio.open_connection(
+                "127.0.0.1",
+                self.PORT,
+                loop=self.loop,
+            )
+            writer.write(b"GET / HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n")
+            head = yield from reader.readuntil(b"\r\n\r\nok")
+            assert head.startswith(b"HTTP/1.1 200 OK\r\n")
+            conns.append(writer)
+        # 超过上限的连接直接返回 503 并关闭
+        reader, writer = yield from asyncio.open_connection(
+            "127.0.0.1",
+            self.PORT,
+            loop=self.loop,
+        )
+        res = yield from asyncio.wait_for(reader.read(), 1, loop=self.loop)
+        assert res.startswith(b"HTTP/1.1 503 Service Unavailable\r\n")
+        assert b"\r\nConnection: close\r\n" in res
+        writer.close()
+        # 关闭一个连接后可以再连接
+        conns.pop().close()
+        yield from asyncio.sleep(0.05, loop=self.loop)
+        res = yield from self.send(
+            b"GET / HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n",
+        )
+        assert res.startswith(b"HTTP/1.1 200 OK\r\n")
+        for conn in conns:
+            conn.close()
+        yield from self.unlisten()
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_file_range(self) -> Any:
+        app = cast(App, self.app)
+        data = bytes(range(256)) * 1024
+        with tempfile.NamedTemporaryFile(delete=False) as temp:
+            temp.write(data)
+
+        def handle(ctx: Context, next_call: Any) -> Any:
+            if ctx.request.path == "/buffered":
+                return open(temp.name, "rb")
+            if ctx.request.path == "/twice":
+                # 重复处理不会修改已经计算的 Range
+                ctx.response.body = open(temp.name, "rb", buffering=0)
+                ctx.response.handel_default()
+                ctx.response.handel_default()
+                return None
+            return open(temp.name, "rb", buffering=0)
+        app.use(handle)
+        yield from self.listen()
+        try:
+            res = yield from self.send(
+                b"GET / HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n",
+            )
+            assert b"\r\nAccept-Ranges: bytes\r\n" in res
+            assert res.endswith(b"\r\n\r\n" + data)
+            # 带缓冲的文件也作为文件发送，不使用 chunked
+            res = yield from self.send(
+                b"GET /buffered HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n",
+            )
+            assert b"\r\nContent-Length: %d\r\n" % len(data) in res
+            assert b"Transfer-Encoding" not in res
+            assert res.endswith(b"\r\n\r\n" + data)
+            for path in (b"/buffered", b"/twice"):
+                res = yield from self.send(
+                    b"GET %s HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n"
+                    b"Range: bytes=100-199\r\n\r\n" % path,
+                )
+                assert res.startswith(b"HTTP/1.1 206 Partial Content\r\n")
+                assert b"\r\nContent-Length: 100\r\n" in res
+                assert res.endswith(b"\r\n\r\n" + data[100:200])
+            res = yield from self.send(
+                b"GET / HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n"
+                b"Range: bytes=100-199\r\n\r\n",
+            )
+            assert res.startswith(b"HTTP/1.1 206 Partial Content\r\n")
+            assert b"\r\nContent-Range: bytes 100-199/%d\r\n" % len(data) in res
+            assert res.endswith(b"\r\n\r\n" + data[100:200])
+            res = yield from self.send(
+                b"GET / HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n"
+                b"Range: bytes=%d-\r\n\r\n" % len(data),
+            )
+            assert res.startswith(b"HTTP/1.1 416 Requested Range Not Satisfiable\r\n")
+        finally:
+            os.unlink(temp.name)
+        yield from self.unlisten()
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_stream(self) -> Any:
+        app = cast(App, self.app)
+        loop = self.loop
+
+        class AsyncChunks(object):
+            def __init__(self) -> None:
+                self._chunks = iter(["a", b"", b"bc"])
+
+            def __aiter__(self) -> 'AsyncChunks':
+                return self
+
+            @asyncio.coroutine
+            def __anext__(self) -> Any:
+                yield from asyncio.sleep(0, loop=loop)
+                try:
+                    return next(self._chunks)
+                except StopIteration:
+                    raise StopAsyncIteration
+
+        def handle(ctx: Context, next_call: Any) -> Any:
+            if ctx.request.path == "/sync":
+                ctx.response.body = (str(i) for i in range(3))
+            else:
+                ctx.response.trailers["X-Count"] = "2"
+                ctx.response.body = AsyncChunks()
+        app.use(handle)
+        yield from self.listen()
+        res = yield from self.send(
+            b"GET /sync HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n",
+        )
+        assert b"\r\nTransfer-Encoding: chunked\r\n" in res
+        assert b"Content-Length" not in res
+        assert res.endswith(b"\r\n\r\n1\r\n0\r\n1\r\n1\r\n1\r\n2\r\n0\r\n\r\n")
+        res = yield from self.send(
+            b"GET /async HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n",
+        )
+        assert b"\r\nTrailer: X-Count\r\n" in res
+        assert res.endswith(b"\r\n\r\n1\r\na\r\n2\r\nbc\r\n0\r\nX-Count: 2\r\n\r\n")
+        yield from self.unlisten()
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_reuse(self) -> Any:
+        app = cast(App, self.app)
+        contexts = cast(List[Any], [])
+
+        def handle(ctx: Context, next_call: Any) -> Any:
+            assert "user" not in ctx.state
+            assert len(ctx.response.headers) == 0
+            ctx.state["user"] = ctx.request.path
+            ctx.cookies["seen"] = ctx.request.path
+            contexts.append(ctx)
+            return "ok"
+        app.use(handle)
+        yield from self.listen()
+        reader, writer = yield from asyncio.open_connection(
+            "127.0.0.1",
+            self.PORT,
+            loop=self.loop,
+        )
+        for path in (b"/1", b"/2"):
+            writer.write(b"GET %s HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n" % path)
+            head = yield from reader.readuntil(b"\r\n\r\n")
+            assert head.count(b"Set-Cookie: ") == 1
+            assert b"Set-Cookie: seen=%s\r\n" % path in head
+            body = yield from reader.readexactly(2)
+            assert body == b"ok"
+        writer.close()
+        assert contexts[0] is contexts[1]
+        yield from self.unlisten()
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_json(self) -> Any:
+        app = cast(App, self.app)
+        app.json_encoder = JSONEncoder(stream_threshold=10, chunk_items=4)
+        app.json_encoder.register(Point, lambda point: [point.x, point.y])
+
+        def handle(ctx: Context, next_call: Any) -> Any:
+            if ctx.request.path == "/list":
+                return list(range(25))
+            return {"point": Point(1, 2), "day": date(2020, 1, 2)}
+        app.use(handle)
+        yield from self.listen()
+        res = yield from self.send(
+            b"GET / HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n",
+        )
+        assert b"\r\nContent-Type: application/json; charset=utf-8\r\n" in res
+        body = res.split(b"\r\n\r\n", 1)[1]
+        assert json.loads(body.decode()) == {"point": [1, 2], "day": "2020-01-02"}
+        res = yield from self.send(
+            b"GET /list HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n",
+        )
+        assert b"\r\nTransfer-Encoding: chunked\r\n" in res
+        chunks = res.split(b"\r\n\r\n", 1)[1].split(b"\r\n")[1:-2:2]
+        assert len(chunks) == 8
+        assert json.loads(b"".join(chunks).decode()) == list(range(25))
+        yield from self.unlisten()
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_shutdown(self) -> Any:
+        app = cast(App, self.app)
+        hang = self.loop.create_future()
+
+        @asyncio.coroutine
+        def handle(ctx: Context, next_call: Any) -> Any:
+            if ctx.request.path == "/slow":
+                yield from asyncio.sleep(0.2, loop=self.loop)
+            elif ctx.request.path == "/hang":
+                yield from hang
+            return "done"
+        app.use(handle)
+        yield from self.listen()
+        idle_reader, idle_writer = yield from asyncio.open_connection(
+            "127.0.0.1",
+            self.PORT,
+            loop=self.loop,
+        )
+        idle_writer.write(b"GET / HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n")
+        yield from idle_reader.readuntil(b"done")
+        busy_reader, busy_writer = yield from asyncio.open_connection(
+            "127.0.0.1",
+            self.PORT,
+            loop=self.loop,
+        )
+        busy_writer.write(b"GET /slow HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n")
+        yield from asyncio.sleep(0.05, loop=self.loop)
+        shutdown = asyncio.ensure_future(app.shutdown(), loop=self.loop)
+        # 空闲的连接立即关闭
+        res = yield from idle_reader.read()
+        assert res == b""
+        assert not shutdown.done()
+        # 处理中的 request 正常返回并关闭连接
+        res = yield from busy_reader.read()
+        assert res.startswith(b"HTTP/1.1 200 OK\r\n")
+        assert b"\r\nConnection: close\r\n" in res
+        assert res.endswith(b"done")
+        drained = yield from shutdown
+        assert drained
+        idle_writer.close()
+        busy_writer.close()
+
+        # 超时强制断开
+        self.server = None
+        yield from self.listen()
+        reader, writer = yield from asyncio.open_connection(
+            "127.0.0.1",
+            self.PORT,
+            loop=self.loop,
+        )
+        writer.write(b"GET /hang HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n")
+        yield from asyncio.sleep(0.05, loop=self.loop)
+        drained = yield from app.shutdown(0.1)
+        assert not drained
+        res = yield from reader.read()
+        assert res == b""
+        writer.close()
+        hang.set_result(None)
+        yield from asyncio.sleep(0, loop=self.loop)
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_request_limits(self) -> Any:
+        app = cast(App, self.app)
+        app.max_url_size = 64
+        app.max_header_fields = 3
+        app.max_header_field_size = 64
+
+        def handle(ctx: Context, next_call: Any) -> Any:
+            return ctx.request.url
+        app.use(handle)
+        yield from self.listen()
+        res = yield from self.send(
+            b"GET /%s HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n" % (b"a" * 64),
+        )
+        assert res.startswith(b"HTTP/1.1 414 URI Too Long\r\n")
+        res = yield from self.send(
+            b"GET / HTTP/1.1\r\nHost: 127.0.0.1\r\nA: 1\r\nB: 2\r\nC: 3\r\n\r\n",
+        )
+        assert res.startswith(b"HTTP/1.1 431 Request Header Fields Too Large\r\n")
+        res = yield from self.send(
+            b"GET / HTTP/1.1\r\nHost: 127.0.0.1\r\nA: %s\r\n\r\n" % (b"a" * 64),
+        )
+        assert res.startswith(b"HTTP/1.1 431 Request Header Fields Too Large\r\n")
+
+        # url 分多个数据包到达
+        reader, writer = yield from asyncio.open_connection(
+            "127.0.0.1",
+            self.PORT,
+            loop=self.loop,
+        )
+        writer.write(b"GET /abc")
+        yield from writer.drain()
+        yield from asyncio.sleep(0.05, loop=self.loop)
+        writer.write(b"def?x=1 HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n")
+        res = yield from reader.read()
+        writer.close()
+        assert res.startswith(b"HTTP/1.1 200 OK\r\n")
+        assert res.endswith(b"\r\n\r\n/abcdef?x=1")
+        yield from self.unlisten()
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_body_parsers(self) -> Any:
+        app = cast(App, self.app)
+        app.max_body_size = 64
+        app.json_executor_threshold = 16
+
+        @asyncio.coroutine
+        def handle(ctx: Context, next_call: Any) -> Any:
+            request = ctx.request
+            if ctx.request.path == "/form":
+                form = yield from request.form()
+                assert (yield from request.form()) is form
+                # 已经不是 json 类型
+                assert (yield from request.json()) is None
+                return {"name": form.get("name"), "tags": form.getlist("tag")}
+            data = yield from request.json()
+            assert (yield from request.json()) is data
+            return data
+        app.use(handle)
+        yield from self.listen()
+
+        def post(path: bytes, type_: bytes, body: bytes) -> Any:
+            return self.send(
+                b"POST %s HTTP/1.1\r\n"
+                b"Host: 127.0.0.1\r\n"
+                b"Connection: close\r\n"
+                b"Content-Type: %s\r\n"
+                b"Content-Length: %d\r\n"
+                b"\r\n%s" % (path, type_, len(body), body),
+            )
+        res = yield from post(
+            b"/form",
+            b"application/x-www-form-urlencoded; charset=utf-8",
+            "name=%E4%BD%A0%E5%A5%BD&tag=a&tag=b".encode(),
+        )
+        body = res.split(b"\r\n\r\n", 1)[1]
+        assert json.loads(body.decode()) == {"name": "\u4f60\u597d", "tags": ["a", "b"]}
+        # 超过 json_executor_threshold 在线程池中解析
+        res = yield from post(b"/json", b"application/json", b'{"items": [1, 2, 3], "ok": true}')
+        body = res.split(b"\r\n\r\n", 1)[1]
+        assert json.loads(body.decode()) == {"items": [1, 2, 3], "ok": True}
+        res = yield from post(b"/json", b"application/json", b"[" + b"1," * 40 + b"1]")
+        assert res.startswith(b"HTTP/1.1 413 Request Entity Too Large\r\n")
+        assert b"\r\nConnection: close\r\n" in res
+        # 客户端的错误数据返回 400
+        res = yield from post(b"/json", b"application/json", b'{"items": ')
+        assert res.startswith(b"HTTP/1.1 400 Bad Request\r\n")
+        assert res.endswith(b"\r\n\r\nBad Request")
+        res = yield from post(b"/json", b"application/json; charset=unknown", b"[]")
+        assert res.startswith(b"HTTP/1.1 400 Bad Request\r\n")
+        res = yield from post(
+            b"/form",
+            b"application/x-www-form-urlencoded; charset=utf-8",
+            b"name=\xff",
+        )
+        assert res.startswith(b"HTTP/1.1 400 Bad Request\r\n")
+        yield from self.unlisten()
+
+
+def test_context_app() -> None:
+    loop = asyncio.new_event_loop()
+    try:
+        app = App(loop)
+        ctx = Context(loop, Request(loop, lambda: None), Response(loop, None), app)
+        ctx.state["user"] = "a"
+        # 设置 app 不会清空中间件保存的状态
+        ctx.app = app
+        assert ctx.state == {"user": "a"}
+    finally:
+        loop.close()
+
+
+def test_json_encoder_compat() -> None:
+    encoder = JSONEncoder()
+    # 与标准库 json 一样支持非 str 的 key 和任意大小的整数
+    assert json.loads(encoder.encode({1: "a"}).decode()) == {"1": "a"}
+    assert json.loads(encoder.encode([2 ** 70]).decode()) == [2 ** 70]
+
+
+def test_json_encoder_register() -> None:
+    # 注册的转换函数在 orjson 和标准库 json 下结果相同
+    value = {
+        "day": date(2020, 1, 2),
+        "at": datetime(2020, 1, 2, 3, 4, 5),
+        "id": UUID(int=1),
+    }
+    expected = {"day": "day", "at": "at", "id": "id"}
+    for dumps in (None, json.dumps):
+        encoder = JSONEncoder(dumps)
+        encoder.register(date, lambda obj: "day")
+        encoder.register(datetime, lambda obj: "at")
+        assert json.loads(encoder.encode(value).decode())["at"] == "at"
+        encoder.register(UUID, lambda obj: "id")
+        assert json.loads(encoder.encode(value).decode()) == expected
+
+
+class Point(object):
+    def __init__(self, x: int, y: int) -> None:
+        self.x = x
+        self.y = y
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import shutil
+import tempfile
+from typing import Any, cast
+
+from aiko import App, Context
+from aiko.middleware.cache import Cache, parse_cache_control
+from aiko.middleware.static import Static
+from .utils import AppTest, run_until_complete
+
+
+def test_parse_cache_control() -> None:
+    control = parse_cache_control('public, max-age=60, stale-while-revalidate="30"')
+    assert control == {
+        "public": None,
+        "max-age": "60",
+        "stale-while-revalidate": "30",
+    }
+    assert parse_cache_control(None) == {}
+
+
+class TestCache(AppTest):
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_cache(self) -> Any:
+        app = cast(App, self.app)
+        cache = Cache()
+        calls = []
+
+        @asyncio.coroutine
+        def handle(ctx: Context, next_call: Any) -> Any:
+            calls.append(ctx.request.path)
+            yield from asyncio.sleep(0.05, loop=self.loop)
+            if ctx.request.path == "/private":
+                ctx.response.set("Cache-Control", "private, max-age=60")
+            elif ctx.request.path == "/lang":
+                ctx.response.set("Cache-Control", "max-age=60")
+                ctx.response.set("Vary", "Accept-Language")
+                return ctx.request.get("accept-language") or "none"
+            else:
+                ctx.response.set("Cache-Control", "max-age=60")
+            return "call %d" % len(calls)
+        app.use(cache)
+        app.use(handle)
+        yield from self.listen()
+        # 并发的相同请求只执行一次
+        results = yield from asyncio.gather(
+            *[self.request(b"/a") for _ in range(3)],
+            loop=self.loop,
+        )
+        assert calls == ["/a"]
+        assert [body for _, body in results] == [b"call 1"] * 3
+        head, body = yield from self.request(b"/a")
+        assert body == b"call 1"
+        assert b"\r\nAge: 0\r\n" in head
+        assert b"\r\nCache-Control: max-age=60\r\n" in head
+        assert calls == ["/a"]
+
+        # no-cache 跳过缓存
+        _, body = yield from self.request(b"/a", b"Cache-Control: no-cache\r\n")
+        assert body == b"call 2"
+        _, body = yield from self.request(b"/a")
+        assert body == b"call 2"
+
+        # private 不缓存
+        yield from self.request(b"/private")
+        yield from self.request(b"/private")
+        assert calls.count("/private") == 2
+
+        # Vary 的 header 不同使用不同的缓存
+        _, body = yield from self.request(b"/lang", b"Accept-Language: en\r\n")
+        assert body == b"en"
+        _, body = yield from self.request(b"/lang", b"Accept-Language: zh\r\n")
+        assert body == b"zh"
+        _, body = yield from self.request(b"/lang", b"Accept-Language: en\r\n")
+        assert body == b"en"
+        assert calls.count("/lang") == 2
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_stale_while_revalidate(self) -> Any:
+        app = cast(App, self.app)
+        calls = []
+
+        def handle(ctx: Context, next_call: Any) -> Any:
+            calls.append(ctx.request.path)
+            ctx.response.set("Cache-Control", "max-age=0, stale-while-revalidate=60")
+            return "call %d" % len(calls)
+        app.use(Cache())
+        app.use(handle)
+        yield from self.listen()
+        _, body = yield from self.request(b"/")
+        assert body == b"call 1"
+        # 返回过期的响应并在后台更新
+        _, body = yield from self.request(b"/")
+        assert body == b"call 1"
+        yield from asyncio.sleep(0.05, loop=self.loop)
+        assert len(calls) == 2
+        _, body = yield from self.request(b"/")
+        assert body == b"call 2"
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_file_range(self) -> Any:
+        app = cast(App, self.app)
+        root = tempfile.mkdtemp()
+        data = bytes(range(100)) * 10
+        with open(os.path.join(root, "data.bin"), "wb") as f:
+            f.write(data)
+        static = Static(root, max_age=60)
+        app.use(Cache())
+        app.use(static)
+        yield from self.listen()
+        try:
+            # 文件 body 不缓存，Range 只发送请求的部分，后面的 response 不会错位
+            res = yield from self.send(
+                b"GET /data.bin HTTP/1.1\r\nHost: 127.0.0.1\r\nRange: bytes=0-9\r\n\r\n"
+                b"GET /data.bin HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n",
+            )
+            first, second = res.split(b"HTTP/1.1 ")[1:]
+            assert first.startswith(b"206 Partial Content\r\n")
+            assert b"\r\nContent-Length: 10\r\n" in first
+            assert first.endswith(b"\r\n\r\n" + data[:10])
+            assert second.startswith(b"200 OK\r\n")
+            assert second.endswith(b"\r\n\r\n" + data)
+        finally:
+            static.close()
+            shutil.rmtree(root)
+        yield from self.unlisten()
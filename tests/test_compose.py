@@ -0,0 +1,61 @@
+import asyncio
+from typing import Any, cast, List
+
+from aiko.compose import compose
+from .utils import BaseTest, run_until_complete
+
+
+class Ctx(object):
+    def __init__(self) -> None:
+        self.response = Response()
+
+
+class Response(object):
+    def __init__(self) -> None:
+        self.body = cast(Any, None)
+        self.status = 200
+        self.headers = cast(Any, {})
+
+
+class TestCompose(BaseTest):
+
+    @run_until_complete
+    async def test_order(self) -> None:
+        calls = cast(List[int], [])
+
+        @asyncio.coroutine
+        def first(ctx: Any, next_call: Any) -> Any:
+            calls.append(1)
+            yield from next_call()
+            calls.append(5)
+
+        def second(ctx: Any, next_call: Any) -> Any:
+            calls.append(2)
+            yield next_call()
+            calls.append(4)
+
+        def third(ctx: Any, next_call: Any) -> Any:
+            calls.append(3)
+            return "body", 201, {"X-Test": "1"}
+
+        ctx = Ctx()
+        await compose([first, second, third])(ctx, None)
+        assert calls == [1, 2, 3, 4, 5]
+        assert ctx.response.body == "body"
+        assert ctx.response.status == 201
+        assert ctx.response.headers == {"X-Test": "1"}
+
+    @run_until_complete
+    async def test_generator_throw(self) -> None:
+        def catch(ctx: Any, next_call: Any) -> Any:
+            try:
+                yield next_call()
+            except ValueError:
+                return "error"
+
+        def fail(ctx: Any, next_call: Any) -> Any:
+            raise ValueError()
+
+        ctx = Ctx()
+        await compose([catch, fail])(ctx, None)
+        assert ctx.response.body == "error"
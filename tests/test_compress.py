@@ -0,0 +1,93 @@
+import asyncio
+import gzip
+import os
+import tempfile
+import zlib
+from typing import Any, cast, List
+
+from aiko import App, Context
+from aiko.middleware.compress import Compress, negotiate
+from .utils import AppTest, run_until_complete
+
+
+def test_negotiate() -> None:
+    encodings = ("br", "gzip", "deflate")
+    assert negotiate(None, encodings) is None
+    assert negotiate("gzip, deflate", encodings) == "gzip"
+    assert negotiate("gzip;q=0.5, deflate", encodings) == "deflate"
+    assert negotiate("br;q=0, *", encodings) == "gzip"
+    assert negotiate("identity", encodings) is None
+    assert negotiate("x-gzip", ("gzip",)) == "gzip"
+
+
+def parse_chunked(body: bytes) -> bytes:
+    chunks = cast(List[bytes], [])
+    while True:
+        size, body = body.split(b"\r\n", 1)
+        length = int(size, 16)
+        if length == 0:
+            return b"".join(chunks)
+        chunks.append(body[:length])
+        body = body[length + 2:]
+
+
+class TestCompress(AppTest):
+
+    @asyncio.coroutine
+    def fetch(self, path: bytes, accept: bytes = b"gzip, deflate") -> Any:
+        return (yield from self.request(path, b"Accept-Encoding: %s\r\n" % accept))
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_compress(self) -> Any:
+        app = cast(App, self.app)
+        text = "hello world " * 1000
+        with tempfile.NamedTemporaryFile(suffix=".css", delete=False) as temp:
+            temp.write(b"body {}")
+        with open(temp.name + ".gz", "wb") as sibling:
+            sibling.write(gzip.compress(b"body {}"))
+
+        def handle(ctx: Context, next_call: Any) -> Any:
+            if ctx.request.path == "/small":
+                return "small"
+            if ctx.request.path == "/stream":
+                ctx.response.body = (text for _ in range(3))
+                ctx.response.type = "text/plain"
+                return None
+            if ctx.request.path == "/file":
+                ctx.response.set("ETag", '"7-1"')
+                return open(temp.name, "rb", buffering=0)
+            return text
+        app.use(Compress(executor_threshold=4096))
+        app.use(handle)
+        yield from self.listen()
+        try:
+            head, body = yield from self.fetch(b"/")
+            assert b"\r\nContent-Encoding: gzip\r\n" in head
+            assert b"\r\nVary: Accept-Encoding\r\n" in head
+            assert b"\r\nContent-Length: %d\r\n" % len(body) in head
+            assert gzip.decompress(body) == text.encode()
+            head, body = yield from self.fetch(b"/", b"deflate")
+            assert zlib.decompress(body) == text.encode()
+            head, body = yield from self.fetch(b"/", b"identity")
+            assert b"Content-Encoding" not in head
+            assert body == text.encode()
+            head, body = yield from self.fetch(b"/small")
+            assert b"Content-Encoding" not in head
+            assert body == b"small"
+            head, body = yield from self.fetch(b"/stream")
+            assert b"\r\nTransfer-Encoding: chunked\r\n" in head
+            assert gzip.decompress(parse_chunked(body)) == text.encode() * 3
+            head, body = yield from self.fetch(b"/file")
+            assert b"\r\nContent-Encoding: gzip\r\n" in head
+            assert b"\r\nContent-Type: text/css\r\n" in head
+            assert b'\r\nETag: "7-1-gzip"\r\n' in head
+            assert b"\r\nVary: Accept-Encoding\r\n" in head
+            assert gzip.decompress(body) == b"body {}"
+            head, body = yield from self.fetch(b"/file", b"identity")
+            assert b'\r\nETag: "7-1"\r\n' in head
+            assert body == b"body {}"
+        finally:
+            os.unlink(temp.name)
+            os.unlink(temp.name + ".gz")
+        yield from self.unlisten()
@@ -0,0 +1,65 @@
+import asyncio
+from typing import Any, cast
+from zlib import crc32
+
+from aiko import App, Context
+from aiko.middleware.etag import ETag, make_etag
+from .utils import AppTest, run_until_complete
+
+
+def test_make_etag() -> None:
+    assert make_etag(3, crc32(b"abc")) == 'W/"3-352441c2"'
+    assert make_etag(3, crc32(b"abc"), False) == '"3-352441c2"'
+
+
+class TestETag(AppTest):
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_etag(self) -> Any:
+        app = cast(App, self.app)
+
+        def chunks() -> Any:
+            yield "abc"
+            yield b"def"
+
+        def handle(ctx: Context, next_call: Any) -> Any:
+            path = ctx.request.path
+            if path == "/stream":
+                ctx.response.body = chunks()
+            elif path == "/large":
+                ctx.response.body = (b"x" * 10 for _ in range(5))
+            else:
+                return "hello"
+        app.use(ETag(stream_limit=20))
+        app.use(handle)
+        yield from self.listen()
+        etag = make_etag(5, crc32(b"hello"))
+        head, body = yield from self.request(b"/")
+        assert body == b"hello"
+        assert b"\r\nETag: %s\r\n" % etag.encode() in head
+        head, body = yield from self.request(
+            b"/",
+            b"If-None-Match: %s\r\n" % etag.encode(),
+        )
+        assert head.startswith(b"HTTP/1.1 304 Not Modified\r\n")
+        assert body == b""
+
+        # 流式 body 读完后生成 ETag
+        etag = make_etag(6, crc32(b"abcdef"))
+        head, body = yield from self.request(b"/stream")
+        assert body == b"abcdef"
+        assert b"\r\nETag: %s\r\n" % etag.encode() in head
+        assert b"\r\nContent-Length: 6\r\n" in head
+        assert b"Transfer-Encoding" not in head
+        head, body = yield from self.request(
+            b"/stream",
+            b"If-None-Match: %s\r\n" % etag.encode(),
+        )
+        assert head.startswith(b"HTTP/1.1 304 Not Modified\r\n")
+
+        # 超过 stream_limit 的继续流式发送
+        head, body = yield from self.request(b"/large")
+        assert b"ETag" not in head
+        assert b"\r\nTransfer-Encoding: chunked\r\n" in head
+        assert body == (b"a\r\n" + b"x" * 10 + b"\r\n") * 5 + b"0\r\n\r\n"
@@ -1,6 +1,6 @@
 from typing import cast
 
-from aiko.utils import fresh, HEADER_TYPE
+from aiko.utils import format_http_date, fresh, HEADER_TYPE, parse_http_date
 
 
 def test_not_non_conditional() -> None:
@@ -154,3 +154,18 @@ def test_no_cache() -> None:
         'last-modified': 'Sat, 01 Jan 2000 00:00:00 GMT',
     }
     assert not fresh(req, res)
+
+
+def test_http_date() -> None:
+    assert parse_http_date('Sat, 01 Jan 2000 00:00:00 GMT') == 946684800
+    # RFC 850 和 asctime 格式
+    assert parse_http_date('Saturday, 01-Jan-00 00:00:00 GMT') == 946684800
+    assert parse_http_date('Sat Jan  1 00:00:00 2000') == 946684800
+    assert parse_http_date('not a date') == 0
+    assert format_http_date(946684800.5) == 'Sat, 01 Jan 2000 00:00:00 GMT'
+
+
+def test_weak_etags_list() -> None:
+    req = cast(HEADER_TYPE, {'if-none-match': '"bar", W/"foo"'})
+    res = cast(HEADER_TYPE, {'etag': 'W/"foo"'})
+    assert fresh(req, res)
@@ -0,0 +1,26 @@
+from aiko.headers import Headers, intern_name
+
+
+def test_intern_name() -> None:
+    assert intern_name(b"Content-Type") is intern_name(b"content-type")
+    assert intern_name(b"X-Custom") == "x-custom"
+
+
+def test_headers() -> None:
+    headers = Headers()
+    headers.add(b"Host", b"127.0.0.1")
+    headers.add(b"Cache-Control", b"no-cache")
+    headers.add(b"cache-control", b"max-age=0")
+    assert headers.raw[0] == (b"Host", b"127.0.0.1")
+    assert headers.get("HOST") == "127.0.0.1"
+    assert headers["cache-control"] == ["no-cache", "max-age=0"]
+    assert headers.getlist("host") == ["127.0.0.1"]
+    assert "Cache-Control" in headers
+    assert len(headers) == 2
+    headers.add(b"X-Test", b"1")
+    assert headers.get("x-test") == "1"
+    headers["X-Test"] = "2"
+    assert headers["x-test"] == "2"
+    del headers["x-test"]
+    assert headers.get("x-test") is None
+    assert sorted(headers) == ["cache-control", "host"]
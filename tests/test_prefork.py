@@ -0,0 +1,144 @@
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from typing import Any, cast, List, Set
+
+import pytest
+
+from aiko import App
+from aiko.__main__ import load_app
+
+APP_SOURCE = """
+import asyncio
+import os
+from aiko import App
+
+app = App()
+
+
+async def pid(ctx, next_call):
+    if ctx.request.path == "/slow":
+        await asyncio.sleep(1)
+    return str(os.getpid())
+app.use(pid)
+
+
+def factory():
+    return app
+"""
+PORT = 8016
+
+
+def start_server(root: str, **kwargs: Any) -> Any:
+    with open(os.path.join(root, "prefork_app.py"), "w") as f:
+        f.write(APP_SOURCE)
+    env = dict(os.environ)
+    # 保留原来的 PYTHONPATH，子进程还需要导入已安装的依赖
+    env["PYTHONPATH"] = os.pathsep.join(
+        path
+        for path in (
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            env.get("PYTHONPATH"),
+        )
+        if path
+    )
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "aiko", "prefork_app:app",
+            "--host", "127.0.0.1",
+            "--port", str(PORT),
+            "--workers", "2",
+        ],
+        cwd=root,
+        env=env,
+        stderr=subprocess.DEVNULL,
+        **kwargs
+    )
+
+
+def fetch_pids(count: int) -> Set[int]:
+    pids = set()
+    for _ in range(count):
+        with urllib.request.urlopen("http://127.0.0.1:%d/" % PORT, timeout=5) as res:
+            pids.add(int(res.read()))
+    return pids
+
+
+def wait_ready(process: Any) -> None:
+    for _ in range(100):
+        if process.poll() is not None:
+            raise AssertionError("server exited with %d" % process.returncode)
+        try:
+            fetch_pids(1)
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise AssertionError("server not ready")
+
+
+def test_load_app() -> None:
+    root = tempfile.mkdtemp()
+    with open(os.path.join(root, "prefork_app.py"), "w") as f:
+        f.write(APP_SOURCE)
+    sys.path.insert(0, root)
+    try:
+        app = load_app("prefork_app")
+        assert isinstance(app, App)
+        assert load_app("prefork_app:factory") is app
+        with pytest.raises(TypeError):
+            load_app("prefork_app:os")
+    finally:
+        sys.path.remove(root)
+        sys.modules.pop("prefork_app", None)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires fork")
+def test_prefork() -> None:
+    process = start_server(tempfile.mkdtemp())
+    try:
+        wait_ready(process)
+        pids = fetch_pids(40)
+        assert process.pid not in pids
+        # 结束的 worker 会被重新启动
+        killed = pids.pop()
+        os.kill(killed, signal.SIGKILL)
+        time.sleep(1.5)
+        wait_ready(process)
+        assert killed not in fetch_pids(40)
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(10) == 0
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+@pytest.mark.skipif(not hasattr(os, "killpg"), reason="requires process groups")
+def test_prefork_process_group() -> None:
+    # Ctrl-C 和 systemd 会把信号发给整个进程组，worker 也要等待处理中的 request
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        process = start_server(tempfile.mkdtemp(), start_new_session=True)
+        try:
+            wait_ready(process)
+            results = cast(List[bytes], [])
+
+            def slow() -> None:
+                url = "http://127.0.0.1:%d/slow" % PORT
+                with urllib.request.urlopen(url, timeout=5) as res:
+                    results.append(res.read())
+            thread = threading.Thread(target=slow)
+            thread.start()
+            time.sleep(0.3)
+            os.killpg(process.pid, sig)
+            thread.join()
+            assert len(results) == 1 and int(results[0])
+            assert process.wait(10) == 0
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
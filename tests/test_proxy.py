@@ -57,3 +57,16 @@ def test_get_proxy() -> None:
     # assert test3 == test
     assert c.test3 is not a.test
     assert c.test3() == a.test()
+
+
+def test_generated_proxy() -> None:
+    c_cls = type('C', (B, ), {})
+    ProxyAttr(c_cls, '_a').access('test1').method('test', 'test4')
+    # 直接访问属性，没有闭包
+    assert cast(Any, c_cls).test1.fget.__closure__ is None
+    assert cast(Any, c_cls).test1.fset.__closure__ is None
+    c = c_cls(A())
+    assert c.test4() == 0
+    assert not hasattr(c, 'test')
+    with pytest.raises(ValueError):
+        ProxyAttr(c_cls, '_a').getter('a.b')
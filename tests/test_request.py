@@ -6,6 +6,7 @@ from urllib.parse import urlencode
 from httptools import HttpRequestParser
 
 from aiko import Request
+from aiko.request import RequestUrl
 from .utils import BaseTest, run_until_complete
 
 
@@ -61,3 +62,51 @@ class TestRequest(BaseTest):
         yield from future
         self.request = cast(Any, None)
         self.parser = cast(Any, None)
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_request_cookies(self) -> Any:
+        future = self.loop.create_future()
+
+        @asyncio.coroutine
+        def request_complete() -> None:
+            future.set_result(True)
+
+        request = Request(self.loop, request_complete)
+        parser = HttpRequestParser(request)
+        request.parser = parser
+        request.feed_data(
+            b"\r\n".join([
+                b"GET / HTTP/1.1",
+                b"Host: 127.0.0.1",
+                b"Cookie: a=1; b=x%20y; $Version=1",
+                b"Cookie: c=",
+                b"",
+                b"",
+            ]),
+        )
+        yield from future
+        assert request._cookies is None
+        assert request.cookies.get("a") == "1"
+        assert request.cookies.get("b") == "x%20y"
+        assert request.cookies.get("c") == ""
+        assert "$Version" not in request.cookies
+        assert len(request.cookies) == 3
+
+
+def test_request_url_query() -> None:
+    url = RequestUrl(b"http://127.0.0.1/?a=1&b=x+y&b=%E6%B5%8B&c=&d=on&e=abc")
+    query = cast(Any, url.query)
+    assert url.query is query
+    assert query["a"] == ["1"]
+    assert query.get("a") == "1"
+    assert query.getlist("b") == ["x y", "测"]
+    assert "c" not in query
+    assert query.get_int("a") == 1
+    assert query.get_int("e", 0) == 0
+    assert query.get_bool("d") is True
+    assert query.get_bool("e") is None
+    assert query.get_list("missing") == []
+    assert url.raw_query == {"a": "1", "b": "x y", "d": "on", "e": "abc"}
+    url.querystring = "a=2"
+    assert cast(Any, url.query).get_int("a") == 2
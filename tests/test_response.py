@@ -0,0 +1,63 @@
+import asyncio
+from typing import Any, List
+
+from aiko.response import MERGE_BODY_SIZE, Response, STATUS_LINES
+
+
+class WriteTransport(object):
+    """
+    记录每次写入的 transport
+    """
+
+    def __init__(self) -> None:
+        self.writes = []  # type: List[bytes]
+
+    def write(self, data: bytes) -> None:
+        self.writes.append(data)
+
+    def is_closing(self) -> bool:
+        return False
+
+    def get_extra_info(self, name: str, default: Any = None) -> Any:
+        return default
+
+
+def flush(body: bytes, status: int = 200, version: str = "1.1") -> List[bytes]:
+    loop = asyncio.new_event_loop()
+    try:
+        transport = WriteTransport()
+        response = Response(loop, transport, version)  # type: ignore
+        response.status = status
+        response.body = body
+        loop.run_until_complete(response.flush())
+        return transport.writes
+    finally:
+        loop.close()
+
+
+def head(length: int, status: bytes = b"200 OK", version: bytes = b"1.1") -> bytes:
+    return (
+        b"HTTP/%s %s\r\n"
+        b"Content-Length: %d\r\n"
+        b"Content-Type: text/plain; charset=utf-8\r\n"
+        b"\r\n" % (version, status, length)
+    )
+
+
+def test_small_body() -> None:
+    # headers 和小的 body 合并为一次写入
+    assert flush(b"hello") == [head(5) + b"hello"]
+
+
+def test_large_body() -> None:
+    body = b"x" * (MERGE_BODY_SIZE + 1)
+    assert flush(body) == [head(len(body)), body]
+
+
+def test_status_line() -> None:
+    assert flush(b"", 404) == [head(0, b"404 Not Found")]
+    # 没有预先生成的状态行时动态生成并缓存
+    assert ("1.1", 599) not in STATUS_LINES
+    assert flush(b"", 599) == [head(0, b"599 Unknown")]
+    assert STATUS_LINES[("1.1", 599)] == b"HTTP/1.1 599 Unknown\r\n"
+    assert flush(b"", 200, "2") == [head(0, version=b"2")]
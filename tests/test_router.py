@@ -0,0 +1,115 @@
+import asyncio
+from typing import Any, cast, Set
+
+import pytest
+
+from aiko import App, Context
+from aiko.router import Router
+from .utils import AppTest, run_until_complete
+
+
+def test_match() -> None:
+    router = Router()
+
+    def handle(ctx: Any, next_call: Any) -> Any:
+        return None
+    router.get("/users", handle)
+    router.get("/users/new", handle)
+    router.get("/users/{id:int}", handle)
+    router.get("/users/{name}", handle)
+    router.get("/users/{id:int}/posts/{post}", handle)
+    router.get("/static/{file:path}", handle)
+    assert router.match("/users") == (router._static["/users"], {})
+    node, params = router.match("/users/new")
+    assert node is router._static["/users/new"] and params == {}
+    assert router.match("/users/12")[1] == {"id": 12}
+    assert router.match("/users/abc")[1] == {"name": "abc"}
+    assert router.match("/users/12/posts/hello")[1] == {"id": 12, "post": "hello"}
+    assert router.match("/users/abc/posts/hello")[0] is None
+    assert router.match("/static/css/a.css")[1] == {"file": "css/a.css"}
+    assert router.match("/user")[0] is None
+    assert router.match("/users/")[0] is None
+    # 参数类型严格匹配十进制数字
+    router.get("/price/{value:float}", handle)
+    assert router.match("/users/1_000")[1] == {"name": "1_000"}
+    assert router.match("/users/ 1")[1] == {"name": " 1"}
+    assert router.match("/users/-3")[1] == {"id": -3}
+    assert router.match("/price/1.5")[1] == {"value": 1.5}
+    assert router.match("/price/12")[1] == {"value": 12.0}
+    for value in ("nan", "inf", "1e3", "1.", " 1"):
+        assert router.match("/price/%s" % value)[0] is None
+
+
+def test_match_method() -> None:
+    router = Router()
+
+    def handle(ctx: Any, next_call: Any) -> Any:
+        return None
+    router.post("/users/me", handle)
+    router.get("/users/{name}", handle)
+    router.put("/users/{path:path}", handle)
+    node, params = router.match("/users/me", "POST")
+    assert node is router._static["/users/me"] and params == {}
+    # 静态路由不支持 GET 时使用参数路由
+    assert router.match("/users/me", "GET")[1] == {"name": "me"}
+    assert router.match("/users/me", "HEAD")[1] == {"name": "me"}
+    assert router.match("/users/me", "PUT")[1] == {"path": "me"}
+    allow = cast(Set[str], set())
+    assert router.match("/users/me", "DELETE", allow)[0] is None
+    assert allow == {"GET", "POST", "PUT"}
+
+
+def test_invalid() -> None:
+    router = Router()
+
+    def handle(ctx: Any, next_call: Any) -> Any:
+        return None
+    router.get("/users/{id:int}", handle)
+    with pytest.raises(ValueError):
+        router.get("/users/{id:int}", handle)
+    with pytest.raises(ValueError):
+        router.get("/users/{uid:int}/posts", handle)
+    with pytest.raises(ValueError):
+        router.get("/files/{id:uuid}", handle)
+    with pytest.raises(ValueError):
+        router.get("/files/{id}.json", handle)
+
+
+class TestRouter(AppTest):
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_dispatch(self) -> Any:
+        app = cast(App, self.app)
+        router = Router(prefix="/api")
+
+        @router.get("/users/{id:int}")
+        def user(ctx: Context, next_call: Any) -> Any:
+            return "user %d" % ctx.request.params["id"]
+
+        @router.post("/users")
+        async def create(ctx: Context, next_call: Any) -> Any:
+            return "created", 201
+
+        def not_found(ctx: Context, next_call: Any) -> Any:
+            return "not found", 404
+        app.use(router)
+        app.use(not_found)
+        yield from self.listen()
+        res = yield from self.send(
+            b"GET /api/users/7 HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n"
+            b"POST /api/users HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Length: 0\r\n\r\n"
+            b"HEAD /api/users/7 HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n"
+            b"GET /api/users HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n"
+            b"GET /api/other HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n",
+        )
+        responses = res.split(b"HTTP/1.1 ")[1:]
+        assert responses[0].startswith(b"200 OK\r\n")
+        assert responses[0].endswith(b"\r\n\r\nuser 7")
+        assert responses[1].startswith(b"201 Created\r\n")
+        assert responses[2].startswith(b"200 OK\r\n")
+        assert responses[2].endswith(b"\r\n\r\n")
+        assert responses[3].startswith(b"405 Method Not Allowed\r\n")
+        assert b"\r\nAllow: POST\r\n" in responses[3]
+        assert responses[4].startswith(b"404 Not Found\r\n")
+        yield from self.unlisten()
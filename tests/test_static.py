@@ -0,0 +1,100 @@
+import asyncio
+import os
+import shutil
+import tempfile
+from typing import Any, cast
+
+from aiko import App, Context
+from aiko.middleware.static import Static
+from .utils import AppTest, run_until_complete
+
+
+def test_resolve() -> None:
+    static = Static("/srv/public", prefix="/static")
+    assert static.resolve("/static/a/b.css") == "/srv/public/a/b.css"
+    assert static.resolve("/static/./a//b.css") == "/srv/public/a/b.css"
+    assert static.resolve("/static") == "/srv/public"
+    assert static.resolve("/static/../etc/passwd") is None
+    assert static.resolve("/static/.env") is None
+    assert static.resolve("/static/a\\..\\b") is None
+    assert static.resolve("/other/a.css") is None
+
+
+class TestStatic(AppTest):
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_static(self) -> Any:
+        app = cast(App, self.app)
+        root = tempfile.mkdtemp()
+        with open(os.path.join(root, "index.html"), "wb") as f:
+            f.write(b"<h1>index</h1>")
+        with open(os.path.join(root, "app.css"), "wb") as f:
+            f.write(b"var a = 1;")
+        static = Static(root, prefix="/static/", max_age=60)
+
+        def not_found(ctx: Context, next_call: Any) -> Any:
+            return "not found", 404
+        app.use(static)
+        app.use(not_found)
+        yield from self.listen()
+        try:
+            head, body = yield from self.request(b"/static/app.css")
+            assert head.startswith(b"HTTP/1.1 200 OK\r\n")
+            assert b"\r\nContent-Type: text/css; charset=utf-8\r\n" in head
+            assert b"\r\nCache-Control: public, max-age=60\r\n" in head
+            assert body == b"var a = 1;"
+            etag = head.split(b"\r\nETag: ")[1].split(b"\r\n")[0]
+            head, body = yield from self.request(
+                b"/static/app.css",
+                b"If-None-Match: %s\r\n" % etag,
+            )
+            assert head.startswith(b"HTTP/1.1 304 Not Modified\r\n")
+            assert body == b""
+            head, body = yield from self.request(b"/static/")
+            assert body == b"<h1>index</h1>"
+            head, body = yield from self.request(b"/static/../index.html")
+            assert head.startswith(b"HTTP/1.1 404 Not Found\r\n")
+            head, body = yield from self.request(b"/static/missing.js")
+            assert head.startswith(b"HTTP/1.1 404 Not Found\r\n")
+            # 文件变化后重新打开
+            static.ttl = 0
+            with open(os.path.join(root, "app.css"), "wb") as f:
+                f.write(b"var b = 22;")
+            head, body = yield from self.request(b"/static/app.css")
+            assert body == b"var b = 22;"
+            assert b"ETag: %s\r\n" % etag not in head
+        finally:
+            static.close()
+            shutil.rmtree(root)
+        yield from self.unlisten()
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_no_cache(self) -> Any:
+        if not os.path.isdir("/proc/self/fd"):
+            return
+        app = cast(App, self.app)
+        root = tempfile.mkdtemp()
+        with open(os.path.join(root, "app.css"), "wb") as f:
+            f.write(b"var a = 1;")
+        app.use(Static(root, cache_size=0))
+        yield from self.listen()
+        try:
+            head, body = yield from self.request(b"/app.css")
+            assert body == b"var a = 1;"
+            etag = head.split(b"\r\nETag: ")[1].split(b"\r\n")[0]
+            fds = len(os.listdir("/proc/self/fd"))
+            for _ in range(5):
+                head, body = yield from self.request(b"/app.css")
+                assert body == b"var a = 1;"
+                # 304 时也要关闭打开的文件
+                head, body = yield from self.request(
+                    b"/app.css",
+                    b"If-None-Match: %s\r\n" % etag,
+                )
+                assert head.startswith(b"HTTP/1.1 304 Not Modified\r\n")
+            assert len(os.listdir("/proc/self/fd")) <= fds
+        finally:
+            shutil.rmtree(root)
+        yield from self.unlisten()
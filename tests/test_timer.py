@@ -0,0 +1,44 @@
+import asyncio
+from typing import Any, cast, List
+
+from aiko.timer import TimerWheel
+from .utils import BaseTest, run_until_complete
+
+
+class TestTimerWheel(BaseTest):
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_call_later(self) -> Any:
+        wheel = TimerWheel(self.loop, 0.01)
+        fired = cast(List[int], [])
+        wheel.call_later(0.02, fired.append, 1)
+        wheel.call_later(0.05, fired.append, 2)
+        handle = wheel.call_later(0.02, fired.append, 3)
+        assert len(wheel) == 3
+        handle.cancel()
+        assert handle.cancelled
+        assert len(wheel) == 2
+        yield from asyncio.sleep(0.02, loop=self.loop)
+        assert fired == []
+        yield from asyncio.sleep(0.1, loop=self.loop)
+        assert fired == [1, 2]
+        assert len(wheel) == 0
+        wheel.close()
+
+    @run_until_complete
+    @asyncio.coroutine
+    def test_cancel_in_callback(self) -> Any:
+        wheel = TimerWheel(self.loop, 0.01)
+        fired = cast(List[int], [])
+        handles = cast(List[Any], [])
+
+        def cancel_other(num: int) -> None:
+            fired.append(num)
+            for handle in handles:
+                handle.cancel()
+        handles.append(wheel.call_later(0.01, cancel_other, 1))
+        handles.append(wheel.call_later(0.01, cancel_other, 2))
+        yield from asyncio.sleep(0.05, loop=self.loop)
+        assert len(fired) == 1
+        wheel.close()
@@ -73,6 +73,32 @@ class AppTest(BaseTest):
             yield from self.server.wait_closed()
             self.server = None
 
+    @asyncio.coroutine
+    def send(self, data: bytes) -> Any:
+        """
+        发送原始的请求数据，读取到服务端关闭连接
+        """
+        reader, writer = yield from asyncio.open_connection(
+            "127.0.0.1",
+            self.PORT,
+            loop=self.loop,
+        )
+        writer.write(data)
+        res = yield from reader.read()
+        writer.close()
+        return res
+
+    @asyncio.coroutine
+    def request(self, path: bytes, headers: bytes = b"") -> Any:
+        """
+        发送一个 GET 请求，返回 (head, body)
+        """
+        res = yield from self.send(
+            b"GET %s HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n%s\r\n" % (path, headers),
+        )
+        head, body = res.split(b"\r\n\r\n", 1)
+        return head + b"\r\n", body
+
     def tearDown(self) -> None:
         if self.server is not None:
             self.server.close()